@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import httpx
+from . import serialization
+from .broadcast import inventory_broadcaster
+from .utils import get_product_status
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOW_STOCK_THRESHOLD = int(os.getenv("DEFAULT_LOW_STOCK_THRESHOLD", "10"))
+ALERT_DEBOUNCE_MS = int(os.getenv("ALERT_DEBOUNCE_MS", "1000"))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "500"))
+ALERT_RECENT_SIZE = int(os.getenv("ALERT_RECENT_SIZE", "200"))
+# Comma separated: log, webhook, stream
+ALERT_SINKS = os.getenv("ALERT_SINKS", "log,stream")
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL", "http://localhost:8081/_mock/alerts")
+
+class LogSink:
+    name = "log"
+
+    async def deliver(self, alerts: List[Dict[str, Any]]) -> None:
+        for alert in alerts:
+            logger.info(
+                "Stock alert: %s/%s %s -> %s (inventory %s, threshold %s)",
+                alert["shop"], alert["shopify_id"], alert["previous_status"], alert["status"],
+                alert["inventory"], alert["threshold"]
+            )
+
+    async def aclose(self) -> None:
+        pass
+
+class WebhookSink:
+    """POSTs each batch as JSON, by default to the mock upstream's alert receiver.
+
+    One keep-alive client is reused for the sink's lifetime and closed with
+    the alert engine.
+    """
+    name = "webhook"
+
+    def __init__(
+        self,
+        url: str = ALERT_WEBHOOK_URL,
+        timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.url = url
+        self.timeout = timeout
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def deliver(self, alerts: List[Dict[str, Any]]) -> None:
+        if self._client is None:
+            # Created on first use so it binds to the running event loop
+            self._client = httpx.AsyncClient(timeout=self.timeout, transport=self._transport)
+        response = await self._client.post(
+            self.url,
+            content=serialization.dumps({"alerts": alerts}),
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class StreamSink:
+    """Pushes alerts to SSE subscribers alongside inventory changes"""
+    name = "stream"
+
+    async def deliver(self, alerts: List[Dict[str, Any]]) -> None:
+        inventory_broadcaster.publish_alerts(alerts)
+
+    async def aclose(self) -> None:
+        pass
+
+SINKS = {"log": LogSink, "webhook": WebhookSink, "stream": StreamSink}
+
+def configured_sinks(names: str = ALERT_SINKS) -> List[Any]:
+    sinks = []
+    for name in filter(None, (part.strip() for part in names.split(","))):
+        if name not in SINKS:
+            raise ValueError(f"Unknown alert sink: {name}")
+        sinks.append(SINKS[name]())
+    return sinks
+
+class AlertEngine:
+    """Turns committed inventory changes into stock status crossing alerts.
+
+    Each change costs one status comparison and a dict update. Alerts are
+    held per SKU for ``debounce_ms`` so a product that flaps back to its
+    original status within the window produces nothing, and the rest are
+    delivered to every sink in batches.
+    """
+
+    def __init__(
+        self,
+        sinks: Optional[List[Any]] = None,
+        debounce_ms: int = ALERT_DEBOUNCE_MS,
+        batch_size: int = ALERT_BATCH_SIZE,
+        default_threshold: int = DEFAULT_LOW_STOCK_THRESHOLD
+    ):
+        self.sinks = sinks if sinks is not None else configured_sinks()
+        self.debounce = debounce_ms / 1000
+        self.batch_size = batch_size
+        self.default_threshold = default_threshold
+        self.recent: deque = deque(maxlen=ALERT_RECENT_SIZE)
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._counters = {
+            "changes": 0,
+            "crossings": 0,
+            "debounced": 0,
+            "delivered": 0,
+            "batches": 0,
+            "failed_batches": 0,
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._stopping = asyncio.Event()
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Deliver whatever is pending and stop the flusher"""
+        self._closing = True
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        for sink in self.sinks:
+            await sink.aclose()
+        self._loop = None
+
+    def status(self, inventory: int, threshold: Optional[int] = None) -> str:
+        return get_product_status(inventory, self.default_threshold if threshold is None else threshold)
+
+    def is_crossing(self, change: Any) -> bool:
+        """True when a change moves a product to another stock status"""
+        if change.old_inventory is None or change.new_inventory is None:
+            return False
+        return self.status(change.old_inventory, change.threshold) != self.status(change.new_inventory, change.threshold)
+
+    def submit(self, changes: Iterable[Any]) -> None:
+        """Called after commit, possibly from a worker thread"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        changes = list(changes)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._observe(changes)
+        else:
+            self._loop.call_soon_threadsafe(self._observe, changes)
+
+    def _observe(self, changes: List[Any]) -> None:
+        timestamp = datetime.utcnow().isoformat()
+        for change in changes:
+            self._counters["changes"] += 1
+            # Creations and deletions are not crossings
+            if change.old_inventory is None or change.new_inventory is None:
+                continue
+            key = (change.shop, change.shopify_id)
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending["inventory"] = change.new_inventory
+                pending["status"] = self.status(change.new_inventory, change.threshold)
+                pending["timestamp"] = timestamp
+                continue
+            old_status = self.status(change.old_inventory, change.threshold)
+            new_status = self.status(change.new_inventory, change.threshold)
+            if old_status == new_status:
+                continue
+            self._counters["crossings"] += 1
+            self._pending[key] = {
+                "product_id": change.product_id,
+                "shop": change.shop,
+                "shopify_id": change.shopify_id,
+                "previous_status": old_status,
+                "status": new_status,
+                "previous_inventory": change.old_inventory,
+                "inventory": change.new_inventory,
+                "threshold": self.default_threshold if change.threshold is None else change.threshold,
+                "timestamp": timestamp,
+            }
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Let further changes to the same SKUs settle before deciding
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.debounce)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            pending, self._pending = self._pending, {}
+            alerts = [alert for alert in pending.values() if alert["status"] != alert["previous_status"]]
+            self._counters["debounced"] += len(pending) - len(alerts)
+            for start in range(0, len(alerts), self.batch_size):
+                await self._deliver(alerts[start:start + self.batch_size])
+            if self._closing:
+                return
+
+    async def _deliver(self, batch: List[Dict[str, Any]]) -> None:
+        self.recent.extend(batch)
+        self._counters["batches"] += 1
+        self._counters["delivered"] += len(batch)
+        for sink in self.sinks:
+            try:
+                await sink.deliver(batch)
+            except Exception as e:
+                self._counters["failed_batches"] += 1
+                logger.error(f"Alert sink {sink.name} failed for {len(batch)} alerts: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "sinks": [sink.name for sink in self.sinks],
+            "pending": len(self._pending),
+            "debounce_ms": int(self.debounce * 1000),
+            "default_threshold": self.default_threshold,
+            **self._counters,
+        }
+
+alert_engine = AlertEngine()
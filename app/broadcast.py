@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Iterable, Optional, Set
+
+INVENTORY_STREAM_BUFFER = int(os.getenv("INVENTORY_STREAM_BUFFER", "256"))
+INVENTORY_STREAM_HEARTBEAT = float(os.getenv("INVENTORY_STREAM_HEARTBEAT", "15"))
+
+DROPPED_FRAME = b"event: dropped\ndata: {\"reason\": \"slow consumer\"}\n\n"
+HEARTBEAT_FRAME = b": keepalive\n\n"
+
+class Subscriber:
+    """One connected client: a bounded frame buffer and an optional SKU filter"""
+
+    def __init__(self, buffer_size: int, skus: Optional[Set[str]] = None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.skus = skus
+        self.closed = False
+
+    def wants(self, shopify_id: Optional[str]) -> bool:
+        """None addresses every subscriber"""
+        return self.skus is None or shopify_id is None or shopify_id in self.skus
+
+class InventoryBroadcaster:
+    """Fans committed inventory changes out to SSE subscribers.
+
+    Each change is serialized once and the same bytes are queued for every
+    interested subscriber. A subscriber whose buffer fills up is dropped
+    rather than slowing down the publisher or the other clients.
+    """
+
+    def __init__(self, buffer_size: int = INVENTORY_STREAM_BUFFER):
+        self.buffer_size = buffer_size
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._counters = {"published": 0, "delivered": 0, "dropped_subscribers": 0}
+
+    def subscribe(self, skus: Optional[Iterable[str]] = None) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(self.buffer_size, set(skus) if skus else None)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.closed = True
+        self._subscribers.discard(subscriber)
+
+    def publish(self, changes: Iterable[Any], skipped: int = 0) -> None:
+        """Called after commit, possibly from a worker thread.
+
+        ``skipped`` counts changes the transaction committed but did not
+        hold for publication; subscribers get a ``resync`` event for them.
+        """
+        if not self._subscribers or self._loop is None or self._loop.is_closed():
+            return
+        changes = list(changes)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._fan_out(changes, skipped)
+        else:
+            self._loop.call_soon_threadsafe(self._fan_out, changes, skipped)
+
+    def publish_alerts(self, alerts: Iterable[dict]) -> None:
+        """Send stock alerts as ``alert`` events; called on the event loop"""
+        for alert in alerts:
+            self._send(alert["shopify_id"], f"event: alert\ndata: {json.dumps(alert)}\n\n".encode())
+
+    def _fan_out(self, changes: list, skipped: int = 0) -> None:
+        timestamp = datetime.utcnow().isoformat()
+        for change in changes:
+            self._send(change.shopify_id, self._encode(change, timestamp))
+        if skipped:
+            data = json.dumps({"skipped": skipped, "timestamp": timestamp})
+            self._send(None, f"event: resync\ndata: {data}\n\n".encode())
+
+    def _send(self, shopify_id: Optional[str], frame: bytes) -> None:
+        self._counters["published"] += 1
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(shopify_id):
+                continue
+            try:
+                subscriber.queue.put_nowait(frame)
+                self._counters["delivered"] += 1
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _encode(self, change: Any, timestamp: str) -> bytes:
+        old = change.old_inventory or 0
+        new = change.new_inventory or 0
+        data = json.dumps({
+            "product_id": change.product_id,
+            "shop": change.shop,
+            "shopify_id": change.shopify_id,
+            "previous_inventory": old,
+            "inventory": new,
+            "delta": new - old,
+            "timestamp": timestamp,
+        })
+        return f"event: inventory\ndata: {data}\n\n".encode()
+
+    def _drop(self, subscriber: Subscriber) -> None:
+        # Replace the backlog with a final notice so the client knows to reconnect
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(DROPPED_FRAME)
+        self.unsubscribe(subscriber)
+        self._counters["dropped_subscribers"] += 1
+
+    def close(self) -> None:
+        """Disconnect every subscriber, e.g. on shutdown"""
+        for subscriber in list(self._subscribers):
+            self.unsubscribe(subscriber)
+            try:
+                subscriber.queue.put_nowait(b"")
+            except asyncio.QueueFull:
+                pass
+
+    async def stream(self, subscriber: Subscriber, heartbeat: float = INVENTORY_STREAM_HEARTBEAT):
+        """Yield SSE frames for one subscriber until it is dropped or disconnects"""
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                if subscriber.closed and subscriber.queue.empty():
+                    return
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    frame = HEARTBEAT_FRAME
+                if frame:
+                    yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "buffer_size": self.buffer_size, **self._counters}
+
+inventory_broadcaster = InventoryBroadcaster()
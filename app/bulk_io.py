@@ -0,0 +1,380 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, IO, Iterable, Iterator, List, Optional, Sequence
+from sqlalchemy import (
+    Column, Float, Index, Integer, MetaData, String, Table, and_, func, literal, or_, select, text, update, delete
+)
+from sqlalchemy.orm import Session
+from . import crud, models, serialization
+from .database import AsyncReadSessionLocal, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+IMPORT_QUEUE_CHUNKS = int(os.getenv("IMPORT_QUEUE_CHUNKS", "16"))
+MAX_IMPORT_ERRORS = 20
+
+EXPORT_COLUMNS = (
+    models.Product.id,
+    models.Product.shop,
+    models.Product.shopify_id,
+    models.Product.title,
+    models.Product.inventory,
+    models.Product.previous_inventory,
+    models.Product.inventory_change,
+    models.Product.price,
+    models.Product.last_synced,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _jsonable(value: Any) -> Any:
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+def encode_ndjson(rows: Sequence[Sequence[Any]]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, map(_jsonable, row)))) + "\n"
+        for row in rows
+    ).encode()
+
+def encode_csv(rows: Sequence[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [_jsonable(value) for value in row] for row in rows
+    )
+    return buffer.getvalue().encode()
+
+async def stream_products(fmt: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Stream the whole catalog from a server-side cursor in fixed-size chunks.
+
+    Opens its own session because the response body is produced after the
+    request's dependencies have been torn down.
+    """
+    encode = encode_csv if fmt == "csv" else encode_ndjson
+    if fmt == "csv":
+        yield encode([EXPORT_FIELDS])
+
+    async with AsyncReadSessionLocal() as db:
+        result = await db.stream(
+            select(*EXPORT_COLUMNS)
+            .order_by(models.Product.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions(chunk_size):
+            yield encode(rows)
+
+
+# Import: rows are loaded into a temporary staging table (COPY on Postgres,
+# batched executemany elsewhere) and merged into products in one statement,
+# so memory stays bounded by one chunk however large the file is.
+
+# A record's optional "shop" field overrides the shop the import targets
+IMPORT_FIELDS = ("shop", "shopify_id", "title", "inventory", "price")
+
+_staging_metadata = MetaData()
+staging_table = Table(
+    "products_staging",
+    _staging_metadata,
+    Column("seq", Integer, nullable=False),
+    Column("shop", String, nullable=False),
+    Column("shopify_id", String, nullable=False),
+    Column("title", String, nullable=False),
+    Column("inventory", Integer, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("fingerprint", String(16), nullable=False),
+    Column("old_inventory", Integer),
+    Column("old_fingerprint", String(16)),
+    prefixes=["TEMPORARY"],
+)
+Index("ix_products_staging_key", staging_table.c.shop, staging_table.c.shopify_id, staging_table.c.seq)
+STAGING_COLUMNS = ("seq", *IMPORT_FIELDS, "fingerprint")
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Re-split arbitrary byte chunks into text lines, keeping line endings"""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8") + "\n"
+    if pending:
+        yield pending.decode("utf-8")
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[Any]:
+    """CSV rows as dicts; NDJSON lines are left encoded so a bad one is rejected on its own"""
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        if line.strip():
+            yield line
+
+def _parse_record(record: Any, shop: str = models.DEFAULT_SHOP) -> Dict[str, Any]:
+    if isinstance(record, str):
+        record = serialization.loads(record)
+    row = {
+        "shop": str(record.get("shop") or shop),
+        "shopify_id": str(record["shopify_id"]),
+        "title": str(record["title"]),
+        "inventory": int(record["inventory"]),
+        "price": float(record["price"]),
+    }
+    if not row["shopify_id"]:
+        raise ValueError("shopify_id is empty")
+    row["fingerprint"] = crud.product_fingerprint(row["title"], row["price"], row["inventory"])
+    return row
+
+def _copy_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([row[column] for column in STAGING_COLUMNS] for row in rows)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {staging_table.name} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def _insert_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    db.execute(staging_table.insert(), [{column: row[column] for column in STAGING_COLUMNS} for row in rows])
+
+def _merge_staged(db: Session) -> Dict[str, int]:
+    """Dedupe the staging table, then fold it into products, history and the summary"""
+    staged = staging_table.c
+    product = models.Product.__table__
+    later = staging_table.alias("later")
+
+    same_product = and_(product.c.shop == staged.shop, product.c.shopify_id == staged.shopify_id)
+
+    # The last occurrence of a SKU in the file wins
+    db.execute(delete(staging_table).where(
+        staged.seq < select(func.max(later.c.seq)).where(
+            later.c.shop == staged.shop, later.c.shopify_id == staged.shopify_id
+        ).scalar_subquery()
+    ))
+    db.execute(update(staging_table).values(
+        old_inventory=select(product.c.inventory).where(same_product).scalar_subquery(),
+        old_fingerprint=select(product.c.fingerprint).where(same_product).scalar_subquery(),
+    ))
+
+    is_new = staged.old_inventory.is_(None)
+    is_changed = or_(is_new, staged.old_fingerprint.is_(None), staged.old_fingerprint != staged.fingerprint)
+    counts = db.execute(select(
+        func.count().label("staged"),
+        func.count().filter(is_new).label("created"),
+        func.count().filter(is_changed).label("changed"),
+    )).one()
+
+    now = datetime.utcnow()
+    source = select(
+        staged.shop,
+        staged.shopify_id,
+        staged.title,
+        staged.inventory,
+        staged.price,
+        staged.inventory.label("previous_inventory"),
+        literal(0).label("inventory_change"),
+        staged.fingerprint,
+        literal(now, models.Product.last_synced.type).label("last_synced"),
+    ).where(is_changed)
+    stmt = crud._insert_for(db)(product).from_select(
+        ["shop", "shopify_id", "title", "inventory", "price", "previous_inventory",
+         "inventory_change", "fingerprint", "last_synced"],
+        source
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[product.c.shop, product.c.shopify_id],
+        set_={
+            "title": stmt.excluded.title,
+            "price": stmt.excluded.price,
+            "inventory": stmt.excluded.inventory,
+            "previous_inventory": product.c.inventory,
+            "inventory_change": stmt.excluded.inventory - product.c.inventory,
+            "fingerprint": stmt.excluded.fingerprint,
+            "last_synced": stmt.excluded.last_synced,
+        }
+    )
+    db.execute(stmt)
+
+    # Same history semantics as crud.append_inventory_events, computed in SQL
+    moved = func.coalesce(staged.old_inventory, 0) != staged.inventory
+    db.execute(models.InventoryEvent.__table__.insert().from_select(
+        ["product_id", "recorded_at", "delta", "inventory"],
+        select(
+            product.c.id,
+            literal(now, models.InventoryEvent.recorded_at.type),
+            staged.inventory - func.coalesce(staged.old_inventory, 0),
+            staged.inventory,
+        ).select_from(staging_table.join(product, same_product)).where(moved)
+    ))
+    crud.rebuild_inventory_summary(db)
+    crud.mark_products_dirty(db)
+
+    return {
+        "created": counts.created,
+        "updated": counts.changed - counts.created,
+        "unchanged": counts.staged - counts.changed,
+    }
+
+def import_products(
+    db: Session,
+    lines: Iterable[str],
+    fmt: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    shop: str = models.DEFAULT_SHOP
+) -> Dict[str, Any]:
+    """Stream CSV or NDJSON product records into the catalog; the caller commits.
+
+    Records without a ``shop`` field go to ``shop``.
+
+    Invalid records are skipped and counted. Imported changes go to the
+    history table and summary row, but are not pushed to live subscribers.
+    """
+    started = time.perf_counter()
+    connection = db.connection()
+    postgres = connection.dialect.name == "postgresql"
+    staging_table.drop(connection, checkfirst=True)
+    staging_table.create(connection)
+    load = _copy_rows if postgres else _insert_rows
+
+    stats: Dict[str, Any] = {"read": 0, "staged": 0, "rejected": 0, "errors": []}
+    chunk: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        load(db, chunk)
+        stats["staged"] += len(chunk)
+        chunk.clear()
+        if progress is not None:
+            progress({"read": stats["read"], "staged": stats["staged"], "rejected": stats["rejected"],
+                      "elapsed_s": round(time.perf_counter() - started, 3)})
+
+    for record in iter_records(lines, fmt):
+        stats["read"] += 1
+        try:
+            row = _parse_record(record, shop)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            stats["rejected"] += 1
+            if len(stats["errors"]) < MAX_IMPORT_ERRORS:
+                stats["errors"].append({"record": stats["read"], "error": f"{type(e).__name__}: {e}"})
+            continue
+        row["seq"] = stats["read"]
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    if postgres:
+        db.execute(text(f"ANALYZE {staging_table.name}"))
+    counts = _merge_staged(db)
+    # On failure the caller's rollback discards the table on Postgres; SQLite
+    # keeps it on the connection and the next import drops it first
+    staging_table.drop(connection)
+
+    return {
+        "status": "success",
+        **counts,
+        **stats,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+class ImportAborted(Exception):
+    pass
+
+def _drain(pending: queue.Queue) -> Iterator[bytes]:
+    while True:
+        chunk = pending.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, BaseException):
+            raise ImportAborted("upload did not complete") from chunk
+        yield chunk
+
+def _log_progress(stats: Dict[str, Any]) -> None:
+    logger.info(f"Import progress: {stats}")
+
+async def import_stream(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    shop: str = models.DEFAULT_SHOP
+) -> Dict[str, Any]:
+    """Import an uploaded body while it arrives.
+
+    The request is read on the event loop and handed to a worker thread through
+    a bounded queue, so a slow database pushes back on the upload instead of
+    buffering it. The import commits only if the whole body was received.
+    """
+    pending: queue.Queue = queue.Queue(maxsize=IMPORT_QUEUE_CHUNKS)
+
+    def run() -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            lines = iter_lines(_drain(pending))
+            result = import_products(db, lines, fmt, chunk_size=chunk_size, progress=_log_progress, shop=shop)
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def put(item: Any) -> None:
+        while not worker.done():
+            try:
+                pending.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.01)
+
+    worker = asyncio.ensure_future(asyncio.to_thread(run))
+    try:
+        async for chunk in chunks:
+            if worker.done():
+                break
+            await put(chunk)
+    except BaseException as e:
+        await put(e)
+        raise
+    await put(None)
+    return await worker
+
+def export_products(db: Session, out: IO[bytes], fmt: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Write the catalog to a binary file; CSV on Postgres goes through COPY TO"""
+    connection = db.connection()
+    if fmt == "csv" and connection.dialect.name == "postgresql":
+        cursor = connection.connection.cursor()
+        try:
+            query = select(*EXPORT_COLUMNS).order_by(models.Product.id).compile(dialect=connection.dialect)
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    encode = encode_csv if fmt == "csv" else encode_ndjson
+    if fmt == "csv":
+        out.write(encode([EXPORT_FIELDS]))
+    written = 0
+    result = db.execute(
+        select(*EXPORT_COLUMNS).order_by(models.Product.id).execution_options(yield_per=chunk_size)
+    )
+    for rows in result.partitions(chunk_size):
+        out.write(encode(rows))
+        written += len(rows)
+    return written
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "30"))
+
+def content_etag(body: bytes) -> str:
+    """Weak ETag derived from the response body, so every process issues the same tag for the same data"""
+    return f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+class ReadThroughCache:
+    """Bounded LRU cache with TTL expiry and a global data version.
+
+    Every committed product write in this process bumps ``version`` and
+    clears the entries. Entries are per process, so a write made by another
+    worker is only seen here once the affected entries expire: cached
+    values may be up to ``ttl_seconds`` behind the database. The entries
+    belong to the event loop that reads them; invalidations from other
+    threads are handed to it.
+    """
+
+    def __init__(self, max_entries: int = PRODUCT_CACHE_SIZE, ttl_seconds: float = PRODUCT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def invalidate(self) -> None:
+        """Drop every entry; called after commit, possibly from a worker thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not self._loop:
+                self._loop.call_soon_threadsafe(self._invalidate)
+                return
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        self.version += 1
+        self._entries.clear()
+        self._counters["invalidations"] += 1
+
+    def _lookup(self, key: str) -> Optional[Tuple[int, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, version, value = entry
+        if expires_at < time.monotonic() or version != self.version:
+            del self._entries[key]
+            self._counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return version, value
+
+    def _store(self, key: str, version: int, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Tuple[int, Any]:
+        """Return (version, value), loading at most once per key concurrently.
+
+        ``None`` results are returned but not cached.
+        """
+        self._loop = asyncio.get_running_loop()
+        cached = self._lookup(key)
+        if cached is not None:
+            self._counters["hits"] += 1
+            return cached
+
+        self._counters["misses"] += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        version = self.version
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failed load with no waiters doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        # Don't cache results that raced with a write
+        if value is not None and version == self.version:
+            self._store(key, version, value)
+        future.set_result((version, value))
+        return version, value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "version": self.version,
+            **self._counters,
+        }
+
+product_cache = ReadThroughCache()
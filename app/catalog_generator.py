@@ -0,0 +1,260 @@
+"""Seeded synthetic catalogs and inventory activity for load testing.
+
+Products are generated in fixed-size blocks, each from its own seed, so any
+slice of a multi-million SKU catalog can be produced on demand without
+materializing the rest. Popularity follows a Zipf distribution over a fixed
+permutation of the catalog; inventory activity is mostly small sales on
+popular items, with restocks and flash-sale bursts.
+"""
+import math
+import random
+from bisect import bisect_left
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+CATALOG_EPOCH = datetime(2024, 1, 1)
+SHOPIFY_ID_BASE = 7_000_000_000
+BLOCK_SIZE = 1024
+CACHED_BLOCKS = 64
+
+RESTOCK_PROBABILITY = 0.03
+BURST_PROBABILITY = 0.002
+
+ADJECTIVES = (
+    "Classic", "Vintage", "Essential", "Premium", "Everyday", "Organic", "Slim",
+    "Relaxed", "Heritage", "Urban", "Coastal", "Alpine", "Studio", "Weekend",
+)
+MATERIALS = (
+    "Cotton", "Linen", "Wool", "Leather", "Canvas", "Denim", "Bamboo", "Merino",
+    "Ceramic", "Steel", "Oak", "Suede",
+)
+# (noun, typical price)
+PRODUCT_TYPES = (
+    ("T-Shirt", 25), ("Hoodie", 60), ("Jeans", 80), ("Jacket", 140), ("Sneakers", 95),
+    ("Boots", 160), ("Backpack", 75), ("Wallet", 45), ("Cap", 22), ("Scarf", 35),
+    ("Watch", 220), ("Sunglasses", 120), ("Mug", 18), ("Candle", 24), ("Blanket", 70),
+    ("Lamp", 90), ("Water Bottle", 28), ("Notebook", 12), ("Speaker", 85), ("Headphones", 150),
+)
+
+class ProductSpec(NamedTuple):
+    title: str
+    price: float
+    inventory: int
+
+class EventSpec(NamedTuple):
+    """One simulated inventory movement of the product at ``index``"""
+    index: int
+    recorded_at: datetime
+    delta: int
+    inventory: int
+
+def _coprime_stride(size: int) -> int:
+    stride = int(size * 0.6180339887) | 1
+    while math.gcd(stride, size) != 1:
+        stride += 2
+    return stride
+
+class SyntheticCatalog(Sequence):
+    """A lazily generated catalog that reads like a list of Admin API products.
+
+    ``generation`` models the upstream moving on between syncs: in each
+    generation a ``churn`` share of products differs from the base catalog.
+    Items are ordered by ``created_at``, one second apart.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        seed: int = 0,
+        generation: int = 0,
+        churn: float = 0.05,
+        popularity_skew: float = 1.1
+    ):
+        self.size = size
+        self.seed = seed
+        self.generation = generation
+        self.churn = churn
+        self.popularity_skew = popularity_skew
+        # Popularity rank r belongs to product (r * stride) % size, which
+        # scatters the popular items across the catalog
+        self._stride = _coprime_stride(max(size, 1))
+        self._rank_of = pow(self._stride, -1, size) if size > 1 else 0
+        self._blocks: "OrderedDict[int, List[ProductSpec]]" = OrderedDict()
+
+    def advance(self, generations: int = 1) -> "SyntheticCatalog":
+        return SyntheticCatalog(
+            self.size,
+            seed=self.seed,
+            generation=self.generation + generations,
+            churn=self.churn,
+            popularity_skew=self.popularity_skew
+        )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.shopify_product(i) for i in range(*index.indices(self.size))]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("catalog index out of range")
+        return self.shopify_product(index)
+
+    def popularity(self, index: int) -> float:
+        """0 for the best seller, approaching 1 for the long tail"""
+        return ((index * self._rank_of) % self.size) / self.size if self.size > 1 else 0.0
+
+    def sample_index(self, rng: random.Random) -> int:
+        """Draw a product with Zipf-distributed popularity in O(1)"""
+        u = rng.random()
+        if abs(self.popularity_skew - 1.0) < 1e-9:
+            rank = int(self.size ** u) - 1
+        else:
+            a = 1.0 - self.popularity_skew
+            rank = int(((self.size ** a - 1.0) * u + 1.0) ** (1.0 / a)) - 1
+        return (min(max(rank, 0), self.size - 1) * self._stride) % self.size
+
+    def _generate_block(self, block: int) -> List[ProductSpec]:
+        rng = random.Random(f"{self.seed}:{block}")
+        start = block * BLOCK_SIZE
+        specs = []
+        for index in range(start, min(start + BLOCK_SIZE, self.size)):
+            noun, typical_price = PRODUCT_TYPES[int(len(PRODUCT_TYPES) * rng.random())]
+            title = f"{rng.choice(ADJECTIVES)} {rng.choice(MATERIALS)} {noun}"
+            price = max(0.99, round(typical_price * rng.lognormvariate(0, 0.35)) - 0.01)
+
+            u = rng.random()
+            if u < 0.04:
+                inventory = 0
+            elif u < 0.12:
+                inventory = rng.randint(1, 10)
+            else:
+                # Best sellers are stocked deeper than the long tail
+                scale = 20 + 400 * (1 - self.popularity(index)) ** 6
+                inventory = 1 + int(rng.expovariate(1 / scale))
+            specs.append(ProductSpec(title, price, inventory))
+
+        if self.generation:
+            churn_rng = random.Random(f"{self.seed}:{block}:{self.generation}")
+            for offset, spec in enumerate(specs):
+                if churn_rng.random() >= self.churn:
+                    continue
+                if spec.inventory and churn_rng.random() < 0.8:
+                    inventory = max(0, spec.inventory - churn_rng.randint(1, 10))
+                else:
+                    inventory = spec.inventory + churn_rng.randint(10, 100)
+                specs[offset] = spec._replace(inventory=inventory)
+        return specs
+
+    def spec(self, index: int) -> ProductSpec:
+        block = index // BLOCK_SIZE
+        specs = self._blocks.get(block)
+        if specs is None:
+            specs = self._blocks[block] = self._generate_block(block)
+            if len(self._blocks) > CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block)
+        return specs[index % BLOCK_SIZE]
+
+    def shopify_id(self, index: int) -> str:
+        # Fixed width, so string order matches catalog order
+        return str(SHOPIFY_ID_BASE + index)
+
+    def shopify_product(self, index: int) -> Dict[str, Any]:
+        """Admin API representation, as served by the mock upstream"""
+        spec = self.spec(index)
+        return {
+            "id": SHOPIFY_ID_BASE + index,
+            "title": spec.title,
+            "created_at": (CATALOG_EPOCH + timedelta(seconds=index)).isoformat(),
+            "variants": [{"price": f"{spec.price:.2f}", "inventory_quantity": spec.inventory}],
+        }
+
+    def iter_products(self, batch_size: int = BLOCK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Batches in the normalized shape ``fetch_products`` returns"""
+        for start in range(0, self.size, batch_size):
+            yield [
+                {"id": self.shopify_id(i), "title": spec.title, "inventory_quantity": spec.inventory, "price": spec.price}
+                for i, spec in ((i, self.spec(i)) for i in range(start, min(start + batch_size, self.size)))
+            ]
+
+    def iter_rows(self, batch_size: int = BLOCK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Batches of ``products`` column values (shopify_id, title, inventory, price)"""
+        for start in range(0, self.size, batch_size):
+            yield [
+                {"shopify_id": self.shopify_id(i), "title": spec.title, "inventory": spec.inventory, "price": spec.price}
+                for i, spec in ((i, self.spec(i)) for i in range(start, min(start + batch_size, self.size)))
+            ]
+
+    def inventory_levels(self) -> array:
+        """Current inventory of every product, compactly"""
+        return array("q", (self.spec(i).inventory for i in range(self.size)))
+
+    def iter_events(
+        self,
+        count: int,
+        levels: array,
+        start: datetime,
+        end: datetime,
+        batch_size: int = 5000,
+        burst_probability: float = BURST_PROBABILITY
+    ) -> Iterator[List[EventSpec]]:
+        """Simulate ``count`` movements between start and end, updating ``levels`` in place.
+
+        Deterministic for a given seed and starting levels, so the same
+        history can be replayed in a second pass.
+        """
+        if not self.size or count <= 0:
+            return
+        rng = random.Random(f"{self.seed}:events:{self.generation}")
+        window = max((end - start).total_seconds(), 1e-6)
+        mean_gap = window / count
+        elapsed = 0.0
+        burst_left = 0
+        burst_index = 0
+        emitted = 0
+        batch: List[EventSpec] = []
+        while emitted < count:
+            if burst_left:
+                # Flash sale: many quick sales of one product
+                index = burst_index
+                burst_left -= 1
+                elapsed += rng.expovariate(50 / mean_gap)
+            else:
+                index = self.sample_index(rng)
+                elapsed += rng.expovariate(1 / mean_gap)
+                if rng.random() < burst_probability:
+                    burst_index = index
+                    burst_left = rng.randint(10, 100)
+
+            level = levels[index]
+            if level == 0 or rng.random() < RESTOCK_PROBABILITY:
+                if level == 0 and rng.random() < 0.5:
+                    continue
+                delta = rng.randint(10, 200)
+            else:
+                delta = -min(level, 1 if rng.random() < 0.8 else rng.randint(2, 5))
+            levels[index] = level + delta
+
+            batch.append(EventSpec(index, start + timedelta(seconds=min(elapsed, window)), delta, level + delta))
+            emitted += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def created_at_bounds(catalog: Sequence, created_at_min: Optional[str], created_at_max: Optional[str]) -> Tuple[int, int]:
+    """Index range of a created_at-ordered catalog inside [min, max)"""
+    def key(product: Dict[str, Any]) -> str:
+        return product["created_at"]
+
+    low = bisect_left(catalog, created_at_min, key=key) if created_at_min else 0
+    high = bisect_left(catalog, created_at_max, key=key) if created_at_max else len(catalog)
+    return low, max(low, high)
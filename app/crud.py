@@ -1,13 +1,55 @@
+from sqlalchemy import Row, Select, delete, event, func, insert, literal_column, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import models, schemas
-from typing import List, Optional
+from . import alerts, models, schemas
+from .broadcast import inventory_broadcaster
+from .cache import product_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
 from datetime import datetime
+import hashlib
+import os
+import time
+
+SUMMARY_ROW_ID = 1
+SUMMARY_FIELDS = ("total_inventory", "product_count", "low_stock_count", "out_of_stock_count")
+LOW_STOCK_THRESHOLD = 10
+# Keys per id lookup; two bound parameters each, well under every driver's limit
+RESOLVE_CHUNK_SIZE = 400
+# Most changes a transaction holds for live subscribers until it commits; past
+# this only alert crossings are kept and subscribers are told to resync
+INVENTORY_PUBLISH_LIMIT = int(os.getenv("INVENTORY_PUBLISH_LIMIT", "10000"))
+
+HISTORY_BUCKETS = ("minute", "hour", "day")
+SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%dT%H:%M:00",
+    "hour": "%Y-%m-%dT%H:00:00",
+    "day": "%Y-%m-%dT00:00:00",
+}
+
+class InventoryChange(NamedTuple):
+    """Inventory level of one product before and after a write (None = absent)"""
+    shopify_id: str
+    old_inventory: Optional[int]
+    new_inventory: Optional[int]
+    # Writes report it from RETURNING; any still missing are looked up when recorded
+    product_id: Optional[int] = None
+    # Per-product low stock threshold, when one is set
+    threshold: Optional[int] = None
+    shop: str = models.DEFAULT_SHOP
+
+def product_fingerprint(title: str, price: float, inventory: int) -> str:
+    """Compact hash of the fields a sync can change"""
+    payload = f"{title}\x1f{float(price)!r}\x1f{int(inventory)}".encode()
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
 
 def get_product(db: Session, product_id: int) -> Optional[models.Product]:
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
-def get_product_by_shopify_id(db: Session, shopify_id: str) -> Optional[models.Product]:
-    return db.query(models.Product).filter(models.Product.shopify_id == shopify_id).first()
+def get_product_by_shopify_id(db: Session, shopify_id: str, shop: str = models.DEFAULT_SHOP) -> Optional[models.Product]:
+    return db.query(models.Product).filter(
+        models.Product.shop == shop, models.Product.shopify_id == shopify_id
+    ).first()
 
 def get_products(
     db: Session, 
@@ -16,13 +58,44 @@ def get_products(
 ) -> List[models.Product]:
     return db.query(models.Product).offset(skip).limit(limit).all()
 
+def get_products_after(
+    db: Session,
+    after_id: Optional[int] = None,
+    limit: int = 100
+) -> List[models.Product]:
+    """Keyset page ordered by id; constant cost regardless of page depth"""
+    query = db.query(models.Product)
+    if after_id is not None:
+        query = query.filter(models.Product.id > after_id)
+    return query.order_by(models.Product.id).limit(limit).all()
+
+def get_product_rows(
+    db: Session,
+    columns: Sequence[Any],
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None
+) -> List[Row]:
+    """Selected columns only, ordered by id; keyset-paged when ``after_id`` is given"""
+    query = select(*columns).order_by(models.Product.id)
+    if after_id is not None:
+        query = query.where(models.Product.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    return list(db.execute(query.limit(limit)))
+
 def create_product(db: Session, product: schemas.ProductCreate, initial_inventory: int = 0) -> models.Product:
     db_product = models.Product(
         **product.model_dump(),
         previous_inventory=initial_inventory,
-        inventory_change=0
+        inventory_change=0,
+        fingerprint=product_fingerprint(product.title, product.price, product.inventory)
     )
     db.add(db_product)
+    db.flush()
+    record_inventory_changes(db, [
+        InventoryChange(product.shopify_id, None, product.inventory, db_product.id, shop=product.shop)
+    ])
     db.commit()
     db.refresh(db_product)
     return db_product
@@ -32,27 +105,742 @@ def update_product(
     product_id: int, 
     product_data: dict
 ) -> Optional[models.Product]:
-    db_product = get_product(db, product_id)
+    # Locked so the old level used for the summary delta can't change before commit
+    db_product = db.query(models.Product).filter(models.Product.id == product_id).with_for_update().first()
     if db_product:
+        old_inventory = db_product.inventory
         for key, value in product_data.items():
             setattr(db_product, key, value)
+        db_product.fingerprint = product_fingerprint(
+            db_product.title, db_product.price, db_product.inventory
+        )
         db_product.last_synced = datetime.utcnow()
+        record_inventory_changes(db, [
+            InventoryChange(
+                db_product.shopify_id, old_inventory, db_product.inventory, db_product.id,
+                db_product.low_stock_threshold, db_product.shop
+            )
+        ])
         db.commit()
         db.refresh(db_product)
     return db_product
 
 def delete_product(db: Session, product_id: int) -> bool:
-    db_product = get_product(db, product_id)
-    if db_product:
-        db.delete(db_product)
-        db.commit()
-        return True
-    return False
+    product = models.Product
+    deleted = db.execute(
+        delete(product).where(product.id == product_id)
+        .returning(product.shopify_id, product.inventory, product.low_stock_threshold, product.shop)
+    ).first()
+    if deleted is None:
+        return False
+    record_inventory_changes(db, [
+        InventoryChange(deleted.shopify_id, deleted.inventory, None, product_id, deleted.low_stock_threshold, deleted.shop)
+    ])
+    db.commit()
+    return True
+
+def delete_products(db: Session, shopify_ids: List[str], shop: str = models.DEFAULT_SHOP) -> int:
+    """Delete one shop's products by shopify_id in one statement; the caller commits"""
+    if not shopify_ids:
+        return 0
+    product = models.Product
+    # Levels come from the deleted rows themselves, not from an earlier read
+    rows = db.execute(
+        delete(product).where(product.shop == shop, product.shopify_id.in_(shopify_ids))
+        .returning(product.id, product.shopify_id, product.inventory, product.low_stock_threshold)
+    ).all()
+    if not rows:
+        return 0
+    record_inventory_changes(db, [
+        InventoryChange(row.shopify_id, row.inventory, None, row.id, row.low_stock_threshold, shop)
+        for row in rows
+    ])
+    return len(rows)
+
+def low_inventory_query(
+    threshold: int = 10,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+    shop: Optional[str] = None
+) -> Select:
+    """Low-stock products, most critical first, keyset-paged on (inventory, id)"""
+    query = (
+        select(models.Product)
+        .where(models.Product.inventory <= threshold)
+        # Constant bound lets the planner match the partial index with bound parameters
+        .where(models.Product.inventory <= literal_column(str(models.MAX_INVENTORY_THRESHOLD)))
+        .order_by(models.Product.inventory, models.Product.id)
+    )
+    if shop is not None:
+        query = query.where(models.Product.shop == shop)
+    if after is not None:
+        query = query.where(tuple_(models.Product.inventory, models.Product.id) > tuple_(*after))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
 def get_low_inventory_products(
     db: Session, 
-    threshold: int = 10
+    threshold: int = 10,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None
 ) -> List[models.Product]:
-    return db.query(models.Product).filter(
-        models.Product.inventory <= threshold
-    ).all() 
\ No newline at end of file
+    return list(db.scalars(low_inventory_query(threshold, limit=limit, after=after)))
+
+def get_low_inventory_rows(
+    db: Session,
+    columns: Sequence[Any],
+    threshold: int = 10,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+    shop: Optional[str] = None
+) -> List[Row]:
+    query = low_inventory_query(threshold, limit=limit, after=after, shop=shop).with_only_columns(*columns)
+    return list(db.execute(query))
+
+def stale_products_query(cutoff: datetime) -> Select:
+    return select(func.count()).select_from(models.Product).where(models.Product.last_synced < cutoff)
+
+def count_stale_products(db: Session, cutoff: datetime) -> int:
+    return db.scalar(stale_products_query(cutoff))
+
+def explain(db: Session, query: Select) -> List[str]:
+    """Return the database's plan for a query, one line per row"""
+    dialect = db.get_bind().dialect
+    compiled = query.compile(dialect=dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    prefix = "EXPLAIN QUERY PLAN " if dialect.name == "sqlite" else "EXPLAIN "
+    rows = db.connection().exec_driver_sql(prefix + str(compiled), params).all()
+    return [str(row[-1]) for row in rows]
+
+def count_products(db: Session) -> int:
+    return db.scalar(select(func.count()).select_from(models.Product))
+
+def count_low_inventory_products(db: Session, threshold: int = 10) -> int:
+    return db.scalar(
+        select(func.count())
+        .select_from(models.Product)
+        .where(models.Product.inventory <= threshold)
+    )
+
+# Insert constructs that support ON CONFLICT, by dialect name
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def supports_bulk_upsert(dialect: str) -> bool:
+    return dialect in UPSERT_INSERTS
+
+def _insert_for(db: Session):
+    """Return the dialect-specific insert construct that supports ON CONFLICT"""
+    dialect = db.get_bind().dialect.name
+    if not supports_bulk_upsert(dialect):
+        raise NotImplementedError(f"Bulk upsert is not supported on {dialect}")
+    return UPSERT_INSERTS[dialect]
+
+def touch_products(db: Session, shopify_ids: List[str], shop: str = models.DEFAULT_SHOP) -> None:
+    """Bump last_synced for unchanged products in one statement"""
+    if shopify_ids:
+        mark_products_dirty(db)
+        db.execute(
+            update(models.Product)
+            .where(models.Product.shop == shop, models.Product.shopify_id.in_(shopify_ids))
+            .values(last_synced=datetime.utcnow())
+        )
+
+def bulk_upsert_products(
+    db: Session,
+    rows: List[Dict[str, Any]],
+    delta: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+    shop: str = models.DEFAULT_SHOP
+) -> Dict[str, int]:
+    """Upsert a chunk of one shop's products in one statement; the caller owns the transaction.
+
+    ``previous_inventory`` and ``inventory_change`` are computed in SQL from the
+    row being replaced, so no per-product read is needed. In delta mode rows
+    whose fingerprint matches the stored one are not rewritten; only their
+    ``last_synced`` is bumped. Seconds spent diffing and writing are added
+    to ``timings`` when given.
+    """
+    if not rows:
+        return {"created": 0, "updated": 0, "unchanged": 0}
+
+    started = time.perf_counter()
+    shopify_ids = [row["shopify_id"] for row in rows]
+    existing = {
+        row.shopify_id: row
+        for row in db.execute(
+            select(models.Product.shopify_id, models.Product.fingerprint)
+            .where(models.Product.shop == shop, models.Product.shopify_id.in_(shopify_ids))
+        )
+    }
+
+    changed = []
+    unchanged = []
+    for row in rows:
+        fingerprint = product_fingerprint(row["title"], row["price"], row["inventory"])
+        current = existing.get(row["shopify_id"])
+        if delta and current is not None and current.fingerprint == fingerprint:
+            unchanged.append(row["shopify_id"])
+            continue
+        changed.append({**row, "fingerprint": fingerprint})
+
+    diffed = time.perf_counter()
+    touch_products(db, unchanged, shop=shop)
+    created = 0
+    if changed:
+        now = datetime.utcnow()
+        table = models.Product.__table__
+        stmt = _insert_for(db)(table).values([
+            {
+                **row,
+                "shop": shop,
+                "previous_inventory": row["inventory"],
+                "inventory_change": 0,
+                "last_synced": now,
+            }
+            for row in changed
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.shop, table.c.shopify_id],
+            set_={
+                "title": stmt.excluded.title,
+                "price": stmt.excluded.price,
+                "inventory": stmt.excluded.inventory,
+                "previous_inventory": table.c.inventory,
+                "inventory_change": stmt.excluded.inventory - table.c.inventory,
+                "fingerprint": stmt.excluded.fingerprint,
+                "last_synced": stmt.excluded.last_synced,
+            }
+        )
+        changes = []
+        for written in db.execute(stmt.returning(*_upsert_returning(db, table.c.shopify_id))):
+            inserted = _was_inserted(written, written.shopify_id in existing)
+            created += inserted
+            changes.append(_written_change(written, written.shopify_id, shop, inserted))
+        record_inventory_changes(db, changes)
+
+    if timings is not None:
+        timings["diff"] = timings.get("diff", 0.0) + diffed - started
+        timings["write"] = timings.get("write", 0.0) + time.perf_counter() - diffed
+
+    return {
+        "created": created,
+        "updated": len(changed) - created,
+        "unchanged": len(unchanged),
+    }
+
+
+def apply_inventory_updates(
+    db: Session,
+    updates: List[schemas.WebhookInventoryUpdate]
+) -> Dict[str, int]:
+    """Apply coalesced webhook updates as one upsert; the caller owns the transaction.
+
+    Mirrors the single-delivery path: existing products get their inventory
+    (and title, when sent) replaced, unknown products are created with a
+    placeholder title and zero price until the next sync fills them in.
+    Updates whose ``updated_at`` is not newer than the product's stored
+    upstream version are stale and skipped without a write.
+    """
+    if not updates:
+        return {"created": 0, "updated": 0, "stale": 0}
+
+    existing = {
+        (row.shop, row.shopify_id): row
+        for row in db.execute(
+            select(
+                models.Product.shop,
+                models.Product.shopify_id,
+                models.Product.title,
+                models.Product.price,
+                models.Product.upstream_updated_at
+            ).where(tuple_(models.Product.shop, models.Product.shopify_id).in_(
+                list({(u.shop, u.product_id) for u in updates})
+            ))
+        )
+    }
+
+    now = datetime.utcnow()
+    rows = []
+    stale = 0
+    for update_ in updates:
+        current = existing.get((update_.shop, update_.product_id))
+        if is_stale_update(update_, current.upstream_updated_at if current else None):
+            stale += 1
+            continue
+        title = update_.title or (current.title if current else "Unknown Product")
+        price = current.price if current else 0.0
+        rows.append({
+            "shop": update_.shop,
+            "shopify_id": update_.product_id,
+            "title": title,
+            "inventory": update_.inventory,
+            "price": price,
+            "previous_inventory": 0,
+            "inventory_change": 0,
+            "fingerprint": product_fingerprint(title, price, update_.inventory),
+            "last_synced": now,
+            "upstream_updated_at": update_.updated_at,
+        })
+    if not rows:
+        return {"created": 0, "updated": 0, "stale": stale}
+
+    table = models.Product.__table__
+    stmt = _insert_for(db)(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.shop, table.c.shopify_id],
+        set_={
+            "title": stmt.excluded.title,
+            "inventory": stmt.excluded.inventory,
+            "previous_inventory": table.c.inventory,
+            "inventory_change": stmt.excluded.inventory - table.c.inventory,
+            "fingerprint": stmt.excluded.fingerprint,
+            "last_synced": stmt.excluded.last_synced,
+            "upstream_updated_at": func.coalesce(stmt.excluded.upstream_updated_at, table.c.upstream_updated_at),
+        },
+        # Re-checked in SQL in case another writer advanced the version meanwhile
+        where=or_(
+            table.c.upstream_updated_at.is_(None),
+            stmt.excluded.upstream_updated_at.is_(None),
+            table.c.upstream_updated_at < stmt.excluded.upstream_updated_at,
+        )
+    )
+    changes = []
+    created = 0
+    # Rows the version check skipped are not returned
+    for written in db.execute(stmt.returning(*_upsert_returning(db, table.c.shop, table.c.shopify_id))):
+        inserted = _was_inserted(written, (written.shop, written.shopify_id) in existing)
+        created += inserted
+        changes.append(_written_change(written, written.shopify_id, written.shop, inserted))
+    record_inventory_changes(db, changes)
+
+    stale += len(rows) - len(changes)
+    return {"created": created, "updated": len(changes) - created, "stale": stale}
+
+def _upsert_returning(db: Session, *keys: Any) -> List[Any]:
+    """Columns a product upsert returns to describe each row it wrote.
+
+    On conflict ``previous_inventory`` is set in SQL to the level being
+    replaced, so the old level comes from the row actually overwritten even
+    with concurrent writers. Postgres reports inserts through ``xmax``;
+    SQLite transactions are serializable, so there the caller's earlier read
+    of which rows exist still holds.
+    """
+    table = models.Product.__table__
+    columns = [*keys, table.c.id, table.c.previous_inventory, table.c.inventory, table.c.low_stock_threshold]
+    if db.get_bind().dialect.name == "postgresql":
+        # xmax is zero only on row versions created by an INSERT
+        columns.append(literal_column("(xmax = 0)").label("inserted"))
+    return columns
+
+def _was_inserted(written: Row, existed: bool) -> bool:
+    inserted = written._mapping.get("inserted")
+    return not existed if inserted is None else bool(inserted)
+
+def _written_change(written: Row, shopify_id: str, shop: str, inserted: bool) -> InventoryChange:
+    return InventoryChange(
+        shopify_id,
+        None if inserted else written.previous_inventory,
+        written.inventory,
+        written.id,
+        written.low_stock_threshold,
+        shop
+    )
+
+def is_stale_update(update_: schemas.WebhookInventoryUpdate, stored_version: Optional[datetime]) -> bool:
+    """True when both sides are versioned and the update is not newer"""
+    return update_.updated_at is not None and stored_version is not None and update_.updated_at <= stored_version
+
+def record_processed_webhooks(db: Session, webhook_ids: List[str]) -> Set[str]:
+    """Insert delivery ids, returning those not seen before; the caller commits"""
+    if not webhook_ids:
+        return set()
+    table = models.ProcessedWebhook.__table__
+    now = datetime.utcnow()
+    stmt = (
+        _insert_for(db)(table)
+        .values([{"webhook_id": webhook_id, "received_at": now} for webhook_id in set(webhook_ids)])
+        .on_conflict_do_nothing(index_elements=[table.c.webhook_id])
+        .returning(table.c.webhook_id)
+    )
+    return set(db.scalars(stmt))
+
+def prune_processed_webhooks(db: Session, before: datetime) -> int:
+    result = db.execute(delete(models.ProcessedWebhook).where(models.ProcessedWebhook.received_at < before))
+    db.commit()
+    return result.rowcount
+
+
+def aggregate_inventory(db: Session) -> Dict[str, int]:
+    """Recompute the inventory rollup from the products table"""
+    db.flush()
+    total_inventory, product_count, low_stock, out_of_stock = db.execute(
+        select(
+            func.coalesce(func.sum(models.Product.inventory), 0),
+            func.count(),
+            func.count().filter(models.Product.inventory <= LOW_STOCK_THRESHOLD),
+            func.count().filter(models.Product.inventory == 0)
+        ).select_from(models.Product)
+    ).one()
+    return {
+        "total_inventory": total_inventory,
+        "product_count": product_count,
+        "low_stock_count": low_stock,
+        "out_of_stock_count": out_of_stock,
+    }
+
+def get_inventory_summary(db: Session) -> Optional[models.InventorySummary]:
+    # The row is written with Core statements; don't serve a stale identity-map copy
+    return db.get(models.InventorySummary, SUMMARY_ROW_ID, populate_existing=True)
+
+def rebuild_inventory_summary(db: Session) -> Dict[str, int]:
+    """Overwrite the summary row with freshly aggregated values; the caller commits"""
+    values = aggregate_inventory(db)
+    now = datetime.utcnow()
+    table = models.InventorySummary.__table__
+    stmt = _insert_for(db)(table).values(id=SUMMARY_ROW_ID, updated_at=now, **values)
+    db.execute(stmt.on_conflict_do_update(index_elements=[table.c.id], set_={"updated_at": now, **values}))
+    return values
+
+def verify_inventory_summary(db: Session) -> Dict[str, Any]:
+    """Compare the summary row with a full aggregate and report any drift"""
+    actual = aggregate_inventory(db)
+    summary = get_inventory_summary(db)
+    stored = {key: getattr(summary, key) for key in actual} if summary else None
+    drift = {key: stored[key] - value for key, value in actual.items()} if stored else None
+    return {
+        "in_sync": stored == actual,
+        "stored": stored,
+        "actual": actual,
+        "drift": drift,
+    }
+
+def mark_products_dirty(db: Session) -> None:
+    """Invalidate cached product reads once this transaction commits"""
+    db.info["products_dirty"] = True
+
+def record_inventory_changes(db: Session, changes: List[InventoryChange]) -> None:
+    """Write the history for a chunk of changes now and fold it into the summary delta.
+
+    Nothing proportional to the transaction's size is kept: the summary row
+    is updated once before commit from the running delta, and at most
+    INVENTORY_PUBLISH_LIMIT changes wait for publication.
+    """
+    mark_products_dirty(db)
+    totals = db.info.setdefault("summary_delta", dict.fromkeys(SUMMARY_FIELDS, 0))
+    for key, value in _summary_delta(changes).items():
+        totals[key] += value
+    _hold_for_publication(db, append_inventory_events(db, changes))
+
+def _hold_for_publication(db: Session, moved: List[InventoryChange]) -> None:
+    held = db.info.setdefault("moved_changes", [])
+    room = max(INVENTORY_PUBLISH_LIMIT - len(held), 0)
+    held.extend(moved[:room])
+    overflow = moved[room:]
+    if overflow:
+        db.info["unpublished_changes"] = db.info.get("unpublished_changes", 0) + len(overflow)
+        # Alerts can't be recomputed later, so crossings are kept regardless
+        held.extend(change for change in overflow if alerts.alert_engine.is_crossing(change))
+
+def _summary_delta(changes: List[InventoryChange]) -> Dict[str, int]:
+    delta = dict.fromkeys(SUMMARY_FIELDS, 0)
+    for change in changes:
+        for level, sign in ((change.old_inventory, -1), (change.new_inventory, 1)):
+            if level is None:
+                continue
+            delta["total_inventory"] += sign * level
+            delta["product_count"] += sign
+            delta["low_stock_count"] += sign * (level <= LOW_STOCK_THRESHOLD)
+            delta["out_of_stock_count"] += sign * (level == 0)
+    return delta
+
+def apply_summary_delta(db: Session, delta: Dict[str, int]) -> None:
+    """Add a transaction's summary delta to the summary row with one UPDATE"""
+    if not any(delta.values()):
+        return
+    now = datetime.utcnow()
+    table = models.InventorySummary.__table__
+    increments = {key: table.c[key] + value for key, value in delta.items()}
+    result = db.execute(
+        update(table).where(table.c.id == SUMMARY_ROW_ID).values(updated_at=now, **increments)
+    )
+    if result.rowcount == 0:
+        # First write on a fresh database: the aggregate already includes this
+        # transaction. If a concurrent first writer inserts the row meanwhile,
+        # the conflict adds this transaction's delta to theirs instead.
+        stmt = _insert_for(db)(table).values(id=SUMMARY_ROW_ID, updated_at=now, **aggregate_inventory(db))
+        db.execute(stmt.on_conflict_do_update(index_elements=[table.c.id], set_={"updated_at": now, **increments}))
+
+def _resolve_product_ids(db: Session, changes: List[InventoryChange]) -> List[InventoryChange]:
+    """Fill in ids for products created earlier in this transaction, in bounded lookups"""
+    missing = list({(change.shop, change.shopify_id) for change in changes if change.product_id is None})
+    if not missing:
+        return changes
+    db.flush()
+    ids = {}
+    for start in range(0, len(missing), RESOLVE_CHUNK_SIZE):
+        ids.update(
+            ((shop, shopify_id), product_id)
+            for shop, shopify_id, product_id in db.execute(
+                select(models.Product.shop, models.Product.shopify_id, models.Product.id)
+                .where(tuple_(models.Product.shop, models.Product.shopify_id).in_(missing[start:start + RESOLVE_CHUNK_SIZE]))
+            )
+        )
+    return [
+        change if change.product_id is not None
+        else change._replace(product_id=ids.get((change.shop, change.shopify_id)))
+        for change in changes
+    ]
+
+def append_inventory_events(db: Session, changes: List[InventoryChange]) -> List[InventoryChange]:
+    """Append one history row per actual inventory movement in a single executemany.
+
+    Returns the movements that were recorded, with product ids resolved.
+    """
+    moved = [
+        change for change in changes
+        if (change.old_inventory or 0) != (change.new_inventory or 0)
+    ]
+    if not moved:
+        return []
+    now = datetime.utcnow()
+    moved = [change for change in _resolve_product_ids(db, moved) if change.product_id is not None]
+    if moved:
+        db.execute(insert(models.InventoryEvent), [
+            {
+                "product_id": change.product_id,
+                "recorded_at": now,
+                "delta": (change.new_inventory or 0) - (change.old_inventory or 0),
+                "inventory": change.new_inventory or 0,
+            }
+            for change in moved
+        ])
+    return moved
+
+def _time_bucket(db: Session, bucket: str):
+    """Truncate recorded_at to the bucket size in the current dialect"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(bucket, models.InventoryEvent.recorded_at)
+    return func.strftime(SQLITE_BUCKET_FORMATS[bucket], models.InventoryEvent.recorded_at)
+
+def get_inventory_history(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    bucket: str = "hour",
+    product_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Downsample inventory events into time buckets, for one product or the catalog"""
+    bucket_expr = _time_bucket(db, bucket).label("bucket")
+    columns = [
+        bucket_expr,
+        func.count().label("events"),
+        func.sum(models.InventoryEvent.delta).label("net_change"),
+        func.min(models.InventoryEvent.inventory).label("min_inventory"),
+        func.max(models.InventoryEvent.inventory).label("max_inventory"),
+    ]
+    if product_id is None:
+        columns.append(func.count(models.InventoryEvent.product_id.distinct()).label("products"))
+
+    query = (
+        select(*columns)
+        .where(models.InventoryEvent.recorded_at >= start)
+        .where(models.InventoryEvent.recorded_at < end)
+        .group_by(bucket_expr)
+        .order_by(bucket_expr)
+    )
+    if product_id is not None:
+        query = query.where(models.InventoryEvent.product_id == product_id)
+
+    history = []
+    for row in db.execute(query):
+        point = dict(row._mapping)
+        if isinstance(point["bucket"], datetime):
+            point["bucket"] = point["bucket"].isoformat()
+        history.append(point)
+    return history
+
+def prune_inventory_events(db: Session, before: datetime, batch_size: int = 10000) -> int:
+    """Delete events older than ``before`` in batches, committing each one"""
+    deleted = 0
+    while True:
+        batch = select(models.InventoryEvent.id).where(
+            models.InventoryEvent.recorded_at < before
+        ).limit(batch_size)
+        result = db.execute(
+            delete(models.InventoryEvent).where(models.InventoryEvent.id.in_(batch.scalar_subquery()))
+        )
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+def start_sync_run(db: Session, run_id: str, trigger: str, started_at: datetime) -> None:
+    db.add(models.SyncRunRecord(id=run_id, trigger=trigger, status="running", started_at=started_at))
+    db.commit()
+
+def update_sync_run(db: Session, run_id: str, values: Dict[str, Any]) -> None:
+    """Record a run's progress or outcome with one UPDATE"""
+    db.execute(update(models.SyncRunRecord).where(models.SyncRunRecord.id == run_id).values(**values))
+    db.commit()
+
+def get_sync_run(db: Session, run_id: str) -> Optional[models.SyncRunRecord]:
+    return db.get(models.SyncRunRecord, run_id)
+
+def get_latest_sync_run(db: Session, status: Optional[str] = None) -> Optional[models.SyncRunRecord]:
+    """Newest run, or the most recently finished one with ``status``"""
+    query = select(models.SyncRunRecord)
+    if status is None:
+        query = query.order_by(models.SyncRunRecord.started_at.desc(), models.SyncRunRecord.id.desc())
+    else:
+        query = query.where(models.SyncRunRecord.status == status).order_by(models.SyncRunRecord.finished_at.desc())
+    return db.scalars(query.limit(1)).first()
+
+def get_sync_runs(
+    db: Session,
+    limit: int = 20,
+    before: Optional[Tuple[datetime, str]] = None
+) -> List[models.SyncRunRecord]:
+    """Runs newest first, keyset-paged on (started_at, id)"""
+    query = select(models.SyncRunRecord).order_by(
+        models.SyncRunRecord.started_at.desc(), models.SyncRunRecord.id.desc()
+    )
+    if before is not None:
+        query = query.where(tuple_(models.SyncRunRecord.started_at, models.SyncRunRecord.id) < tuple_(*before))
+    return list(db.scalars(query.limit(limit)))
+
+# Session hooks: history rows are written with each chunk, but the summary
+# row is updated once per transaction, right before commit, so that hot row
+# is locked as briefly as possible.
+
+@event.listens_for(Session, "before_commit")
+def _apply_recorded_changes(session: Session) -> None:
+    delta = session.info.pop("summary_delta", None)
+    if delta:
+        apply_summary_delta(session, delta)
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_changes(session: Session) -> None:
+    if session.info.pop("products_dirty", False):
+        product_cache.invalidate()
+    moved = session.info.pop("moved_changes", None)
+    skipped = session.info.pop("unpublished_changes", 0)
+    if moved or skipped:
+        inventory_broadcaster.publish(moved or [], skipped=skipped)
+    if moved:
+        alerts.alert_engine.submit(moved)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_recorded_changes(session: Session) -> None:
+    for key in ("summary_delta", "moved_changes", "unpublished_changes", "products_dirty"):
+        session.info.pop(key, None)
+
+
+# Async counterparts used by the API. Each one runs the synchronous function
+# above through AsyncSession.run_sync, so queries go through the async driver
+# without blocking the event loop and both code paths share one implementation.
+
+async def get_product_async(db: AsyncSession, product_id: int) -> Optional[models.Product]:
+    return await db.run_sync(get_product, product_id)
+
+async def get_product_by_shopify_id_async(
+    db: AsyncSession,
+    shopify_id: str,
+    shop: str = models.DEFAULT_SHOP
+) -> Optional[models.Product]:
+    return await db.run_sync(get_product_by_shopify_id, shopify_id, shop)
+
+async def get_products_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100
+) -> List[models.Product]:
+    return await db.run_sync(get_products, skip=skip, limit=limit)
+
+async def get_products_after_async(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = 100
+) -> List[models.Product]:
+    return await db.run_sync(get_products_after, after_id=after_id, limit=limit)
+
+async def create_product_async(
+    db: AsyncSession,
+    product: schemas.ProductCreate,
+    initial_inventory: int = 0
+) -> models.Product:
+    return await db.run_sync(create_product, product, initial_inventory=initial_inventory)
+
+async def update_product_async(
+    db: AsyncSession,
+    product_id: int,
+    product_data: dict
+) -> Optional[models.Product]:
+    return await db.run_sync(update_product, product_id, product_data)
+
+async def delete_product_async(db: AsyncSession, product_id: int) -> bool:
+    return await db.run_sync(delete_product, product_id)
+
+async def get_inventory_history_async(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    bucket: str = "hour",
+    product_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    return await db.run_sync(get_inventory_history, start, end, bucket=bucket, product_id=product_id)
+
+async def count_products_async(db: AsyncSession) -> int:
+    return await db.run_sync(count_products)
+
+async def count_low_inventory_products_async(db: AsyncSession, threshold: int = 10) -> int:
+    return await db.run_sync(count_low_inventory_products, threshold=threshold)
+
+async def get_product_rows_async(
+    db: AsyncSession,
+    columns: Sequence[Any],
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None
+) -> List[Row]:
+    return await db.run_sync(get_product_rows, columns, skip=skip, limit=limit, after_id=after_id)
+
+async def get_low_inventory_rows_async(
+    db: AsyncSession,
+    columns: Sequence[Any],
+    threshold: int = 10,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+    shop: Optional[str] = None
+) -> List[Row]:
+    return await db.run_sync(get_low_inventory_rows, columns, threshold=threshold, limit=limit, after=after, shop=shop)
+
+async def start_sync_run_async(db: AsyncSession, run_id: str, trigger: str, started_at: datetime) -> None:
+    await db.run_sync(start_sync_run, run_id, trigger, started_at)
+
+async def update_sync_run_async(db: AsyncSession, run_id: str, values: Dict[str, Any]) -> None:
+    await db.run_sync(update_sync_run, run_id, values)
+
+async def get_sync_run_async(db: AsyncSession, run_id: str) -> Optional[models.SyncRunRecord]:
+    return await db.run_sync(get_sync_run, run_id)
+
+async def get_latest_sync_run_async(db: AsyncSession, status: Optional[str] = None) -> Optional[models.SyncRunRecord]:
+    return await db.run_sync(get_latest_sync_run, status)
+
+async def get_sync_runs_async(
+    db: AsyncSession,
+    limit: int = 20,
+    before: Optional[Tuple[datetime, str]] = None
+) -> List[models.SyncRunRecord]:
+    return await db.run_sync(get_sync_runs, limit=limit, before=before)
+
+async def get_low_inventory_products_async(
+    db: AsyncSession,
+    threshold: int = 10,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None
+) -> List[models.Product]:
+    return await db.run_sync(get_low_inventory_products, threshold=threshold, limit=limit, after=after)
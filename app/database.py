@@ -1,5 +1,10 @@
 import os
-from sqlalchemy import create_engine
+import time
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional
+from fastapi import Header
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -9,16 +14,158 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set. Did you forget to add it to Railway environment variables?")
 
-# Fix legacy "postgres://" prefix
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+def _normalize_url(url: str) -> str:
+    # Fix legacy "postgres://" prefix
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+DATABASE_URL = _normalize_url(DATABASE_URL)
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Optional read-only replica for GET endpoints; writes always go to DATABASE_URL
+READ_REPLICA_URL = _normalize_url(os.getenv("READ_REPLICA_URL", ""))
+
+# Connection pool sizing per engine (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# A client's reads this soon after its own commit go to the primary, hiding replica lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "1"))
+
+def _async_url(url: str) -> str:
+    """Map a sync database URL onto its async driver"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+def _engine_options(url: str, is_async: bool) -> dict:
+    if url.startswith("sqlite"):
+        # Local development: no TLS, and sessions may hop between threadpool threads
+        return {"connect_args": {} if is_async else {"check_same_thread": False}}
+    return {
+        # Needed for Railway PostgreSQL
+        "connect_args": {"ssl": "require"} if is_async else {"sslmode": "require"},
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
 
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
-    connect_args={"sslmode": "require"}  # Needed for Railway PostgreSQL
+    **_engine_options(DATABASE_URL, is_async=False)
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the API so queries don't block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    **_engine_options(DATABASE_URL, is_async=True)
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+async_replica_engine = create_async_engine(
+    _async_url(READ_REPLICA_URL),
+    pool_pre_ping=True,
+    **_engine_options(READ_REPLICA_URL, is_async=True)
+) if READ_REPLICA_URL else None
+
+# Falls back to the primary when no replica is configured
+AsyncReadSessionLocal = async_sessionmaker(
+    async_replica_engine or async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Set per request by ReadYourWritesMiddleware; a commit while serving the request flips it
+_request_wrote: ContextVar[Optional[List[bool]]] = ContextVar("request_wrote", default=None)
+
+@event.listens_for(engine, "commit")
+@event.listens_for(async_engine.sync_engine, "commit")
+def _note_commit(connection) -> None:
+    wrote = _request_wrote.get()
+    if wrote is not None:
+        wrote[0] = True
+
+class ReadYourWritesMiddleware:
+    """Routes a client's reads to the primary for a while after it writes.
+
+    The response to a request that committed carries ``X-Read-Your-Writes:
+    until=<unix time>``; a client that echoes the header back reads from the
+    primary until then. Commits made for other clients or by background
+    work (webhook flushes, scheduled syncs) leave everyone else's reads on
+    the replica.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        wrote = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and wrote[0]:
+                until = f"until={time.time() + READ_YOUR_WRITES_SECONDS:.3f}".encode()
+                message = {**message, "headers": [*message.get("headers", []), (b"x-read-your-writes", until)]}
+            await send(message)
+
+        token = _request_wrote.set(wrote)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_wrote.reset(token)
+
+def reads_from_primary(x_read_your_writes: Optional[str]) -> bool:
+    """An ``until=`` value holds until that time; any other value, e.g. ``1``, always applies"""
+    if not x_read_your_writes:
+        return False
+    if x_read_your_writes.startswith("until="):
+        try:
+            return time.time() < float(x_read_your_writes[len("until="):])
+        except ValueError:
+            return True
+    return True
+
+def pinned_to_primary(x_read_your_writes: Optional[str]) -> bool:
+    """True when a replica serves reads but this request must read the primary"""
+    return async_replica_engine is not None and reads_from_primary(x_read_your_writes)
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Primary session, for writes and reads that must see them"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db(x_read_your_writes: Optional[str] = Header(None)) -> AsyncIterator[AsyncSession]:
+    """Replica session for read-only endpoints.
+
+    Sending ``X-Read-Your-Writes: 1``, or echoing the ``until=`` value a
+    write response returned, routes the request to the primary instead.
+    """
+    if async_replica_engine is None or reads_from_primary(x_read_your_writes):
+        factory = AsyncSessionLocal
+    else:
+        factory = AsyncReadSessionLocal
+    async with factory() as db:
+        yield db
+
 Base = declarative_base()
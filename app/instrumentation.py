@@ -0,0 +1,260 @@
+"""Process metrics exposed in the Prometheus text format.
+
+Metrics are plain in-process counters. They are updated on the event
+loop and, through the engine hooks, on worker threads such as the one
+``bulk_io`` imports run on, so each update takes the metric's lock. The
+``/metrics`` endpoint renders them on demand; pool gauges are read from
+the engines at scrape time.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .database import DB_MAX_OVERFLOW
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SYNC_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {total}"
+
+class Gauge(Counter):
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, help_text, labels)
+        self._collect = collect
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> Iterable[str]:
+        if self._collect is not None:
+            self._values = self._collect()
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        for values, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for values, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels, values, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            labels = _format_labels(self.labels, values, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {series[-1]}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("route", "method")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"))
+request_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "Database statements issued per request", ("route",), COUNT_BUCKETS))
+request_db_time = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in database statements per request", ("route",)))
+db_queries = registry.register(Counter(
+    "db_queries_total", "Database statements executed", ("engine",)))
+db_query_time = registry.register(Histogram(
+    "db_query_duration_seconds", "Database statement latency", ("engine",)))
+pool_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ("engine",)))
+pool_hold = registry.register(Histogram(
+    "db_pool_connection_hold_seconds", "Time a pooled connection stays checked out", ("engine",)))
+sync_phase_time = registry.register(Histogram(
+    "sync_phase_duration_seconds", "Sync run time per phase", ("phase",), SYNC_BUCKETS))
+sync_runs = registry.register(Counter(
+    "sync_runs_total", "Completed sync runs by status", ("status",)))
+
+# (queries, seconds) for the request being served, shared with run_sync greenlets
+_request_db_stats: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "request_db_stats", default=None
+)
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Time statements, connection checkouts and how long connections are held, for a (sync) engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_queries.inc(name)
+        db_query_time.observe(elapsed, name)
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        # A failed statement never reaches after_cursor_execute
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @event.listens_for(engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            pool_hold.observe(time.perf_counter() - started, name)
+
+    # No event fires before a checkout starts, so time the engine's public
+    # connect(); sessions, async engines and engine.begin() all go through it
+    connect = engine.connect
+
+    def _timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pool_wait.observe(time.perf_counter() - started, name)
+
+    engine.connect = _timed_connect
+    registered_pools[name] = engine.pool
+
+registered_pools: Dict[str, Any] = {}
+
+def _collect_pool(attribute: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect() -> Dict[LabelValues, float]:
+        values = {}
+        for name, pool in registered_pools.items():
+            # NullPool (used for aiosqlite) keeps no connections to report on
+            if not hasattr(pool, "checkedout"):
+                continue
+            checked_out = pool.checkedout()
+            if attribute == "checked_out":
+                values[(name,)] = checked_out
+            elif attribute == "overflow":
+                values[(name,)] = max(pool.overflow(), 0)
+            else:
+                capacity = pool.size() + DB_MAX_OVERFLOW
+                values[(name,)] = checked_out / capacity if capacity else 0
+        return values
+    return collect
+
+registry.register(Gauge(
+    "db_pool_checked_out", "Connections currently checked out", ("engine",), collect=_collect_pool("checked_out")))
+registry.register(Gauge(
+    "db_pool_overflow", "Connections open beyond the pool size", ("engine",), collect=_collect_pool("overflow")))
+registry.register(Gauge(
+    "db_pool_utilization", "Checked-out connections as a fraction of pool size plus overflow", ("engine",),
+    collect=_collect_pool("utilization")))
+
+def record_sync_run(result: Dict[str, Any]) -> None:
+    sync_runs.inc(result.get("status", "error"))
+    for phase, seconds in (result.get("phases") or {}).items():
+        sync_phase_time.observe(seconds, phase)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and DB work per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_db_stats.set(stats)
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            _request_db_stats.reset(token)
+            # Label by route template, not the raw path, to keep cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests.inc(path, method, str(status["code"]))
+            http_latency.observe(elapsed, path, method)
+            request_db_queries.observe(stats[0], path)
+            request_db_time.observe(stats[1], path)
@@ -1,17 +1,61 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
-from . import crud, models, schemas, utils
-from .database import SessionLocal, engine
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from . import bulk_io, crud, migrations, models, reconcile, schemas, serialization, utils
+from .alerts import alert_engine
+from .broadcast import inventory_broadcaster
+from .cache import content_etag, product_cache
+from .database import (
+    ReadYourWritesMiddleware, async_engine, async_replica_engine, engine, get_db, get_read_db, pinned_to_primary
+)
+from .instrumentation import MetricsMiddleware, instrument_engine, registry
 from .webhook_routes import router as webhook_router
-from .sync_jobs import get_sync_service, MockShopifySync
-from fastapi.responses import JSONResponse
+from .webhook_queue import webhook_batcher
+from .sync_jobs import get_sync_service
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import hmac
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Bearer token for endpoints that bulk-write or delete catalog rows; unset disables them
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+if not ADMIN_API_TOKEN:
+    logger.warning("ADMIN_API_TOKEN is not set; bulk import and reconcile are only available through manage")
+
+async def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create missing tables and upgrade existing ones
+migrations.upgrade(engine)
 
-app = FastAPI(title="Shopify Sync API")
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+if async_replica_engine is not None:
+    instrument_engine(async_replica_engine.sync_engine, "replica")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await alert_engine.start()
+    await webhook_batcher.start()
+    await get_sync_service().start()
+    yield
+    await get_sync_service().stop()
+    # Drain queued webhook updates before the worker exits
+    await webhook_batcher.stop()
+    await alert_engine.stop()
+    inventory_broadcaster.close()
+
+app = FastAPI(title="Shopify Sync API", lifespan=lifespan)
 
 # Updated CORS configuration
 app.add_middleware(
@@ -36,75 +80,351 @@ app.add_middleware(
     max_age=600,  # Cache preflight requests for 10 minutes
 )
 
-# Dependency for database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Outermost, so latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
 
 # Include webhook routes
 app.include_router(webhook_router, prefix="/webhook", tags=["webhooks"])
 
 # Product endpoints
+_product_adapter = TypeAdapter(schemas.Product)
+
+def _dump(adapter: TypeAdapter, value: Any) -> bytes:
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+async def cached_json_response(
+    request: Request,
+    key: str,
+    loader: Callable[[], Awaitable[Optional[Tuple[bytes, Dict[str, str]]]]]
+) -> Response:
+    """Serve a cached JSON body with a content-derived ETag, or 304 if the client has it.
+
+    The 304 is decided against the body this process would serve now, from a
+    live cache entry or a fresh load, so it never confirms an expired copy.
+    Requests pinned to the primary by read-your-writes bypass the cache: an
+    entry may have been filled from a replica that hasn't seen their write.
+    """
+    async def load_tagged() -> Optional[Tuple[bytes, Dict[str, str], str]]:
+        value = await loader()
+        if value is None:
+            return None
+        body, headers = value
+        return body, headers, content_etag(body)
+
+    if pinned_to_primary(request.headers.get("x-read-your-writes")):
+        value = await load_tagged()
+    else:
+        _, value = await product_cache.get_or_load(key, load_tagged)
+    if value is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    body, headers, etag = value
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={**headers, "ETag": etag, "Cache-Control": "no-cache"}
+    )
+
 @app.get("/products/", response_model=List[schemas.Product], tags=["products"])
 async def read_products(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db)
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all products with pagination"""
-    products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+    """Get products ordered by id; pass the X-Next-Cursor header back as ``cursor`` for the next page.
+
+    Pages hold at most 1000 products; use /products/export for the full catalog.
+    """
+    after_id = None
+    if cursor is not None:
+        try:
+            after_id = int(utils.decode_cursor(cursor)["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    async def load():
+        # Legacy offset paging (skip without cursor) gets slower on deep pages
+        rows = await crud.get_product_rows_async(
+            db, serialization.PRODUCT_COLUMNS, skip=skip, limit=limit, after_id=after_id
+        )
+        headers = {}
+        if rows and len(rows) == limit:
+            headers["X-Next-Cursor"] = utils.encode_cursor({"id": rows[-1].id})
+        return serialization.encode_product_rows(rows), headers
+
+    return await cached_json_response(request, f"products:{skip}:{limit}:{after_id}", load)
+
+@app.get("/products/export", tags=["products"])
+async def export_products(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Stream the full catalog as NDJSON or CSV"""
+    return StreamingResponse(
+        bulk_io.stream_products(format),
+        media_type=bulk_io.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=products.{format}"}
+    )
+
+@app.post("/products/import", tags=["products"], dependencies=[Depends(require_admin)])
+async def import_products(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    shop: str = models.DEFAULT_SHOP
+):
+    """Stream an NDJSON or CSV catalog into products; the body is processed as it arrives"""
+    try:
+        return await bulk_io.import_stream(request.stream(), format, shop=shop)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8")
+
+@app.get("/products/stream", tags=["products"])
+async def stream_inventory(skus: Optional[str] = None):
+    """Server-Sent Events feed of committed inventory changes, optionally filtered by comma-separated SKUs"""
+    sku_filter = [sku.strip() for sku in skus.split(",") if sku.strip()] if skus else None
+    subscriber = inventory_broadcaster.subscribe(sku_filter)
+    return StreamingResponse(
+        inventory_broadcaster.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/products/low-stock", response_model=List[schemas.Product], tags=["products"])
 async def get_low_stock_products(
+    request: Request,
     threshold: int = 10,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    shop: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get products with low inventory"""
-    return crud.get_low_inventory_products(db, threshold=threshold)
+    """Get products with low inventory, lowest stock first, optionally for one shop; page with the X-Next-Cursor header"""
+    if not utils.validate_inventory_threshold(threshold):
+        raise HTTPException(
+            status_code=400,
+            detail=f"threshold must be between 0 and {models.MAX_INVENTORY_THRESHOLD}"
+        )
+    after = None
+    if cursor is not None:
+        try:
+            position = utils.decode_cursor(cursor)
+            after = (int(position["inventory"]), int(position["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    async def load():
+        rows = await crud.get_low_inventory_rows_async(
+            db, serialization.PRODUCT_COLUMNS, threshold=threshold, limit=limit, after=after, shop=shop
+        )
+        headers = {}
+        if rows and len(rows) == limit:
+            last = rows[-1]
+            headers["X-Next-Cursor"] = utils.encode_cursor({"inventory": last.inventory, "id": last.id})
+        return serialization.encode_product_rows(rows), headers
+
+    return await cached_json_response(request, f"low-stock:{threshold}:{limit}:{after}:{shop}", load)
 
 @app.get("/products/{product_id}", response_model=schemas.Product, tags=["products"])
-async def read_product(product_id: int, db: Session = Depends(get_db)):
+async def read_product(request: Request, product_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get a specific product by ID"""
-    product = crud.get_product(db, product_id)
+    async def load():
+        product = await crud.get_product_async(db, product_id)
+        if product is None:
+            return None
+        return _dump(_product_adapter, product), {}
+
+    return await cached_json_response(request, f"product:{product_id}", load)
+
+@app.put("/products/{product_id}/low-stock-threshold", response_model=schemas.Product, tags=["products"])
+async def set_low_stock_threshold(
+    product_id: int,
+    body: schemas.LowStockThresholdUpdate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Set or clear the threshold below which a product raises low stock alerts"""
+    if body.low_stock_threshold is not None and not utils.validate_inventory_threshold(body.low_stock_threshold):
+        raise HTTPException(
+            status_code=400,
+            detail=f"threshold must be between 0 and {models.MAX_INVENTORY_THRESHOLD}"
+        )
+    product = await crud.update_product_async(db, product_id, {"low_stock_threshold": body.low_stock_threshold})
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
+MAX_HISTORY_BUCKETS = 10000
+BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+def _history_window(start: Optional[datetime], end: Optional[datetime], bucket: str) -> Tuple[datetime, datetime]:
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start).total_seconds() / BUCKET_SECONDS[bucket] > MAX_HISTORY_BUCKETS:
+        raise HTTPException(status_code=400, detail="Time range too large for bucket size")
+    return start, end
+
+@app.get("/products/{product_id}/history", tags=["products"])
+async def read_product_history(
+    product_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: str = Query("hour", pattern="^(minute|hour|day)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get a product's inventory movements downsampled into time buckets"""
+    start, end = _history_window(start, end, bucket)
+    return {
+        "product_id": product_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "points": await crud.get_inventory_history_async(db, start, end, bucket=bucket, product_id=product_id)
+    }
+
 # Sync endpoints
 @app.options("/sync/trigger")
 async def sync_options():
     return {}  # Return empty response for OPTIONS request
 
-@app.post("/sync/trigger")
-async def trigger_sync(request: Request, db: Session = Depends(get_db)):
-    """Manually trigger a sync with Shopify"""
+@app.post("/sync/trigger", status_code=202)
+async def trigger_sync(
+    wait: float = Query(0, ge=0, le=300, description="Seconds to wait for the run to finish")
+):
+    """Start a sync with Shopify, or join the one already running; returns its run id"""
+    sync_service = get_sync_service()
+    run = sync_service.trigger()
+    if wait:
+        await sync_service.wait(run, timeout=wait)
+    return run.to_dict()
+
+@app.get("/sync/runs", tags=["sync"])
+async def list_sync_runs(
+    response: Response,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Sync run history from the ledger, newest first; page with the X-Next-Cursor header"""
+    before = None
+    if cursor is not None:
+        try:
+            position = utils.decode_cursor(cursor)
+            before = (datetime.fromisoformat(position["started_at"]), str(position["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    runs = await crud.get_sync_runs_async(db, limit=limit, before=before)
+    if runs and len(runs) == limit:
+        last = runs[-1]
+        response.headers["X-Next-Cursor"] = utils.encode_cursor(
+            {"started_at": last.started_at.isoformat(), "id": last.id}
+        )
+    return [utils.sync_run_to_dict(run) for run in runs]
+
+@app.get("/sync/runs/{run_id}", tags=["sync"])
+async def get_sync_run(
+    run_id: str,
+    wait: float = Query(0, ge=0, le=300, description="Long-poll up to this many seconds for completion"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Poll a sync run started by /sync/trigger or the scheduler"""
+    sync_service = get_sync_service()
+    run = sync_service.get_run(run_id)
+    if run is None:
+        # Older runs, or runs from before a restart, are only in the ledger
+        record = await crud.get_sync_run_async(db, run_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Sync run not found")
+        return utils.sync_run_to_dict(record)
+    if wait:
+        await sync_service.wait(run, timeout=wait)
+    return run.to_dict()
+
+@app.post("/sync/reconcile", tags=["sync"], dependencies=[Depends(require_admin)])
+async def reconcile_catalog(
+    shop: Optional[str] = None,
+    apply: Optional[str] = Query(None, description="Comma-separated actions to write: added, removed, changed"),
+    ids: Optional[str] = Query(None, description="Comma-separated shopify_ids to limit applied changes to"),
+    sample: int = Query(100, ge=0, le=1000)
+):
+    """Diff the upstream catalog against stored products; a dry run unless ``apply`` is given"""
+    actions = {action.strip() for action in apply.split(",") if action.strip()} if apply else None
+    if actions and not actions <= set(reconcile.ACTIONS):
+        raise HTTPException(status_code=400, detail=f"apply must be a subset of {', '.join(reconcile.ACTIONS)}")
+    sync_service = get_sync_service()
+    if actions and sync_service.is_running():
+        raise HTTPException(status_code=409, detail="A sync is running", headers={"Retry-After": "30"})
     try:
-        sync_service = get_sync_service()
-        result = await sync_service.sync_products(db)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return await sync_service.reconcile(
+            shop,
+            apply=actions,
+            ids={sku.strip() for sku in ids.split(",") if sku.strip()} if ids else None,
+            sample_size=sample
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404 if shop else 400, detail=e.args[0])
 
 @app.get("/sync/status", tags=["sync"])
-async def get_sync_status(db: Session = Depends(get_db)):
+async def get_sync_status(db: AsyncSession = Depends(get_db)):
     """Get current sync status"""
     sync_service = get_sync_service()
     return await sync_service.get_sync_status(db)
 
 # Metrics and monitoring endpoints
 @app.get("/metrics/inventory", tags=["metrics"])
-async def get_inventory_metrics(db: Session = Depends(get_db)):
+async def get_inventory_metrics(db: AsyncSession = Depends(get_read_db)):
     """Get inventory metrics"""
-    return utils.calculate_inventory_metrics(db)
+    return await db.run_sync(utils.calculate_inventory_metrics)
+
+@app.get("/metrics/inventory/history", tags=["metrics"])
+async def get_inventory_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: str = Query("hour", pattern="^(minute|hour|day)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get catalog-wide inventory movements downsampled into time buckets"""
+    start, end = _history_window(start, end, bucket)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "points": await crud.get_inventory_history_async(db, start, end, bucket=bucket)
+    }
+
+@app.get("/metrics/stream", tags=["metrics"])
+async def get_stream_metrics():
+    """Get push channel subscriber and delivery counters"""
+    return inventory_broadcaster.stats()
+
+@app.get("/metrics/alerts", tags=["metrics"])
+async def get_alert_metrics():
+    """Get stock alert engine counters"""
+    return alert_engine.stats()
+
+@app.get("/alerts/recent", tags=["alerts"])
+async def get_recent_alerts(limit: int = Query(50, ge=1, le=200)):
+    """Get the most recently delivered stock status crossings, newest first"""
+    return list(alert_engine.recent)[::-1][:limit]
+
+@app.get("/metrics/cache", tags=["metrics"])
+async def get_cache_metrics():
+    """Get product read cache hit/miss/eviction counters"""
+    return product_cache.stats()
+
+@app.get("/metrics", tags=["monitoring"], response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Service metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health", tags=["monitoring"])
-async def check_health(db: Session = Depends(get_db)):
+async def check_health(db: AsyncSession = Depends(get_read_db)):
     """Check system health including sync status"""
-    return utils.check_sync_health(db)
+    return await db.run_sync(utils.check_sync_health)
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -112,6 +432,7 @@ async def http_exception_handler(request, exc):
         status_code=exc.status_code,
         content={"detail": str(exc.detail)},
         headers={
+            **(exc.headers or {}),
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "*",
             "Access-Control-Allow-Headers": "*",
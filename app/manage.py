@@ -0,0 +1,176 @@
+"""Maintenance commands, e.g. ``python -m app.manage summary verify``"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from .database import SessionLocal, engine
+from . import bulk_io, crud, migrations, models, reconcile
+
+def summary_command(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        if args.action == "rebuild":
+            before = crud.verify_inventory_summary(db)
+            crud.rebuild_inventory_summary(db)
+            db.commit()
+            print(json.dumps({"rebuilt": True, "drift": before["drift"], "summary": before["actual"]}))
+            return 0
+
+        report = crud.verify_inventory_summary(db)
+        print(json.dumps(report))
+        return 0 if report["in_sync"] else 1
+    finally:
+        db.close()
+
+def explain_command(args: argparse.Namespace) -> int:
+    queries = {
+        "low-stock": crud.low_inventory_query(threshold=args.threshold, limit=args.limit),
+        "low-stock-page": crud.low_inventory_query(threshold=args.threshold, limit=args.limit, after=(0, 0)),
+        "stale": crud.stale_products_query(datetime.utcnow() - timedelta(hours=1)),
+    }
+    db = SessionLocal()
+    try:
+        for name, query in queries.items():
+            print(f"-- {name}")
+            for line in crud.explain(db, query):
+                print(line)
+        return 0
+    finally:
+        db.close()
+
+def events_command(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=args.days)
+        deleted = crud.prune_inventory_events(db, cutoff)
+        print(json.dumps({"deleted": deleted, "before": cutoff.isoformat()}))
+        return 0
+    finally:
+        db.close()
+
+def webhooks_command(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=args.hours)
+        deleted = crud.prune_processed_webhooks(db, cutoff)
+        print(json.dumps({"deleted": deleted, "before": cutoff.isoformat()}))
+        return 0
+    finally:
+        db.close()
+
+def _format_for(path: str, fmt: Optional[str]) -> str:
+    return fmt or ("csv" if path.endswith(".csv") else "ndjson")
+
+def products_command(args: argparse.Namespace) -> int:
+    fmt = _format_for(args.path, args.format)
+    db = SessionLocal()
+    try:
+        if args.action == "export":
+            with open(args.path, "wb") if args.path != "-" else nullcontext(sys.stdout.buffer) as out:
+                written = bulk_io.export_products(db, out, fmt)
+            print(json.dumps({"exported": written, "format": fmt}), file=sys.stderr)
+            return 0
+
+        def progress(stats: Dict[str, Any]) -> None:
+            print(json.dumps(stats), file=sys.stderr)
+
+        with open(args.path, encoding="utf-8", newline="") if args.path != "-" else nullcontext(sys.stdin) as lines:
+            result = bulk_io.import_products(
+                db, lines, fmt, chunk_size=args.chunk_size, progress=progress, shop=args.shop
+            )
+        db.commit()
+        print(json.dumps(result))
+        return 0
+    finally:
+        db.close()
+
+def sync_command(args: argparse.Namespace) -> int:
+    from .sync_jobs import SyncService
+
+    actions = set(args.apply.split(",")) if args.apply else None
+    if actions and not actions <= set(reconcile.ACTIONS):
+        print(f"--apply must be a subset of {','.join(reconcile.ACTIONS)}", file=sys.stderr)
+        return 2
+
+    async def run() -> Dict[str, Any]:
+        service = SyncService()
+        try:
+            with open(args.output, "w") if args.output != "-" else nullcontext(sys.stdout) as out:
+                return await service.reconcile(
+                    args.shop,
+                    apply=actions,
+                    ids=set(args.ids.split(",")) if args.ids else None,
+                    on_record=lambda record: out.write(json.dumps(record) + "\n"),
+                    sample_size=0
+                )
+        finally:
+            await service.orchestrator.aclose()
+
+    try:
+        result = asyncio.run(run())
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 2
+    # Every difference went to the output; the summary goes to stderr
+    print(json.dumps({key: value for key, value in result.items() if key != "sample"}), file=sys.stderr)
+    return 0 if result["status"] == "success" else 1
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    summary = subcommands.add_parser("summary", help="Verify or rebuild the inventory summary table")
+    summary.add_argument("action", choices=["verify", "rebuild"])
+    summary.set_defaults(handler=summary_command)
+
+    explain = subcommands.add_parser("explain", help="Print query plans for the indexed read queries")
+    explain.add_argument("--threshold", type=int, default=10)
+    explain.add_argument("--limit", type=int, default=100)
+    explain.set_defaults(handler=explain_command)
+
+    events = subcommands.add_parser("events", help="Apply the retention policy to inventory history")
+    events.add_argument("action", choices=["prune"])
+    events.add_argument(
+        "--days",
+        type=int,
+        default=int(os.getenv("INVENTORY_EVENTS_RETENTION_DAYS", "90")),
+        help="Keep this many days of history"
+    )
+    events.set_defaults(handler=events_command)
+
+    webhooks = subcommands.add_parser("webhooks", help="Forget processed webhook ids past Shopify's retry window")
+    webhooks.add_argument("action", choices=["prune"])
+    webhooks.add_argument(
+        "--hours",
+        type=int,
+        default=int(os.getenv("WEBHOOK_DEDUPE_RETENTION_HOURS", "72")),
+        help="Keep ids this many hours; Shopify retries for up to 48"
+    )
+    webhooks.set_defaults(handler=webhooks_command)
+
+    products = subcommands.add_parser("products", help="Bulk import or export the catalog as NDJSON or CSV")
+    products.add_argument("action", choices=["import", "export"])
+    products.add_argument("path", help="File to read or write, or - for stdin/stdout")
+    products.add_argument("--format", choices=["ndjson", "csv"], help="Defaults to the file extension")
+    products.add_argument("--chunk-size", type=int, default=bulk_io.IMPORT_CHUNK_SIZE)
+    products.add_argument("--shop", default=models.DEFAULT_SHOP, help="Shop for records without a shop field")
+    products.set_defaults(handler=products_command)
+
+    sync = subcommands.add_parser("sync", help="Compare the upstream catalog with stored products")
+    sync.add_argument("action", choices=["reconcile"])
+    sync.add_argument("--shop", help="Required when several stores are configured")
+    sync.add_argument("--apply", help="Comma-separated actions to write: added, removed, changed")
+    sync.add_argument("--ids", help="Comma-separated shopify_ids to limit applied changes to")
+    sync.add_argument("--output", default="-", help="NDJSON file for the differences, or - for stdout")
+    sync.set_defaults(handler=sync_command)
+
+    args = parser.parse_args(argv)
+    migrations.upgrade(engine)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+"""Versioned schema upgrades for databases created by an earlier release.
+
+``create_all`` only creates missing tables; it never adds a column or an
+index to a table that already exists. ``upgrade`` runs it and then every
+step newer than the version stored in ``schema_version``, all in one
+transaction. Steps inspect the live schema before changing it, so a
+database created by any intermediate release is brought up to date too.
+"""
+import logging
+from typing import Callable, Iterable, List, Set, Tuple
+from sqlalchemy import Table, inspect, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Serializes upgrades started by several workers at once (Postgres only)
+MIGRATION_LOCK_ID = 7318512
+
+def add_missing_columns(connection: Connection, table: Table, names: Iterable[str]) -> None:
+    """ALTER TABLE ... ADD COLUMN for model columns the live table lacks"""
+    present = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for name in names:
+        if name not in present:
+            ddl = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+def create_missing_indexes(connection: Connection, table: Table, names: Set[str]) -> None:
+    """Create model indexes by name; existing ones are left alone"""
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+def _unique_keys(connection: Connection, table_name: str) -> List[Tuple[str, Tuple[str, ...], bool]]:
+    """(name, columns, is_constraint) for every unique index and constraint"""
+    inspector = inspect(connection)
+    keys = [
+        (constraint["name"], tuple(constraint["column_names"]), True)
+        for constraint in inspector.get_unique_constraints(table_name)
+    ]
+    keys.extend(
+        (index["name"], tuple(index["column_names"]), False)
+        for index in inspector.get_indexes(table_name)
+        if index["unique"] and not index.get("duplicates_constraint")
+    )
+    return keys
+
+def _partition_products_by_shop(connection: Connection) -> None:
+    """Product columns added since the baseline, and uniqueness per (shop, shopify_id)"""
+    products = models.Product.__table__
+    add_missing_columns(connection, products, ["fingerprint", "upstream_updated_at", "low_stock_threshold", "shop"])
+    connection.execute(update(products).where(products.c.shop.is_(None)).values(shop=models.DEFAULT_SHOP))
+
+    # The baseline made shopify_id unique on its own, which rejects the same SKU in two shops
+    for name, columns, is_constraint in _unique_keys(connection, products.name):
+        if columns != ("shopify_id",):
+            continue
+        if is_constraint:
+            connection.execute(text(f"ALTER TABLE {products.name} DROP CONSTRAINT {name}"))
+        else:
+            connection.execute(text(f"DROP INDEX {name}"))
+    # Upserts name (shop, shopify_id) as their conflict target, which needs a unique index
+    if not any(columns == ("shop", "shopify_id") for _, columns, _ in _unique_keys(connection, products.name)):
+        connection.execute(text(
+            f"CREATE UNIQUE INDEX uq_products_shop_shopify_id ON {products.name} (shop, shopify_id)"
+        ))
+    create_missing_indexes(connection, products, {"ix_products_shop_low_inventory", "ix_products_shop_last_synced"})
+
+    add_missing_columns(connection, models.SyncRunRecord.__table__, ["shops", "failed_shops"])
+
+def _add_product_read_indexes(connection: Connection) -> None:
+    """Low-stock and last_synced indexes for product reads"""
+    create_missing_indexes(connection, models.Product.__table__, {"ix_products_low_inventory", "ix_products_last_synced"})
+
+# Append only: a step's position is the version it upgrades to
+STEPS: List[Callable[[Connection], None]] = [
+    _partition_products_by_shop,
+    _add_product_read_indexes,
+]
+
+def upgrade(engine: Engine) -> int:
+    """Create missing tables and apply pending steps; returns the resulting version"""
+    table = models.SchemaVersion.__table__
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        models.Base.metadata.create_all(connection)
+        current = connection.scalar(select(table.c.version).where(table.c.id == 1))
+        for version, step in enumerate(STEPS, start=1):
+            if current is not None and version <= current:
+                continue
+            step(connection)
+            logger.info(f"Applied schema migration {version}: {step.__doc__}")
+        if current is None:
+            connection.execute(insert(table).values(id=1, version=len(STEPS)))
+        elif current < len(STEPS):
+            connection.execute(update(table).where(table.c.id == 1).values(version=len(STEPS)))
+    return len(STEPS)
@@ -0,0 +1,142 @@
+"""Local stand-in for the Shopify Admin products API.
+
+Simulates cursor pagination, per-request latency and the REST leaky-bucket
+rate limit (429 with Retry-After), so the fetcher can be exercised without a
+real shop::
+
+    python -m app.mock_shopify_server --products 50000 --port 8081
+
+or in-process through ``httpx.ASGITransport(app=create_app(...))``.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse
+from .catalog_generator import SyntheticCatalog, created_at_bounds
+
+def generate_catalog(size: int, seed: int = 0) -> List[Dict[str, Any]]:
+    return list(SyntheticCatalog(size, seed=seed))
+
+class LeakyBucket:
+    def __init__(self, size: int, leak_rate: float):
+        self.size = size
+        self.leak_rate = leak_rate
+        self.level = 0.0
+        self._updated = time.monotonic()
+
+    def take(self) -> Optional[float]:
+        """Record a call; returns seconds to wait if the bucket is full"""
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self._updated) * self.leak_rate)
+        self._updated = now
+        if self.level + 1 > self.size:
+            return (self.level + 1 - self.size) / self.leak_rate
+        self.level += 1
+        return None
+
+def _encode_page_info(state: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+def _decode_page_info(page_info: str) -> Dict[str, Any]:
+    return json.loads(base64.urlsafe_b64decode(page_info.encode()))
+
+def create_app(
+    products: Optional[Sequence[Dict[str, Any]]] = None,
+    catalog_size: int = 1000,
+    latency_ms: float = 20,
+    bucket_size: int = 40,
+    leak_rate: float = 2.0,
+    seed: int = 0
+) -> FastAPI:
+    """``products`` must be ordered by created_at; by default a lazy synthetic catalog is served"""
+    bucket = LeakyBucket(bucket_size, leak_rate)
+    app = FastAPI(title="Mock Shopify Admin API")
+    app.state.catalog = products if products is not None else SyntheticCatalog(catalog_size, seed=seed)
+    app.state.calls = 0
+    app.state.throttled = 0
+    app.state.alerts = deque(maxlen=1000)
+
+    @app.get("/admin/api/{version}/products.json")
+    async def list_products(
+        request: Request,
+        version: str,
+        limit: int = Query(50, ge=1, le=250),
+        page_info: Optional[str] = None,
+        created_at_min: Optional[str] = None,
+        created_at_max: Optional[str] = None
+    ):
+        app.state.calls += 1
+        wait = bucket.take()
+        if wait is not None:
+            app.state.throttled += 1
+            return JSONResponse(
+                status_code=429,
+                content={"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."},
+                headers={"Retry-After": f"{wait:.2f}"}
+            )
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+        if page_info:
+            state = _decode_page_info(page_info)
+        else:
+            state = {"offset": 0, "min": created_at_min, "max": created_at_max}
+
+        low, high = created_at_bounds(app.state.catalog, state["min"], state["max"])
+        start = low + state["offset"]
+        page = app.state.catalog[start:min(start + limit, high)]
+
+        headers = {"X-Shopify-Shop-Api-Call-Limit": f"{int(bucket.level)}/{bucket.size}"}
+        if start + limit < high:
+            next_info = _encode_page_info({**state, "offset": state["offset"] + limit})
+            next_url = request.url.replace_query_params(limit=limit, page_info=next_info)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return JSONResponse(content={"products": page}, headers=headers)
+
+    @app.post("/_mock/advance")
+    async def advance_catalog(generations: int = 1):
+        """Move a synthetic catalog to a later generation, changing some products"""
+        if not isinstance(app.state.catalog, SyntheticCatalog):
+            return JSONResponse(status_code=400, content={"detail": "Catalog is not synthetic"})
+        app.state.catalog = app.state.catalog.advance(generations)
+        return {"generation": app.state.catalog.generation}
+
+    @app.post("/_mock/alerts")
+    async def receive_alerts(request: Request):
+        """Stand-in for a merchant's alert webhook; keeps the latest deliveries"""
+        payload = await request.json()
+        app.state.alerts.extend(payload.get("alerts", []))
+        return {"received": len(payload.get("alerts", []))}
+
+    @app.get("/_mock/alerts")
+    async def list_alerts(limit: int = Query(100, ge=1, le=1000)):
+        return {"alerts": list(app.state.alerts)[-limit:]}
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--bucket-size", type=int, default=40)
+    parser.add_argument("--leak-rate", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(
+            catalog_size=args.products,
+            seed=args.seed,
+            latency_ms=args.latency_ms,
+            bucket_size=args.bucket_size,
+            leak_rate=args.leak_rate
+        ),
+        port=args.port
+    )
@@ -1,15 +1,116 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import BigInteger, Column, Index, Integer, String, Float, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped
 from .database import Base
 from datetime import datetime
 
+# Highest threshold accepted by the low-stock endpoint; bounds the partial index
+MAX_INVENTORY_THRESHOLD = 1000
+
+# Shop key for single-store deployments and rows written before multi-store sync
+DEFAULT_SHOP = "default"
+
 class Product(Base):
     __tablename__ = "products"
     id = Column(Integer, primary_key=True, index=True)
-    shopify_id = Column(String, unique=True, index=True)
+    # Products are partitioned by shop; shopify_id is only unique within one
+    shop = Column(String, nullable=False, default=DEFAULT_SHOP, server_default=DEFAULT_SHOP)
+    shopify_id = Column(String, nullable=False)
     title = Column(String)
     inventory = Column(Integer, default=0)
     previous_inventory = Column(Integer, default=0)
     inventory_change = Column(Integer, default=0)
     price = Column(Float)
-    last_synced = Column(DateTime, default=datetime.utcnow)
+    last_synced = Column(DateTime, default=datetime.utcnow, index=True)
+    # Hash of title, price and inventory used to skip unchanged rows during sync
+    fingerprint = Column(String(16))
+    # Upstream updated_at of the last applied webhook; older deliveries are dropped
+    upstream_updated_at = Column(DateTime)
+    # Overrides the default low stock threshold for alerts; null uses the default
+    low_stock_threshold = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Upsert conflict target; also serves per-shop lookups by shopify_id
+        UniqueConstraint("shop", "shopify_id", name="uq_products_shop_shopify_id"),
+        # Serves low-stock filtering and its (inventory, id) ordering without a sort
+        Index(
+            "ix_products_low_inventory",
+            "inventory",
+            "id",
+            postgresql_where=inventory <= MAX_INVENTORY_THRESHOLD,
+            sqlite_where=inventory <= MAX_INVENTORY_THRESHOLD,
+        ),
+        # The same for one shop's low-stock list
+        Index(
+            "ix_products_shop_low_inventory",
+            "shop",
+            "inventory",
+            "id",
+            postgresql_where=inventory <= MAX_INVENTORY_THRESHOLD,
+            sqlite_where=inventory <= MAX_INVENTORY_THRESHOLD,
+        ),
+        # Per-shop staleness checks after a store's sync
+        Index("ix_products_shop_last_synced", "shop", "last_synced"),
+    )
+
+class InventorySummary(Base):
+    """Single-row rollup of products, kept current by deltas from every write"""
+    __tablename__ = "inventory_summary"
+    id = Column(Integer, primary_key=True)
+    total_inventory = Column(BigInteger, nullable=False, default=0)
+    product_count = Column(Integer, nullable=False, default=0)
+    low_stock_count = Column(Integer, nullable=False, default=0)
+    out_of_stock_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class InventoryEvent(Base):
+    """Append-only inventory movements; pruned by age rather than updated"""
+    __tablename__ = "inventory_events"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    recorded_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    delta = Column(Integer, nullable=False)
+    inventory = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_inventory_events_product_time", "product_id", "recorded_at"),
+        Index("ix_inventory_events_recorded_at", "recorded_at"),
+    )
+
+class ProcessedWebhook(Base):
+    """Delivery ids of applied webhooks, kept long enough to reject Shopify retries"""
+    __tablename__ = "processed_webhooks"
+    webhook_id = Column(String(64), primary_key=True)
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class SyncRunRecord(Base):
+    """Ledger of sync runs: one row per run, updated as it progresses"""
+    __tablename__ = "sync_runs"
+    id = Column(String(32), primary_key=True)
+    trigger = Column(String(16), nullable=False)
+    status = Column(String(16), nullable=False, default="running")
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    fetched = Column(Integer, nullable=False, default=0)
+    created = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    unchanged = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    fetch_seconds = Column(Float, nullable=False, default=0.0)
+    diff_seconds = Column(Float, nullable=False, default=0.0)
+    write_seconds = Column(Float, nullable=False, default=0.0)
+    # Server defaults let app.migrations add these to ledgers that already have rows
+    shops = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_shops = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # Latest run and newest-first paging
+        Index("ix_sync_runs_started_at", "started_at", "id"),
+        # Last successful run
+        Index("ix_sync_runs_status_finished_at", "status", "finished_at"),
+    )
+
+class SchemaVersion(Base):
+    """Single row holding the number of app.migrations steps applied"""
+    __tablename__ = "schema_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
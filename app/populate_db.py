@@ -1,102 +1,92 @@
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from .database import SessionLocal, engine
+from . import crud
+from . import migrations
 from . import models
-from . import schemas
+from .catalog_generator import SyntheticCatalog
+from array import array
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
 import random
-from datetime import datetime
+import time
 
-# Ensure tables exist
-models.Base.metadata.create_all(bind=engine)
+# Ensure tables exist and are up to date
+migrations.upgrade(engine)
 
-# Mock product data
-mock_products = [
-    {
-        "shopify_id": "mock_001",
-        "title": "Classic T-Shirt",
-        "inventory": random.randint(0, 100),
-        "price": 29.99
-    },
-    {
-        "shopify_id": "mock_002",
-        "title": "Vintage Jeans",
-        "inventory": random.randint(0, 50),
-        "price": 89.99
-    },
-    {
-        "shopify_id": "mock_003",
-        "title": "Running Shoes",
-        "inventory": random.randint(0, 30),
-        "price": 119.99
-    },
-    {
-        "shopify_id": "mock_004",
-        "title": "Summer Dress",
-        "inventory": random.randint(5, 75),
-        "price": 69.99
-    },
-    {
-        "shopify_id": "mock_005",
-        "title": "Leather Wallet",
-        "inventory": random.randint(10, 200),
-        "price": 49.99
-    },
-    {
-        "shopify_id": "mock_006",
-        "title": "Sunglasses",
-        "inventory": random.randint(0, 150),
-        "price": 159.99
-    },
-    {
-        "shopify_id": "mock_007",
-        "title": "Backpack",
-        "inventory": random.randint(5, 50),
-        "price": 79.99
-    },
-    {
-        "shopify_id": "mock_008",
-        "title": "Watch",
-        "inventory": random.randint(0, 25),
-        "price": 299.99
-    },
-    {
-        "shopify_id": "mock_009",
-        "title": "Sneakers",
-        "inventory": random.randint(10, 100),
-        "price": 89.99
-    },
-    {
-        "shopify_id": "mock_010",
-        "title": "Baseball Cap",
-        "inventory": random.randint(20, 200),
-        "price": 24.99
-    }
-]
+def _insert_products(db: Session, catalog: SyntheticCatalog, levels: array, now: datetime, batch_size: int) -> None:
+    index = 0
+    for rows in catalog.iter_rows(batch_size):
+        for row in rows:
+            row["inventory"] = levels[index]
+            index += 1
+            row["previous_inventory"] = row["inventory"]
+            row["inventory_change"] = 0
+            row["last_synced"] = now
+            row["fingerprint"] = crud.product_fingerprint(row["title"], row["price"], row["inventory"])
+        db.execute(insert(models.Product), rows)
+        db.commit()
+
+def _product_ids(db: Session) -> array:
+    """Database ids in catalog order; fixed-width shopify ids sort like their index"""
+    result = db.execute(
+        select(models.Product.id).order_by(models.Product.shopify_id).execution_options(yield_per=10000)
+    )
+    return array("q", (product_id for product_id, in result))
 
-def populate_db():
+def populate_db(
+    products: int = 10,
+    events: int = 0,
+    seed: Optional[int] = None,
+    days: int = 30,
+    batch_size: int = 5000
+):
+    """Replace the catalog with a synthetic one and optionally simulate its history"""
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    catalog = SyntheticCatalog(products, seed=seed)
     db = SessionLocal()
+    started = time.perf_counter()
     try:
         # Clear existing products
-        db.query(models.Product).delete()
-        
-        # Add new products
-        for product_data in mock_products:
-            product = models.Product(
-                shopify_id=product_data["shopify_id"],
-                title=product_data["title"],
-                inventory=product_data["inventory"],
-                price=product_data["price"],
-                last_synced=datetime.utcnow()
-            )
-            db.add(product)
-        
+        db.execute(delete(models.InventoryEvent))
+        db.execute(delete(models.Product))
+        db.commit()
+
+        end = datetime.utcnow()
+        start = end - timedelta(days=days)
+
+        # First pass only plays the history forward to find today's stock levels
+        levels = catalog.inventory_levels()
+        for _ in catalog.iter_events(events, levels, start, end, batch_size):
+            pass
+        _insert_products(db, catalog, levels, end, batch_size)
+
+        # Second pass replays the same history and writes it
+        if events:
+            ids = _product_ids(db)
+            levels = catalog.inventory_levels()
+            for batch in catalog.iter_events(events, levels, start, end, batch_size):
+                db.execute(insert(models.InventoryEvent), [
+                    {
+                        "product_id": ids[event.index],
+                        "recorded_at": event.recorded_at,
+                        "delta": event.delta,
+                        "inventory": event.inventory,
+                    }
+                    for event in batch
+                ])
+                db.commit()
+
+        # Rows were replaced wholesale, so recompute the summary instead of applying deltas
+        summary = crud.rebuild_inventory_summary(db)
         db.commit()
-        print(f"Successfully added {len(mock_products)} products to the database!")
-        
-        # Print out the products for verification
-        products = db.query(models.Product).all()
-        for product in products:
-            print(f"Added: {product.title} - Inventory: {product.inventory}, Price: ${product.price}")
-            
+        print(
+            f"Successfully added {products} products and {events} inventory events "
+            f"in {time.perf_counter() - started:.1f}s (seed {seed})"
+        )
+        print(f"Summary: {summary}")
+
     except Exception as e:
         print(f"Error populating database: {e}")
         db.rollback()
@@ -104,4 +94,17 @@ def populate_db():
         db.close()
 
 if __name__ == "__main__":
-    populate_db() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(prog="python -m app.populate_db")
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--events", type=int, default=0, help="Inventory movements to simulate")
+    parser.add_argument("--seed", type=int, help="Defaults to a random seed")
+    parser.add_argument("--days", type=int, default=30, help="History window for simulated events")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    populate_db(
+        products=args.products,
+        events=args.events,
+        seed=args.seed,
+        days=args.days,
+        batch_size=args.batch_size
+    )
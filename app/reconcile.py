@@ -0,0 +1,210 @@
+"""Diff a shop's upstream catalog against the products table without writing it.
+
+Upstream pages arrive in created_at order, so they are first staged in a
+temporary table. Both sides are then read ordered by shopify_id through
+server-side cursors and merge-joined in one pass, holding one chunk of
+each at a time however large the catalog is. Differences the caller
+selects are recorded in a second temporary table during the merge and
+applied afterwards in the same transaction.
+"""
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, select
+from sqlalchemy.orm import Session
+from . import crud, models
+
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "5000"))
+RECONCILE_SAMPLE_SIZE = int(os.getenv("RECONCILE_SAMPLE_SIZE", "100"))
+
+# Fields a sync can change, compared one by one
+DIFF_FIELDS = ("title", "inventory", "price")
+ACTIONS = ("added", "removed", "changed")
+
+_metadata = MetaData()
+upstream_table = Table(
+    "reconcile_upstream",
+    _metadata,
+    Column("seq", Integer, nullable=False),
+    Column("shopify_id", String, nullable=False),
+    Column("title", String, nullable=False),
+    Column("inventory", Integer, nullable=False),
+    Column("price", Float, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+Index("ix_reconcile_upstream_key", upstream_table.c.shopify_id, upstream_table.c.seq)
+
+selected_table = Table(
+    "reconcile_selected",
+    _metadata,
+    Column("shopify_id", String, primary_key=True),
+    Column("action", String(8), nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+def create_tables(db: Session) -> None:
+    connection = db.connection()
+    for table in (upstream_table, selected_table):
+        table.drop(connection, checkfirst=True)
+        table.create(connection)
+
+def drop_tables(db: Session) -> None:
+    connection = db.connection()
+    for table in (selected_table, upstream_table):
+        table.drop(connection, checkfirst=True)
+
+def stage_upstream(db: Session, rows: List[Dict[str, Any]], first_seq: int) -> None:
+    """Append one page of upstream products; later occurrences of a SKU win"""
+    if rows:
+        db.execute(upstream_table.insert(), [
+            {"seq": first_seq + offset, **{key: row[key] for key in ("shopify_id", *DIFF_FIELDS)}}
+            for offset, row in enumerate(rows)
+        ])
+
+def _key_order(db: Session, column: Any) -> Any:
+    # The merge compares ids in Python, so the database must sort by code point too
+    if db.get_bind().dialect.name == "postgresql":
+        return column.collate("C")
+    return column
+
+def _last_per_id(rows: Iterable[Any]) -> Iterator[Any]:
+    """Collapse runs of the same shopify_id in (shopify_id, seq) order to their last row"""
+    previous = None
+    for row in rows:
+        if previous is not None and row.shopify_id != previous.shopify_id:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+def _upstream_rows(db: Session, chunk_size: int) -> Iterator[Any]:
+    staged = upstream_table.c
+    return _last_per_id(db.execute(
+        select(staged.shopify_id, staged.title, staged.inventory, staged.price)
+        .order_by(_key_order(db, staged.shopify_id), staged.seq)
+        .execution_options(yield_per=chunk_size)
+    ))
+
+def _product_rows(db: Session, shop: str, chunk_size: int) -> Iterator[Any]:
+    product = models.Product
+    return iter(db.execute(
+        select(product.id, product.shopify_id, product.title, product.inventory, product.price)
+        .where(product.shop == shop)
+        .order_by(_key_order(db, product.shopify_id))
+        .execution_options(yield_per=chunk_size)
+    ))
+
+def merge_diff(upstream: Iterator[Any], existing: Iterator[Any]) -> Iterator[Tuple[str, Any, Any]]:
+    """Full outer merge join of two shopify_id-ordered streams as (action, db row, upstream row)"""
+    incoming = next(upstream, None)
+    current = next(existing, None)
+    while incoming is not None or current is not None:
+        if current is None or (incoming is not None and incoming.shopify_id < current.shopify_id):
+            yield "added", None, incoming
+            incoming = next(upstream, None)
+        elif incoming is None or current.shopify_id < incoming.shopify_id:
+            yield "removed", current, None
+            current = next(existing, None)
+        else:
+            yield ("changed" if field_changes(current, incoming) else "unchanged"), current, incoming
+            incoming = next(upstream, None)
+            current = next(existing, None)
+
+def field_changes(current: Any, incoming: Any) -> Dict[str, Dict[str, Any]]:
+    return {
+        field: {"from": getattr(current, field), "to": getattr(incoming, field)}
+        for field in DIFF_FIELDS
+        if getattr(current, field) != getattr(incoming, field)
+    }
+
+def _record(action: str, current: Any, incoming: Any) -> Dict[str, Any]:
+    record = {
+        "action": action,
+        "shopify_id": (incoming if incoming is not None else current).shopify_id,
+        "product_id": current.id if current is not None else None,
+    }
+    if action == "added":
+        record["upstream"] = {field: getattr(incoming, field) for field in DIFF_FIELDS}
+    elif action == "removed":
+        record["db"] = {field: getattr(current, field) for field in DIFF_FIELDS}
+    else:
+        record["changes"] = field_changes(current, incoming)
+    return record
+
+def reconcile_staged(
+    db: Session,
+    shop: str,
+    apply: Optional[Set[str]] = None,
+    ids: Optional[Set[str]] = None,
+    on_record: Optional[Callable[[Dict[str, Any]], None]] = None,
+    sample_size: int = RECONCILE_SAMPLE_SIZE,
+    chunk_size: int = RECONCILE_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """Merge the staged upstream catalog with the shop's products.
+
+    Every difference goes to ``on_record``; the first ``sample_size`` are
+    also returned. Differences whose action is in ``apply`` (and whose
+    shopify_id is in ``ids``, when given) are written; the caller commits.
+    """
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    sample: List[Dict[str, Any]] = []
+    selected: List[Dict[str, str]] = []
+    for action, current, incoming in merge_diff(_upstream_rows(db, chunk_size), _product_rows(db, shop, chunk_size)):
+        counts[action] += 1
+        if action == "unchanged":
+            continue
+        record = _record(action, current, incoming)
+        if len(sample) < sample_size:
+            sample.append(record)
+        if on_record is not None:
+            on_record(record)
+        if apply and action in apply and (ids is None or record["shopify_id"] in ids):
+            selected.append({"shopify_id": record["shopify_id"], "action": action})
+            if len(selected) >= chunk_size:
+                db.execute(selected_table.insert(), selected)
+                selected = []
+    if selected:
+        db.execute(selected_table.insert(), selected)
+
+    differences = counts["added"] + counts["removed"] + counts["changed"]
+    return {
+        "status": "success",
+        "shop": shop,
+        **counts,
+        "applied": _apply_selected(db, shop, chunk_size) if apply else None,
+        "sample": sample,
+        "truncated": differences > len(sample),
+    }
+
+def _apply_selected(db: Session, shop: str, chunk_size: int) -> Dict[str, int]:
+    """Write the selected differences through the same paths a sync uses"""
+    staged = upstream_table.c
+    chosen = selected_table.c
+    applied = {"created": 0, "updated": 0, "deleted": 0}
+
+    upserts = db.execute(
+        select(staged.shopify_id, staged.title, staged.inventory, staged.price)
+        .join(selected_table, chosen.shopify_id == staged.shopify_id)
+        .where(chosen.action != "removed")
+        .order_by(staged.shopify_id, staged.seq)
+        .execution_options(yield_per=chunk_size)
+    )
+    chunk: List[Dict[str, Any]] = []
+    for row in _last_per_id(upserts):
+        chunk.append(row._asdict())
+        if len(chunk) >= chunk_size:
+            _upsert(db, chunk, shop, applied)
+            chunk = []
+    if chunk:
+        _upsert(db, chunk, shop, applied)
+
+    removals = db.execute(
+        select(chosen.shopify_id).where(chosen.action == "removed").execution_options(yield_per=chunk_size)
+    )
+    for rows in removals.partitions(chunk_size):
+        applied["deleted"] += crud.delete_products(db, [row.shopify_id for row in rows], shop=shop)
+    return applied
+
+def _upsert(db: Session, rows: List[Dict[str, Any]], shop: str, applied: Dict[str, int]) -> None:
+    counts = crud.bulk_upsert_products(db, rows, delta=False, shop=shop)
+    applied["created"] += counts["created"]
+    applied["updated"] += counts["updated"]
@@ -1,12 +1,17 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
 from typing import Optional
+from .models import DEFAULT_SHOP
+
+# Served for nullable product columns
+PRODUCT_NULL_DEFAULTS = {"title": "", "inventory": 0, "price": 0.0, "previous_inventory": 0, "inventory_change": 0}
 
 class ProductBase(BaseModel):
     shopify_id: str
     title: str
     inventory: int
     price: float
+    shop: str = DEFAULT_SHOP
 
 class ProductCreate(ProductBase):
     pass
@@ -20,7 +25,20 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+    @field_validator(*PRODUCT_NULL_DEFAULTS, mode="before")
+    @classmethod
+    def _null_as_default(cls, value, info):
+        return PRODUCT_NULL_DEFAULTS[info.field_name] if value is None else value
+
+class LowStockThresholdUpdate(BaseModel):
+    # None clears the override so the default threshold applies
+    low_stock_threshold: Optional[int] = Field(None, ge=0)
+
 class WebhookInventoryUpdate(BaseModel):
     product_id: str
     inventory: int
     title: Optional[str] = None
+    shop: str = DEFAULT_SHOP
+    # Upstream version used for ordering (naive UTC) and the delivery id used for dedupe
+    updated_at: Optional[datetime] = None
+    webhook_id: Optional[str] = None
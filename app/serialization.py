@@ -0,0 +1,47 @@
+import json
+from datetime import datetime
+from typing import Any, Sequence
+from sqlalchemy import func
+from . import models, schemas
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+def _or_default(column):
+    # Nulls read as the value schemas.Product validates them to
+    return func.coalesce(column, schemas.PRODUCT_NULL_DEFAULTS[column.key]).label(column.key)
+
+# Same fields, in the same order, as schemas.Product serializes them
+PRODUCT_COLUMNS = (
+    models.Product.shopify_id,
+    _or_default(models.Product.title),
+    _or_default(models.Product.inventory),
+    _or_default(models.Product.price),
+    models.Product.shop,
+    models.Product.id,
+    _or_default(models.Product.previous_inventory),
+    _or_default(models.Product.inventory_change),
+    models.Product.last_synced,
+)
+PRODUCT_FIELDS = tuple(column.key for column in PRODUCT_COLUMNS)
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), default=_default).encode()
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def encode_product_rows(rows: Sequence[Sequence[Any]]) -> bytes:
+    """Encode PRODUCT_COLUMNS tuples as a schemas.Product JSON array without per-row validation"""
+    return dumps([dict(zip(PRODUCT_FIELDS, row)) for row in rows])
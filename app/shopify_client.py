@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlparse
+import httpx
+from .models import DEFAULT_SHOP
+
+logger = logging.getLogger(__name__)
+
+SHOPIFY_SHOP_URL = os.getenv("SHOPIFY_SHOP_URL")
+SHOPIFY_ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
+SHOPIFY_API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2024-01")
+SHOPIFY_PAGE_SIZE = int(os.getenv("SHOPIFY_PAGE_SIZE", "250"))
+SHOPIFY_CONCURRENCY = int(os.getenv("SHOPIFY_CONCURRENCY", "4"))
+# Created-at windows a full fetch is split into so they can be paged concurrently (1 = one cursor walk)
+SHOPIFY_PARTITIONS = int(os.getenv("SHOPIFY_PARTITIONS", str(SHOPIFY_CONCURRENCY)))
+# REST Admin API leaky bucket: 2 requests/second with a burst of 40
+SHOPIFY_RATE_LIMIT = float(os.getenv("SHOPIFY_RATE_LIMIT", "2"))
+SHOPIFY_RATE_BURST = int(os.getenv("SHOPIFY_RATE_BURST", "40"))
+SHOPIFY_MAX_RETRIES = int(os.getenv("SHOPIFY_MAX_RETRIES", "5"))
+# Multi-store: JSON object mapping a shop key to {"url", "token"} and
+# optionally its own "rate_limit" and "rate_burst"
+SHOPIFY_SHOPS = os.getenv("SHOPIFY_SHOPS")
+
+@lru_cache(maxsize=None)
+def configured_shops() -> Dict[str, Dict[str, Any]]:
+    """Stores to sync by shop key; a lone SHOPIFY_SHOP_URL is the default shop"""
+    if SHOPIFY_SHOPS:
+        shops = json.loads(SHOPIFY_SHOPS)
+        for shop, config in shops.items():
+            if not config.get("url"):
+                raise RuntimeError(f"SHOPIFY_SHOPS entry {shop!r} has no url")
+        return shops
+    if SHOPIFY_SHOP_URL:
+        return {DEFAULT_SHOP: {"url": SHOPIFY_SHOP_URL, "token": SHOPIFY_ACCESS_TOKEN}}
+    return {}
+
+def shop_for_domain(domain: Optional[str]) -> Optional[str]:
+    """Shop key for an X-Shopify-Shop-Domain value; None if it is not a configured store"""
+    if not SHOPIFY_SHOPS:
+        return DEFAULT_SHOP
+    for shop, config in configured_shops().items():
+        if domain and domain in (shop, urlparse(config["url"]).hostname):
+            return shop
+    return None
+
+class TokenBucket:
+    """Client-side call budget shared by every request to one shop"""
+
+    def __init__(self, rate: float = SHOPIFY_RATE_LIMIT, capacity: int = SHOPIFY_RATE_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for ``seconds`` (e.g. after a 429)"""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+def normalize_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten an Admin API product into the shape the sync pipeline expects"""
+    variants = product.get("variants")
+    if variants:
+        inventory = sum(variant.get("inventory_quantity") or 0 for variant in variants)
+        price = variants[0].get("price") or 0
+    else:
+        inventory = product.get("inventory_quantity") or 0
+        price = product.get("price") or 0
+    return {
+        "id": str(product["id"]),
+        "title": product.get("title") or "",
+        "inventory_quantity": inventory,
+        "price": float(price),
+    }
+
+def created_at_partitions(start: datetime, end: datetime, count: int) -> List[Dict[str, str]]:
+    """Split a creation-time range into equal windows that can be paged concurrently.
+
+    The first window has no lower bound and the last no upper bound, so
+    products created outside ``start``..``end`` are still covered.
+    """
+    step = (end - start) / count
+    partitions = []
+    for i in range(count):
+        partition = {}
+        if i > 0:
+            partition["created_at_min"] = (start + step * i).isoformat()
+        if i < count - 1:
+            partition["created_at_max"] = (start + step * (i + 1)).isoformat()
+        partitions.append(partition)
+    return partitions
+
+_DONE = object()
+
+class ShopifyFetcher:
+    """Pages through the products endpoint over one pooled keep-alive client.
+
+    Each partition (a dict of query filters) follows its own cursor
+    pagination; up to ``concurrency`` partitions are walked at once. Without
+    explicit ``partitions`` the catalog is split into ``partition_count``
+    created_at windows from its oldest product to now. Pages go through a
+    small bounded queue so fetching overlaps with the caller's database
+    writes without buffering the catalog.
+    """
+
+    def __init__(
+        self,
+        shop_url: Optional[str] = SHOPIFY_SHOP_URL,
+        access_token: Optional[str] = SHOPIFY_ACCESS_TOKEN,
+        api_version: str = SHOPIFY_API_VERSION,
+        page_size: int = SHOPIFY_PAGE_SIZE,
+        concurrency: int = SHOPIFY_CONCURRENCY,
+        partitions: Optional[List[Dict[str, str]]] = None,
+        partition_count: int = SHOPIFY_PARTITIONS,
+        bucket: Optional[TokenBucket] = None,
+        max_retries: int = SHOPIFY_MAX_RETRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        if not shop_url:
+            raise RuntimeError("SHOPIFY_SHOP_URL is not set")
+        self.shop_url = shop_url.rstrip("/")
+        self.access_token = access_token
+        self.api_version = api_version
+        self.page_size = min(page_size, 250)
+        self.concurrency = concurrency
+        self.partitions = partitions
+        self.partition_count = partition_count
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {"requests": 0, "pages": 0, "products": 0, "throttled": 0, "retries": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            headers = {"Accept": "application/json"}
+            if self.access_token:
+                headers["X-Shopify-Access-Token"] = self.access_token
+            self._client = httpx.AsyncClient(
+                base_url=self.shop_url,
+                headers=headers,
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency
+                ),
+                transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int) -> float:
+        return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _observe_call_limit(self, response: httpx.Response) -> None:
+        # e.g. "32/40": slow down before the shop starts rejecting calls
+        header = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
+        if not header:
+            return
+        try:
+            used, limit = (int(part) for part in header.split("/"))
+        except ValueError:
+            return
+        if used >= 0.8 * limit:
+            self.bucket.pause((used - 0.8 * limit) / self.bucket.rate)
+
+    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+            await self.bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.TransportError as e:
+                last_error = e
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code == 429:
+                self.stats["throttled"] += 1
+                retry_after = float(response.headers.get("Retry-After", self._backoff(attempt)))
+                self.bucket.pause(retry_after)
+                last_error = httpx.HTTPStatusError("Throttled", request=response.request, response=response)
+                continue
+            if response.status_code >= 500:
+                last_error = httpx.HTTPStatusError(
+                    f"Server error {response.status_code}", request=response.request, response=response
+                )
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            response.raise_for_status()
+            self._observe_call_limit(response)
+            return response
+
+        raise RuntimeError(f"Shopify request to {url} failed after {self.max_retries} retries: {last_error}")
+
+    async def _walk(self, partition: Dict[str, str], queue: asyncio.Queue, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            url: Optional[str] = f"/admin/api/{self.api_version}/products.json"
+            params: Optional[Dict[str, Any]] = {"limit": self.page_size, **partition}
+            while url:
+                response = await self._get(url, params)
+                products = [normalize_product(product) for product in response.json().get("products", [])]
+                self.stats["pages"] += 1
+                self.stats["products"] += len(products)
+                if products:
+                    await queue.put(products)
+                # The next link carries page_info and the original filters
+                url = response.links.get("next", {}).get("url")
+                params = None
+
+    async def _default_partitions(self) -> List[Dict[str, str]]:
+        """created_at windows from the oldest product (the first by id) to now"""
+        if self.partition_count <= 1:
+            return [{}]
+        response = await self._get(
+            f"/admin/api/{self.api_version}/products.json", {"limit": 1, "fields": "id,created_at"}
+        )
+        products = response.json().get("products", [])
+        if not products or not products[0].get("created_at"):
+            return [{}]
+        # Admin API timestamps carry an offset; keep "now" comparable with naive ones too
+        start = datetime.fromisoformat(products[0]["created_at"].replace("Z", "+00:00"))
+        end = datetime.now(timezone.utc) if start.tzinfo else datetime.utcnow()
+        if end <= start:
+            return [{}]
+        return created_at_partitions(start, end, self.partition_count)
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield normalized product pages as soon as each one arrives"""
+        partitions = self.partitions or await self._default_partitions()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        walkers = [
+            asyncio.create_task(self._walk(partition, queue, semaphore))
+            for partition in partitions
+        ]
+
+        async def supervise():
+            results = await asyncio.gather(*walkers, return_exceptions=True)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            await queue.put((_DONE, errors[0] if errors else None))
+
+        supervisor = asyncio.create_task(supervise())
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, tuple) and item[0] is _DONE:
+                    if item[1] is not None:
+                        raise item[1]
+                    return
+                yield item
+        finally:
+            for task in (*walkers, supervisor):
+                task.cancel()
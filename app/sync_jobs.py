@@ -1,11 +1,312 @@
+from collections import OrderedDict
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
+import asyncio
+import contextvars
+import logging
+import os
 import random
-from . import models, schemas, crud
-from typing import List, Dict, Any
+import time
+import uuid
+from . import models, reconcile, schemas, crud, utils
+from .database import IS_SQLITE, AsyncSessionLocal
+from .catalog_generator import SyntheticCatalog
+from .instrumentation import record_sync_run
+from .shopify_client import SHOPIFY_RATE_BURST, SHOPIFY_RATE_LIMIT, ShopifyFetcher, TokenBucket, configured_shops
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Dict, Any, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "1000"))
+DEFAULT_SYNC_DELTA = os.getenv("SYNC_DELTA", "1") != "0"
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", "0"))
+SYNC_JITTER = float(os.getenv("SYNC_JITTER", "0.1"))
+# Minimum seconds between progress updates to a running sync's ledger row
+SYNC_PROGRESS_INTERVAL = float(os.getenv("SYNC_PROGRESS_INTERVAL", "2"))
+# A non-zero size makes the mock client serve a generated catalog of that many SKUs
+MOCK_CATALOG_SIZE = int(os.getenv("MOCK_CATALOG_SIZE", "0"))
+MOCK_CATALOG_SEED = int(os.getenv("MOCK_CATALOG_SEED", "0"))
+# Number of simulated stores when no real shop is configured
+MOCK_SHOPS = int(os.getenv("MOCK_SHOPS", "1"))
+# Shops synced at once, and the most one shop's sync may take (0 = no limit)
+SYNC_MAX_WORKERS = int(os.getenv("SYNC_MAX_WORKERS", "4"))
+SYNC_SHOP_TIMEOUT_SECONDS = float(os.getenv("SYNC_SHOP_TIMEOUT_SECONDS", "1800"))
+
+class BaseShopifySync:
+    """Sync pipeline shared by the mock and the real Shopify clients.
+
+    Subclasses provide ``fetch_products`` or, to stream large catalogs,
+    ``iter_product_pages``.
+    """
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        delta: Optional[bool] = None,
+        shop: str = models.DEFAULT_SHOP
+    ):
+        # Store whose products this client reads and writes
+        self.shop = shop
+        # Number of products written per upsert statement during a bulk sync
+        self.chunk_size = chunk_size or DEFAULT_SYNC_CHUNK_SIZE
+        # Skip rewriting products whose fingerprint did not change upstream
+        self.delta = DEFAULT_SYNC_DELTA if delta is None else delta
+
+    async def fetch_products(self) -> List[Dict[Any, Any]]:
+        raise NotImplementedError
+
+    async def iter_product_pages(self) -> AsyncIterator[List[Dict[Any, Any]]]:
+        """Yield the upstream catalog in chunk_size pages"""
+        products = await self.fetch_products()
+        for start in range(0, len(products), self.chunk_size):
+            yield products[start:start + self.chunk_size]
+
+    async def iter_preview_pages(self) -> AsyncIterator[List[Dict[Any, Any]]]:
+        """Pages the next sync would read, for reconciliation"""
+        async for page in self.iter_product_pages():
+            yield page
+
+    async def aclose(self) -> None:
+        """Release upstream connections"""
+
+    async def sync_products(
+        self,
+        db: AsyncSession,
+        progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Stream upstream pages into set-based upserts committed as one transaction.
+
+        ``progress`` is awaited after every page with the running totals.
+        """
+        counts = {"fetched": 0, "created": 0, "updated": 0, "unchanged": 0}
+        phases = {"fetch": 0.0, "diff": 0.0, "write": 0.0}
+        # Decided once, before anything is written
+        dialect = db.bind.dialect.name
+        bulk = crud.supports_bulk_upsert(dialect)
+        if not bulk:
+            logger.warning(f"Bulk sync is not supported on {dialect}, using per-row sync")
+        try:
+            pages = self.iter_product_pages().__aiter__()
+            while True:
+                started = time.perf_counter()
+                try:
+                    products = await pages.__anext__()
+                except StopAsyncIteration:
+                    break
+                phases["fetch"] += time.perf_counter() - started
+                counts["fetched"] += len(products)
+
+                if bulk:
+                    page_counts = await db.run_sync(self._bulk_sync, products, phases)
+                else:
+                    started = time.perf_counter()
+                    page_counts = await db.run_sync(self._sync_per_row, products)
+                    phases["write"] += time.perf_counter() - started
+                for key in page_counts:
+                    counts[key] += page_counts[key]
+                if progress is not None:
+                    await progress(self._totals(counts, phases))
+
+            started = time.perf_counter()
+            await db.commit()
+            phases["write"] += time.perf_counter() - started
+
+            return {
+                "status": "success",
+                **self._totals(counts, phases),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+
+        except Exception as e:
+            await db.rollback()
+            return {
+                "status": "error",
+                "error": str(e),
+                # Work done before the failure; none of it was committed
+                **self._totals(counts, phases),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+
+    async def reconcile(
+        self,
+        db: AsyncSession,
+        apply: Optional[Set[str]] = None,
+        ids: Optional[Set[str]] = None,
+        on_record: Optional[Callable[[Dict[str, Any]], None]] = None,
+        sample_size: int = reconcile.RECONCILE_SAMPLE_SIZE
+    ) -> Dict[str, Any]:
+        """Diff the upstream catalog against this shop's products.
+
+        A dry run unless ``apply`` names actions (added, removed, changed) to
+        write, optionally limited to ``ids``. Memory is bounded by one page
+        and one merge chunk per side; see app.reconcile.
+        """
+        started = time.perf_counter()
+        try:
+            await db.run_sync(reconcile.create_tables)
+            fetched = 0
+            async for products in self.iter_preview_pages():
+                rows = [self._to_product_create(product).model_dump() for product in products]
+                await db.run_sync(reconcile.stage_upstream, rows, fetched)
+                fetched += len(rows)
+            result = await db.run_sync(
+                reconcile.reconcile_staged, self.shop, apply, ids, on_record, sample_size
+            )
+            if apply:
+                await db.run_sync(reconcile.drop_tables)
+                await db.commit()
+            else:
+                # Nothing to keep; rolling back also discards the staged catalog
+                await db.rollback()
+            return {
+                **result,
+                "products_fetched": fetched,
+                "dry_run": not apply,
+                "elapsed_s": round(time.perf_counter() - started, 3),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        except Exception as e:
+            await db.rollback()
+            return {
+                "status": "error",
+                "shop": self.shop,
+                "error": str(e),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+
+    @staticmethod
+    def _totals(counts: Dict[str, int], phases: Dict[str, float]) -> Dict[str, Any]:
+        return {
+            "products_fetched": counts["fetched"],
+            "products_updated": counts["updated"],
+            "products_created": counts["created"],
+            "products_unchanged": counts["unchanged"],
+            "phases": {phase: round(seconds, 4) for phase, seconds in phases.items()},
+        }
+
+    def _to_product_create(self, mock_product: Dict[Any, Any]) -> schemas.ProductCreate:
+        return schemas.ProductCreate(
+            shopify_id=str(mock_product["id"]),
+            title=mock_product["title"],
+            inventory=mock_product["inventory_quantity"],
+            price=float(mock_product["price"]),
+            shop=self.shop
+        )
+
+    def _bulk_sync(
+        self,
+        db: Session,
+        products: List[Dict[Any, Any]],
+        timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, int]:
+        """Upsert one page in chunk_size statements; the caller commits"""
+        # Last occurrence wins so a chunk never touches the same row twice
+        rows = {}
+        for mock_product in products:
+            product_data = self._to_product_create(mock_product)
+            rows[product_data.shopify_id] = product_data.model_dump()
+        rows = list(rows.values())
+
+        counts = {"created": 0, "updated": 0, "unchanged": 0}
+        for start in range(0, len(rows), self.chunk_size):
+            chunk_counts = crud.bulk_upsert_products(
+                db, rows[start:start + self.chunk_size], delta=self.delta, timings=timings, shop=self.shop
+            )
+            for key in counts:
+                counts[key] += chunk_counts[key]
+        return counts
+
+    def _sync_per_row(self, db: Session, products: List[Dict[Any, Any]]) -> Dict[str, int]:
+        """Fallback for databases without ON CONFLICT support"""
+        updates = 0
+        creates = 0
+        unchanged = []
+
+        for mock_product in products:
+            product_data = self._to_product_create(mock_product)
+
+            # Check if product exists
+            existing_product = crud.get_product_by_shopify_id(
+                db, 
+                product_data.shopify_id,
+                self.shop
+            )
+
+            fingerprint = crud.product_fingerprint(
+                product_data.title, product_data.price, product_data.inventory
+            )
+
+            if self.delta and existing_product and existing_product.fingerprint == fingerprint:
+                unchanged.append(product_data.shopify_id)
+            elif existing_product:
+                # Calculate inventory change
+                new_inventory = product_data.inventory
+                old_inventory = existing_product.inventory
+                inventory_change = new_inventory - old_inventory
+
+                # Update existing product
+                crud.update_product(
+                    db,
+                    existing_product.id,
+                    {
+                        "title": product_data.title,
+                        "inventory": new_inventory,
+                        "previous_inventory": old_inventory,
+                        "inventory_change": inventory_change,
+                        "price": product_data.price
+                    }
+                )
+                updates += 1
+            else:
+                # Create new product with no change (first entry)
+                crud.create_product(
+                    db, 
+                    product_data,
+                    initial_inventory=product_data.inventory
+                )
+                creates += 1
+
+        crud.touch_products(db, unchanged, shop=self.shop)
+        db.commit()
+        return {"created": creates, "updated": updates, "unchanged": len(unchanged)}
+
+    async def get_sync_status(self, db: AsyncSession) -> Dict[str, Any]:
+        """Get current sync status and product counts"""
+        try:
+            total_products = await crud.count_products_async(db)
+            low_inventory = await crud.count_low_inventory_products_async(db, threshold=10)
+            latest = await crud.get_latest_sync_run_async(db)
+            last_success = latest if latest is not None and latest.status == "success" \
+                else await crud.get_latest_sync_run_async(db, status="success")
+            
+            return {
+                "status": "success",
+                "total_products": total_products,
+                "low_inventory_count": low_inventory,
+                "last_sync": last_success.finished_at.isoformat() if last_success else None,
+                "last_run": utils.sync_run_to_dict(latest) if latest else None
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e)
+            }
+
+class MockShopifySync(BaseShopifySync):
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        delta: Optional[bool] = None,
+        catalog: Optional[SyntheticCatalog] = None,
+        shop: str = models.DEFAULT_SHOP
+    ):
+        super().__init__(chunk_size=chunk_size, delta=delta, shop=shop)
+        # Optional large synthetic upstream; each sync sees its next generation
+        if catalog is None and MOCK_CATALOG_SIZE:
+            catalog = SyntheticCatalog(MOCK_CATALOG_SIZE, seed=MOCK_CATALOG_SEED)
+        self.catalog = catalog
 
-class MockShopifySync:
-    def __init__(self):
         # Mock product data for simulation
         self.mock_products = [
             {
@@ -129,96 +430,398 @@ class MockShopifySync:
                 "price": 149.99
             }
         ]
+        # Upstream state the next sync will read; drawn early by a reconcile preview
+        self._upcoming: Optional[List[Dict[Any, Any]]] = None
+
+    def _next_mock_products(self) -> List[Dict[Any, Any]]:
+        """Randomly modified inventory levels for the next sync, drawn once"""
+        if self._upcoming is None:
+            self._upcoming = [
+                {**product, "inventory_quantity": random.randint(0, 100)} for product in self.mock_products
+            ]
+        return self._upcoming
 
     async def fetch_products(self) -> List[Dict[Any, Any]]:
         """Mock fetching products from Shopify API"""
+        if self.catalog is not None:
+            self.catalog = self.catalog.advance()
+            return [product for page in self.catalog.iter_products() for product in page]
+
         # Randomly modify inventory levels to simulate changes
-        for product in self.mock_products:
-            product["inventory_quantity"] = random.randint(0, 100)
+        self.mock_products, self._upcoming = self._next_mock_products(), None
         return self.mock_products
 
-    async def sync_products(self, db: Session) -> Dict[str, Any]:
-        """Sync mock products to local database using CRUD operations"""
-        try:
-            products = await self.fetch_products()
-            updates = 0
-            creates = 0
-            
-            for mock_product in products:
-                # Convert mock data to ProductCreate schema
-                product_data = schemas.ProductCreate(
-                    shopify_id=str(mock_product["id"]),
-                    title=mock_product["title"],
-                    inventory=mock_product["inventory_quantity"],
-                    price=float(mock_product["price"])
-                )
+    async def iter_product_pages(self) -> AsyncIterator[List[Dict[Any, Any]]]:
+        if self.catalog is None:
+            async for page in super().iter_product_pages():
+                yield page
+            return
+        # Generate pages on demand so million-SKU catalogs are never held in memory
+        self.catalog = self.catalog.advance()
+        for page in self.catalog.iter_products(self.chunk_size):
+            yield page
+            await asyncio.sleep(0)
 
-                # Check if product exists
-                existing_product = crud.get_product_by_shopify_id(
-                    db, 
-                    product_data.shopify_id
-                )
+    async def iter_preview_pages(self) -> AsyncIterator[List[Dict[Any, Any]]]:
+        if self.catalog is None:
+            # The snapshot the next sync will read, so the preview matches it exactly
+            products = self._next_mock_products()
+            for start in range(0, len(products), self.chunk_size):
+                yield products[start:start + self.chunk_size]
+            return
+        # The generation the next sync will read, without moving to it
+        for page in self.catalog.advance().iter_products(self.chunk_size):
+            yield page
+            await asyncio.sleep(0)
+
+class ShopifySync(BaseShopifySync):
+    """Syncs from the Shopify Admin API, streaming pages as they arrive"""
+
+    def __init__(
+        self,
+        fetcher: Optional[ShopifyFetcher] = None,
+        chunk_size: Optional[int] = None,
+        delta: Optional[bool] = None,
+        shop: str = models.DEFAULT_SHOP
+    ):
+        super().__init__(chunk_size=chunk_size, delta=delta, shop=shop)
+        self.fetcher = fetcher or ShopifyFetcher()
+
+    async def fetch_products(self) -> List[Dict[Any, Any]]:
+        products = []
+        async for page in self.fetcher.iter_pages():
+            products.extend(page)
+        return products
 
-                if existing_product:
-                    # Calculate inventory change
-                    new_inventory = product_data.inventory
-                    old_inventory = existing_product.inventory
-                    inventory_change = new_inventory - old_inventory
-
-                    # Update existing product
-                    crud.update_product(
-                        db,
-                        existing_product.id,
-                        {
-                            "title": product_data.title,
-                            "inventory": new_inventory,
-                            "previous_inventory": old_inventory,
-                            "inventory_change": inventory_change,
-                            "price": product_data.price
-                        }
+    async def iter_product_pages(self) -> AsyncIterator[List[Dict[Any, Any]]]:
+        async for page in self.fetcher.iter_pages():
+            yield page
+
+    async def aclose(self) -> None:
+        await self.fetcher.aclose()
+
+def default_sync_clients() -> Dict[str, BaseShopifySync]:
+    """One client per configured store, each with its own API call budget.
+
+    Falls back to MOCK_SHOPS simulated stores when no real shop is configured.
+    """
+    shops = configured_shops()
+    if shops:
+        return {
+            shop: ShopifySync(
+                ShopifyFetcher(
+                    shop_url=config["url"],
+                    access_token=config.get("token"),
+                    bucket=TokenBucket(
+                        rate=float(config.get("rate_limit", SHOPIFY_RATE_LIMIT)),
+                        capacity=int(config.get("rate_burst", SHOPIFY_RATE_BURST))
                     )
-                    updates += 1
+                ),
+                shop=shop
+            )
+            for shop, config in shops.items()
+        }
+    if MOCK_SHOPS <= 1:
+        return {models.DEFAULT_SHOP: MockShopifySync()}
+    return {
+        f"mock-{i}": MockShopifySync(
+            shop=f"mock-{i}",
+            catalog=SyntheticCatalog(MOCK_CATALOG_SIZE, seed=MOCK_CATALOG_SEED + i) if MOCK_CATALOG_SIZE else None
+        )
+        for i in range(1, MOCK_SHOPS + 1)
+    }
+
+class SyncOrchestrator:
+    """Runs each shop's sync_products on a bounded pool of workers.
+
+    Every shop syncs in its own session and transaction, so a failing or
+    timed-out store is rolled back and reported on its own while the other
+    workers carry on. Wall time grows with shops / max_workers rather than
+    with the shop count. SQLite allows one writer, so it gets one worker.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, BaseShopifySync],
+        max_workers: int = SYNC_MAX_WORKERS,
+        shop_timeout: float = SYNC_SHOP_TIMEOUT_SECONDS
+    ):
+        self.clients = clients
+        self.max_workers = 1 if IS_SQLITE else max(1, max_workers)
+        self.shop_timeout = shop_timeout
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(client.aclose() for client in self.clients.values()), return_exceptions=True)
+
+    async def get_sync_status(self, db: AsyncSession) -> Dict[str, Any]:
+        status = await next(iter(self.clients.values())).get_sync_status(db)
+        status["shops"] = len(self.clients)
+        return status
+
+    async def sync_all(
+        self,
+        progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Sync every shop; totals are summed and per-shop results kept under ``shops``"""
+        results: Dict[str, Dict[str, Any]] = {}
+        running: Dict[str, Dict[str, Any]] = {}
+        shops = iter(self.clients)
+
+        async def report(shop: str, totals: Dict[str, Any]) -> None:
+            running[shop] = totals
+            await progress(_combine(running.values()))
+
+        async def worker() -> None:
+            # Workers share one iterator, so each shop is taken exactly once
+            for shop in shops:
+                results[shop] = await self._sync_shop(
+                    shop, None if progress is None else lambda totals, shop=shop: report(shop, totals)
+                )
+                running[shop] = results[shop]
+
+        await asyncio.gather(*(worker() for _ in range(min(self.max_workers, len(self.clients)))))
+
+        failed = {shop: result for shop, result in results.items() if result.get("status") != "success"}
+        if not failed:
+            status = "success"
+        elif len(failed) == len(results):
+            status = "error"
+        else:
+            status = "partial"
+        result = {
+            "status": status,
+            **_combine(results.values()),
+            "shops": results,
+            "shops_total": len(results),
+            "shops_failed": len(failed),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if failed:
+            result["error"] = "; ".join(f"{shop}: {failure.get('error')}" for shop, failure in failed.items())
+        return result
+
+    async def _sync_shop(
+        self,
+        shop: str,
+        progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]]
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                job = self.clients[shop].sync_products(db, progress=progress)
+                if self.shop_timeout > 0:
+                    result = await asyncio.wait_for(job, timeout=self.shop_timeout)
                 else:
-                    # Create new product with no change (first entry)
-                    crud.create_product(
-                        db, 
-                        product_data,
-                        initial_inventory=product_data.inventory
-                    )
-                    creates += 1
+                    result = await job
+        except asyncio.TimeoutError:
+            result = {"status": "error", "error": f"timed out after {self.shop_timeout:g}s"}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        if result.get("status") != "success":
+            logger.error(f"Sync of shop {shop} failed: {result.get('error')}")
+        result["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return result
 
-            return {
-                "status": "success",
-                "products_updated": updates,
-                "products_created": creates,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+def _combine(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum per-shop totals; phase seconds are summed across shops, not wall time"""
+    totals = {"products_fetched": 0, "products_updated": 0, "products_created": 0, "products_unchanged": 0}
+    phases = {"fetch": 0.0, "diff": 0.0, "write": 0.0}
+    for result in results:
+        for key in totals:
+            totals[key] += result.get(key, 0)
+        for phase, seconds in (result.get("phases") or {}).items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+    return {**totals, "phases": {phase: round(seconds, 4) for phase, seconds in phases.items()}}
+
+def _ledger_values(result: Dict[str, Any]) -> Dict[str, Any]:
+    """sync_runs columns from a (partial) sync result"""
+    phases = result.get("phases", {})
+    return {
+        "fetched": result.get("products_fetched", 0),
+        "created": result.get("products_created", 0),
+        "updated": result.get("products_updated", 0),
+        "unchanged": result.get("products_unchanged", 0),
+        "fetch_seconds": phases.get("fetch", 0.0),
+        "diff_seconds": phases.get("diff", 0.0),
+        "write_seconds": phases.get("write", 0.0),
+        "shops": result.get("shops_total", 0),
+        "failed_shops": result.get("shops_failed", 0),
+    }
+
+class SyncRun:
+    """One execution of the sync, shared by every caller that triggered it"""
+
+    def __init__(self, trigger: str):
+        self.id = uuid.uuid4().hex
+        self.trigger = trigger
+        self.status = "running"
+        self.started_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.joined = 0
+        self.done = asyncio.Event()
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        self.result = result
+        self.status = result.get("status", "error")
+        self.finished_at = datetime.utcnow()
+        self.done.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.id,
+            "status": self.status,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "joined": self.joined,
+            "result": self.result,
+        }
 
+class SyncService:
+    """Long-lived owner of the Shopify clients, started from the app lifespan.
+
+    Runs the sync periodically (SYNC_INTERVAL_SECONDS, 0 disables it) with
+    random jitter, and makes concurrent triggers join the in-flight run
+    instead of starting a competing one.
+    """
+
+    def __init__(
+        self,
+        client: Optional[BaseShopifySync] = None,
+        interval: float = SYNC_INTERVAL_SECONDS,
+        jitter: float = SYNC_JITTER,
+        history_size: int = 50,
+        clients: Optional[Dict[str, BaseShopifySync]] = None
+    ):
+        if clients is None:
+            clients = {client.shop: client} if client is not None else default_sync_clients()
+        self.orchestrator = SyncOrchestrator(clients)
+        self.interval = interval
+        self.jitter = jitter
+        self._current: Optional[SyncRun] = None
+        self._runs: "OrderedDict[str, SyncRun]" = OrderedDict()
+        self._history_size = history_size
+        self._scheduler: Optional[asyncio.Task] = None
+        # Strong references to running syncs; the event loop only keeps weak ones
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule())
+
+    async def stop(self) -> None:
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        # Let in-flight runs finish and record their outcome
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.orchestrator.aclose()
+
+    def trigger(self, trigger: str = "manual") -> SyncRun:
+        """Start a run, or return the one already in flight"""
+        if self._current is not None and not self._current.done.is_set():
+            self._current.joined += 1
+            return self._current
+
+        run = SyncRun(trigger)
+        self._current = run
+        self._runs[run.id] = run
+        while len(self._runs) > self._history_size:
+            self._runs.popitem(last=False)
+        # Fresh context: the run outlives the request that triggered it
+        task = asyncio.create_task(self._execute(run), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return run
+
+    def get_run(self, run_id: str) -> Optional[SyncRun]:
+        return self._runs.get(run_id)
+
+    async def wait(self, run: SyncRun, timeout: Optional[float] = None) -> SyncRun:
+        try:
+            await asyncio.wait_for(run.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return run
+
+    async def get_sync_status(self, db: AsyncSession) -> Dict[str, Any]:
+        status = await self.orchestrator.get_sync_status(db)
+        if self._current is not None and not self._current.done.is_set():
+            status["running_run_id"] = self._current.id
+        return status
+
+    def is_running(self) -> bool:
+        return self._current is not None and not self._current.done.is_set()
+
+    async def reconcile(self, shop: Optional[str] = None, **options: Any) -> Dict[str, Any]:
+        """Reconcile one shop in its own session; ``shop`` may be omitted with a single store.
+
+        Raises KeyError for an unknown or ambiguous shop.
+        """
+        clients = self.orchestrator.clients
+        if shop is None:
+            if len(clients) != 1:
+                raise KeyError("shop is required when several stores are configured")
+            shop = next(iter(clients))
+        if shop not in clients:
+            raise KeyError(f"Unknown shop: {shop}")
+        async with AsyncSessionLocal() as db:
+            return await clients[shop].reconcile(db, **options)
+
+    async def _record(self, write: Callable[..., Awaitable[None]], *args: Any) -> None:
+        """Write to the sync ledger in its own short transaction; failures only log"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await write(db, *args)
         except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            logger.warning(f"Could not record sync run: {str(e)}")
+
+    async def _execute(self, run: SyncRun) -> None:
+        await self._record(crud.start_sync_run_async, run.id, run.trigger, run.started_at)
+        last_progress = time.monotonic()
+
+        async def progress(totals: Dict[str, Any]) -> None:
+            nonlocal last_progress
+            if time.monotonic() - last_progress >= SYNC_PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await self._record(crud.update_sync_run_async, run.id, _ledger_values(totals))
 
-    async def get_sync_status(self, db: Session) -> Dict[str, Any]:
-        """Get current sync status and product counts"""
         try:
-            total_products = len(crud.get_products(db))
-            low_inventory = len(crud.get_low_inventory_products(db, threshold=10))
-            
-            return {
-                "status": "success",
-                "total_products": total_products,
-                "low_inventory_count": low_inventory,
-                "last_sync": datetime.utcnow().isoformat()
-            }
+            # SQLite has a single writer, so the ledger cannot be updated
+            # while a sync transaction is open; it gets start and finish only
+            result = await self.orchestrator.sync_all(progress=None if IS_SQLITE else progress)
         except Exception as e:
-            return {
+            logger.error(f"Sync run {run.id} failed: {str(e)}")
+            result = {
                 "status": "error",
-                "error": str(e)
+                "error": str(e),
+                "timestamp": datetime.utcnow().isoformat()
             }
+        record_sync_run(result)
+        # Ledger first, so callers woken by finish() read the final row
+        await self._record(crud.update_sync_run_async, run.id, {
+            **_ledger_values(result),
+            "status": result.get("status", "error"),
+            "finished_at": datetime.utcnow(),
+            "error": result.get("error"),
+        })
+        run.finish(result)
+
+    async def _schedule(self) -> None:
+        while True:
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(delay)
+            run = self.trigger(trigger="schedule")
+            await run.done.wait()
+
+sync_service = SyncService()
 
-def get_sync_service() -> MockShopifySync:
-    """Dependency injection for mock sync service"""
-    return MockShopifySync()
+def get_sync_service() -> SyncService:
+    """Dependency injection for the app-wide sync service"""
+    return sync_service
@@ -1,27 +1,36 @@
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
+import base64
+import json
 import logging
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from . import crud
+from . import crud, models
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def calculate_inventory_metrics(db: Session) -> Dict[str, Any]:
-    """Calculate various inventory metrics"""
+    """Read inventory metrics from the incrementally maintained summary row"""
     try:
-        all_products = crud.get_products(db)
-        
-        total_items = sum(product.inventory for product in all_products)
-        low_stock_items = len(crud.get_low_inventory_products(db, threshold=10))
-        out_of_stock = len([p for p in all_products if p.inventory == 0])
+        summary = crud.get_inventory_summary(db)
+        if summary is not None:
+            values = {
+                "total_inventory": summary.total_inventory,
+                "low_stock_count": summary.low_stock_count,
+                "out_of_stock_count": summary.out_of_stock_count,
+                "product_count": summary.product_count,
+            }
+        else:
+            # No write has created the summary yet; fall back to one aggregate query
+            values = crud.aggregate_inventory(db)
         
         return {
-            "total_inventory": total_items,
-            "low_stock_count": low_stock_items,
-            "out_of_stock_count": out_of_stock,
-            "total_products": len(all_products)
+            "total_inventory": values["total_inventory"],
+            "low_stock_count": values["low_stock_count"],
+            "out_of_stock_count": values["out_of_stock_count"],
+            "total_products": values["product_count"]
         }
     except Exception as e:
         logger.error(f"Error calculating inventory metrics: {str(e)}")
@@ -33,20 +42,29 @@ def calculate_inventory_metrics(db: Session) -> Dict[str, Any]:
 def check_sync_health(db: Session) -> Dict[str, Any]:
     """Check the health of sync operations"""
     try:
-        products = crud.get_products(db)
         current_time = datetime.utcnow()
         
-        # Check for products not synced in last hour
-        stale_products = [
-            p for p in products 
-            if p.last_synced < current_time - timedelta(hours=1)
-        ]
+        # Range count and min/max are answered from the last_synced index
+        stale_count = crud.count_stale_products(db, current_time - timedelta(hours=1))
+        oldest_sync, newest_sync = db.execute(
+            select(func.min(models.Product.last_synced), func.max(models.Product.last_synced))
+        ).one()
+        summary = crud.get_inventory_summary(db)
+        total_products = summary.product_count if summary else crud.count_products(db)
+        latest_run = crud.get_latest_sync_run(db)
+        last_success = latest_run if latest_run is not None and latest_run.status == "success" \
+            else crud.get_latest_sync_run(db, status="success")
+        healthy = stale_count == 0 and (latest_run is None or latest_run.status not in ("error", "partial"))
         
         return {
-            "status": "healthy" if len(stale_products) == 0 else "warning",
-            "stale_products_count": len(stale_products),
+            "status": "healthy" if healthy else "warning",
+            "stale_products_count": stale_count,
             "last_check": current_time.isoformat(),
-            "total_products_checked": len(products)
+            "total_products_checked": total_products,
+            "oldest_sync": oldest_sync.isoformat() if oldest_sync else None,
+            "newest_sync": newest_sync.isoformat() if newest_sync else None,
+            "last_sync": last_success.finished_at.isoformat() if last_success else None,
+            "last_run": sync_run_to_dict(latest_run) if latest_run else None
         }
     except Exception as e:
         logger.error(f"Error checking sync health: {str(e)}")
@@ -56,6 +74,27 @@ def check_sync_health(db: Session) -> Dict[str, Any]:
             "timestamp": datetime.utcnow().isoformat()
         }
 
+def sync_run_to_dict(run: models.SyncRunRecord) -> Dict[str, Any]:
+    """API representation of a sync ledger row"""
+    duration = (run.finished_at - run.started_at).total_seconds() if run.finished_at else None
+    return {
+        "run_id": run.id,
+        "trigger": run.trigger,
+        "status": run.status,
+        "started_at": run.started_at.isoformat(),
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "duration_seconds": round(duration, 3) if duration is not None else None,
+        "fetched": run.fetched,
+        "created": run.created,
+        "updated": run.updated,
+        "unchanged": run.unchanged,
+        "products_per_second": round(run.fetched / duration, 1) if duration else None,
+        "phases": {"fetch": run.fetch_seconds, "diff": run.diff_seconds, "write": run.write_seconds},
+        "shops": run.shops,
+        "failed_shops": run.failed_shops,
+        "error": run.error,
+    }
+
 def format_error_response(error: Exception, context: Optional[str] = None) -> Dict[str, Any]:
     """Standardize error response format"""
     return {
@@ -67,13 +106,30 @@ def format_error_response(error: Exception, context: Optional[str] = None) -> Di
 
 def validate_inventory_threshold(value: int) -> bool:
     """Validate inventory threshold values"""
-    return 0 <= value <= 1000  # Arbitrary max value
+    return 0 <= value <= models.MAX_INVENTORY_THRESHOLD
 
-def get_product_status(inventory: int) -> str:
+def get_product_status(inventory: int, low_stock_threshold: int = 10) -> str:
     """Determine product status based on inventory level"""
     if inventory <= 0:
         return "out_of_stock"
-    elif inventory <= 10:
+    elif inventory <= low_stock_threshold:
         return "low_stock"
     else:
         return "in_stock"
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode a keyset position as an opaque, URL-safe cursor"""
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import math
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from . import crud, schemas
+from .database import IS_SQLITE, AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_FLUSH_MS = int(os.getenv("WEBHOOK_FLUSH_MS", "50"))
+WEBHOOK_FLUSH_MAX_EVENTS = int(os.getenv("WEBHOOK_FLUSH_MAX_EVENTS", "500"))
+WEBHOOK_DEDUPE_SIZE = int(os.getenv("WEBHOOK_DEDUPE_SIZE", "50000"))
+# Flush transactions allowed in flight at once; SQLite has a single writer
+WEBHOOK_DB_CONCURRENCY = int(os.getenv("WEBHOOK_DB_CONCURRENCY", "1" if IS_SQLITE else "2"))
+# Share of the queue above which new deliveries are shed with 429
+WEBHOOK_SHED_QUEUE_RATIO = float(os.getenv("WEBHOOK_SHED_QUEUE_RATIO", "0.8"))
+# Longest an accepted update may expect to wait for its flush before deliveries are shed with 503
+WEBHOOK_LATENCY_BUDGET_MS = int(os.getenv("WEBHOOK_LATENCY_BUDGET_MS", "5000"))
+# Deliveries are shed for this long after a flush fails; also the first retry delay, doubled per failure
+WEBHOOK_FAILURE_BACKOFF_S = float(os.getenv("WEBHOOK_FAILURE_BACKOFF_S", "5"))
+WEBHOOK_RETRY_MAX_S = float(os.getenv("WEBHOOK_RETRY_MAX_S", "60"))
+# Flush attempts for one batch before its updates are dropped and logged
+WEBHOOK_FLUSH_ATTEMPTS = int(os.getenv("WEBHOOK_FLUSH_ATTEMPTS", "8"))
+MAX_RETRY_AFTER_S = 60
+
+class RecentIds:
+    """Bounded LRU set of webhook delivery ids"""
+
+    def __init__(self, capacity: int = WEBHOOK_DEDUPE_SIZE):
+        self.capacity = capacity
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, webhook_id: str) -> bool:
+        """Remember an id; returns False if it was already present"""
+        if webhook_id in self._ids:
+            self._ids.move_to_end(webhook_id)
+            return False
+        self._ids[webhook_id] = None
+        if len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+        return True
+
+    def __contains__(self, webhook_id: str) -> bool:
+        return webhook_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+def _newer(candidate: schemas.WebhookInventoryUpdate, current: schemas.WebhookInventoryUpdate) -> bool:
+    """Whether candidate supersedes current; arrival order decides without versions"""
+    if candidate.updated_at is None or current.updated_at is None:
+        return True
+    return candidate.updated_at >= current.updated_at
+
+class Lane:
+    """One flusher with its own queue; a SKU always maps to the same lane so its updates stay ordered"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        # Loop time at which the in-flight flush started
+        self.flush_started: Optional[float] = None
+        # Smoothed events written per second of flush time
+        self.rate: Optional[float] = None
+        # Batch whose flush failed, written again at retry_at before anything newer
+        self.retry: Optional[List[schemas.WebhookInventoryUpdate]] = None
+        self.retry_at = 0.0
+        self.failures = 0
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so the queue binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+        return self._queue
+
+    def backlog(self) -> int:
+        return self.queue.qsize() + (len(self.retry) if self.retry is not None else 0)
+
+    def observe_flush(self, events: int, seconds: float) -> None:
+        sample = events / max(seconds, 1e-3)
+        self.rate = sample if self.rate is None else 0.8 * self.rate + 0.2 * sample
+
+    def expected_delay(self, now: float) -> float:
+        """Seconds a newly queued update would wait: the backlog at the recent rate plus any running flush"""
+        waiting = self.backlog() / self.rate if self.rate else 0.0
+        running = now - self.flush_started if self.flush_started is not None else 0.0
+        return waiting + running
+
+class WebhookBatcher:
+    """Bounded in-process queues that coalesce webhook updates per SKU.
+
+    Updates are spread over ``lanes`` queues by shop and shopify_id, and
+    each lane's flusher writes one transaction at a time, so at most
+    ``lanes`` flushes hold a database connection however fast deliveries
+    arrive. A flusher collects events for up to ``flush_interval_ms`` or
+    ``max_batch`` events and writes the batch with a single upsert.
+    Deliveries are deduplicated by webhook id before coalescing, so a
+    replayed delivery can never displace a fresh update for its SKU: the
+    route checks ids applied by recent batches, and the flush checks the
+    processed_webhooks table in the same transaction as the write. The
+    newest remaining update for each SKU is written; ids are remembered in
+    memory only once their batch commits.
+
+    Deliveries were already answered with 202, so a batch whose flush
+    fails is kept and retried with exponential backoff ahead of newer
+    updates for its lane. It is dropped, with its SKUs logged, only after
+    ``WEBHOOK_FLUSH_ATTEMPTS`` failures or a failure during shutdown.
+
+    ``check_capacity`` sheds deliveries before they are queued: 429 when
+    the queues pass ``shed_ratio`` of their size, 503 when the expected
+    wait exceeds ``latency_budget_ms`` or a flush has just failed.
+    """
+
+    def __init__(
+        self,
+        max_size: int = WEBHOOK_QUEUE_SIZE,
+        flush_interval_ms: int = WEBHOOK_FLUSH_MS,
+        max_batch: int = WEBHOOK_FLUSH_MAX_EVENTS,
+        lanes: int = WEBHOOK_DB_CONCURRENCY,
+        shed_ratio: float = WEBHOOK_SHED_QUEUE_RATIO,
+        latency_budget_ms: int = WEBHOOK_LATENCY_BUDGET_MS
+    ):
+        self.max_size = max_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.shed_ratio = shed_ratio
+        self.latency_budget = latency_budget_ms / 1000
+        self.lanes = [Lane(max(1, max_size // max(1, lanes))) for _ in range(max(1, lanes))]
+        self._closing = False
+        self._failed_at: Optional[float] = None
+        self.recent_ids = RecentIds()
+        self._counters = {
+            "received": 0,
+            "rejected": 0,
+            "shed_queue": 0,
+            "shed_latency": 0,
+            "duplicates": 0,
+            "coalesced": 0,
+            "stale": 0,
+            "applied": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "retried_batches": 0,
+            "dropped_updates": 0,
+        }
+        self._last_flush: Optional[datetime] = None
+
+    async def start(self) -> None:
+        self._closing = False
+        for lane in self.lanes:
+            if lane.task is None:
+                lane.task = asyncio.create_task(self._run(lane))
+
+    async def stop(self) -> None:
+        """Stop accepting work and flush everything already queued"""
+        self._closing = True
+        for lane in self.lanes:
+            if lane.task is not None:
+                await lane.task
+                lane.task = None
+
+    def _lane(self, update: schemas.WebhookInventoryUpdate) -> Lane:
+        return self.lanes[hash((update.shop, update.product_id)) % len(self.lanes)]
+
+    def depth(self) -> int:
+        return sum(lane.backlog() for lane in self.lanes)
+
+    def expected_delay(self) -> float:
+        now = asyncio.get_running_loop().time()
+        return max(lane.expected_delay(now) for lane in self.lanes)
+
+    def retry_after(self) -> int:
+        """Whole seconds until the queues should have drained"""
+        return min(MAX_RETRY_AFTER_S, max(1, math.ceil(self.expected_delay())))
+
+    def check_capacity(self) -> Optional[Tuple[int, int]]:
+        """``(status_code, retry_after)`` when a delivery should be shed, otherwise None"""
+        if self._closing:
+            return 503, 5
+        now = asyncio.get_running_loop().time()
+        if self._failed_at is not None and now - self._failed_at < WEBHOOK_FAILURE_BACKOFF_S:
+            self._counters["shed_latency"] += 1
+            return 503, math.ceil(WEBHOOK_FAILURE_BACKOFF_S)
+        if self.expected_delay() > self.latency_budget:
+            self._counters["shed_latency"] += 1
+            return 503, self.retry_after()
+        if self.depth() >= self.shed_ratio * self.max_size:
+            self._counters["shed_queue"] += 1
+            return 429, self.retry_after()
+        return None
+
+    def is_duplicate(self, webhook_id: Optional[str]) -> bool:
+        """Check a delivery id against recently applied ones, counting hits"""
+        if webhook_id is None or webhook_id not in self.recent_ids:
+            return False
+        self._counters["duplicates"] += 1
+        return True
+
+    def submit(self, update: schemas.WebhookInventoryUpdate) -> bool:
+        """Enqueue an update; returns False when its lane is full or the batcher is closing"""
+        if self._closing:
+            self._counters["rejected"] += 1
+            return False
+        try:
+            self._lane(update).queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            return False
+        self._counters["received"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth(),
+            "max_size": self.max_size,
+            "lanes": len(self.lanes),
+            "flushing": sum(1 for lane in self.lanes if lane.flush_started is not None),
+            "running": any(lane.task is not None and not lane.task.done() for lane in self.lanes),
+            "expected_delay_ms": round(self.expected_delay() * 1000, 1),
+            "recent_ids": len(self.recent_ids),
+            **self._counters,
+            "last_flush": self._last_flush.isoformat() if self._last_flush else None,
+        }
+
+    async def _run(self, lane: Lane) -> None:
+        loop = asyncio.get_running_loop()
+        while not (self._closing and lane.queue.empty() and lane.retry is None):
+            if lane.retry is not None:
+                # Shutdown cuts the backoff short for one last attempt
+                while not self._closing and loop.time() < lane.retry_at:
+                    await asyncio.sleep(min(self.flush_interval, lane.retry_at - loop.time()))
+                updates, lane.retry = lane.retry, None
+                self._counters["retried_batches"] += 1
+            else:
+                updates = await self._collect(lane)
+            if updates:
+                await self._flush(lane, updates)
+
+    async def _collect(self, lane: Lane) -> List[schemas.WebhookInventoryUpdate]:
+        """Gather one batch of updates in arrival order"""
+        loop = asyncio.get_running_loop()
+        try:
+            update = await asyncio.wait_for(lane.queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return []
+
+        updates = [update]
+        deadline = loop.time() + self.flush_interval
+        while len(updates) < self.max_batch:
+            try:
+                update = lane.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0 or self._closing:
+                    break
+                try:
+                    update = await asyncio.wait_for(lane.queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            updates.append(update)
+        return updates
+
+    def _apply(self, db, updates: List[schemas.WebhookInventoryUpdate]) -> Dict[str, int]:
+        # Ids already in the table were applied before, e.g. by another process or before a restart
+        fresh = crud.record_processed_webhooks(
+            db, [update.webhook_id for update in updates if update.webhook_id is not None]
+        )
+        pending: Dict[Tuple[str, str], schemas.WebhookInventoryUpdate] = {}
+        duplicates = stale = 0
+        for update in updates:
+            if update.webhook_id is not None:
+                if update.webhook_id not in fresh:
+                    duplicates += 1
+                    continue
+                # A second delivery of the same id within this batch
+                fresh.discard(update.webhook_id)
+            current = pending.get((update.shop, update.product_id))
+            if current is None or _newer(update, current):
+                pending[(update.shop, update.product_id)] = update
+            elif update.updated_at is not None:
+                # Arrived late but older than what is already batched
+                stale += 1
+        result = crud.apply_inventory_updates(db, list(pending.values()))
+        result["stale"] += stale
+        result["duplicates"] = duplicates
+        result["coalesced"] = len(updates) - duplicates - len(pending)
+        return result
+
+    async def _flush(self, lane: Lane, updates: List[schemas.WebhookInventoryUpdate]) -> None:
+        loop = asyncio.get_running_loop()
+        lane.flush_started = loop.time()
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.run_sync(self._apply, updates)
+                await db.commit()
+            for update in updates:
+                if update.webhook_id is not None:
+                    self.recent_ids.add(update.webhook_id)
+            lane.observe_flush(len(updates), loop.time() - lane.flush_started)
+            self._counters["applied"] += result["created"] + result["updated"]
+            self._counters["stale"] += result["stale"]
+            self._counters["duplicates"] += result["duplicates"]
+            self._counters["coalesced"] += result["coalesced"]
+            self._counters["batches"] += 1
+            self._last_flush = datetime.utcnow()
+            lane.failures = 0
+        except Exception as e:
+            self._counters["failed_batches"] += 1
+            self._failed_at = loop.time()
+            lane.failures += 1
+            if self._closing or lane.failures >= WEBHOOK_FLUSH_ATTEMPTS:
+                self._counters["dropped_updates"] += len(updates)
+                lane.failures = 0
+                skus = dict.fromkeys(f"{update.shop}/{update.product_id}" for update in updates)
+                logger.error(f"Dropping {len(updates)} webhook updates after {str(e)}: " + ", ".join(skus))
+            else:
+                delay = min(WEBHOOK_RETRY_MAX_S, WEBHOOK_FAILURE_BACKOFF_S * 2 ** (lane.failures - 1))
+                lane.retry = updates
+                lane.retry_at = loop.time() + delay
+                logger.error(f"Failed to flush {len(updates)} webhook updates, retrying in {delay:.1f}s: {str(e)}")
+        finally:
+            lane.flush_started = None
+
+webhook_batcher = WebhookBatcher()
@@ -1,85 +1,112 @@
-from fastapi import APIRouter, Request, Header, HTTPException, Depends
-from sqlalchemy.orm import Session
-from . import models, schemas, crud
-from .database import SessionLocal
+from fastapi import APIRouter, Request, Header, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from typing import Any, Optional
+from . import schemas, serialization
+from .shopify_client import shop_for_domain
+from .webhook_queue import webhook_batcher
+from datetime import datetime, timezone
 import hmac
-import hashlib
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Read once at import; every delivery is verified against the same key
+SHOPIFY_WEBHOOK_SECRET = os.getenv("SHOPIFY_WEBHOOK_SECRET")
+_WEBHOOK_KEY = SHOPIFY_WEBHOOK_SECRET.encode() if SHOPIFY_WEBHOOK_SECRET else None
+if _WEBHOOK_KEY is None:
+    logger.warning("SHOPIFY_WEBHOOK_SECRET is not set; webhook deliveries will be rejected")
 
 def verify_webhook_signature(body: bytes, signature: str) -> bool:
-    secret = os.getenv("SHOPIFY_WEBHOOK_SECRET")
-    digest = hmac.new(secret.encode(), body, hashlib.sha256).digest()
-    return hmac.compare_digest(signature, digest.hex())
+    if _WEBHOOK_KEY is None:
+        return False
+    # One-shot digest avoids building an HMAC object per delivery
+    return hmac.compare_digest(signature, hmac.digest(_WEBHOOK_KEY, body, "sha256").hex())
 
-@router.post("/inventory-update")
+def parse_upstream_time(value: Any) -> Optional[datetime]:
+    """ISO-8601 timestamp from Shopify as naive UTC, matching stored datetimes"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid updated_at")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@router.post("/inventory-update", status_code=202)
 async def handle_inventory_update(
     request: Request,
     x_shopify_hmac_sha256: str = Header(...),
-    db: Session = Depends(get_db)
+    x_shopify_webhook_id: Optional[str] = Header(None),
+    x_shopify_triggered_at: Optional[str] = Header(None),
+    x_shopify_shop_domain: Optional[str] = Header(None)
 ):
-    # Verify webhook signature
+    # Shed before doing any work so Shopify backs off and retries later
+    shed = webhook_batcher.check_capacity()
+    if shed is not None:
+        status_code, retry_after = shed
+        raise HTTPException(
+            status_code=status_code,
+            detail="Too many inventory updates queued" if status_code == 429 else "Inventory updates are delayed",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    # Verify webhook signature; the body is read once and parsed from the same bytes
     body = await request.body()
     if not verify_webhook_signature(body, x_shopify_hmac_sha256):
         raise HTTPException(status_code=401, detail="Invalid signature")
 
-    # Parse payload
-    payload = await request.json()
-    update = schemas.WebhookInventoryUpdate(
-        product_id=str(payload.get("id")),
-        inventory=payload.get("inventory_quantity", 0),
-        title=payload.get("title")
-    )
+    shop = shop_for_domain(x_shopify_shop_domain)
+    if shop is None:
+        raise HTTPException(status_code=400, detail="Unknown shop")
+
+    # Shopify retries until it sees a 2xx, so a repeat is acknowledged without work
+    if webhook_batcher.is_duplicate(x_shopify_webhook_id):
+        return JSONResponse(status_code=200, content={
+            "status": "duplicate",
+            "message": "Webhook already processed",
+            "webhook_id": x_shopify_webhook_id
+        })
 
     try:
-        # Check if product exists
-        existing_product = crud.get_product_by_shopify_id(db, update.product_id)
-        
-        if existing_product:
-            # Update existing product
-            updated_product = crud.update_product(
-                db,
-                existing_product.id,
-                {
-                    "inventory": update.inventory,
-                    "title": update.title if update.title else existing_product.title
-                }
-            )
-            return {
-                "status": "success",
-                "message": "Product updated",
-                "product_id": updated_product.shopify_id
-            }
-        else:
-            # Create new product
-            new_product = crud.create_product(
-                db,
-                schemas.ProductCreate(
-                    shopify_id=update.product_id,
-                    title=update.title or "Unknown Product",
-                    inventory=update.inventory,
-                    price=0.0  # Default price, should be updated via sync
-                )
-            )
-            return {
-                "status": "success",
-                "message": "Product created",
-                "product_id": new_product.shopify_id
-            }
+        payload = serialization.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Payload must be an object")
+    try:
+        update = schemas.WebhookInventoryUpdate(
+            product_id=str(payload.get("id")),
+            inventory=payload.get("inventory_quantity", 0),
+            title=payload.get("title"),
+            shop=shop,
+            updated_at=parse_upstream_time(payload.get("updated_at") or x_shopify_triggered_at),
+            webhook_id=x_shopify_webhook_id
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid payload: {e.errors()[0]['msg']}")
 
-    except Exception as e:
+    # Acknowledge now; the batcher applies coalesced updates in the background
+    if not webhook_batcher.submit(update):
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to process inventory update: {str(e)}"
+            status_code=503,
+            detail="Inventory update queue is full",
+            headers={"Retry-After": str(webhook_batcher.retry_after())}
         )
 
+    return {
+        "status": "accepted",
+        "message": "Product update queued",
+        "shop": update.shop,
+        "product_id": update.product_id
+    }
 
+@router.get("/queue")
+async def get_queue_stats():
+    """Report webhook ingestion queue depth, expected delay and flush, shed, dedupe and stale counters"""
+    return webhook_batcher.stats()
@@ -0,0 +1,296 @@
+"""Load and scale benchmarks for the sync job, webhook ingestion and read endpoints.
+
+Seeds a database with synthetic catalogs of the requested sizes and prints
+one JSON document, so runs can be saved and compared across commits::
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 > before.json
+    DATABASE_URL=postgresql://localhost/bench python benchmarks/run_benchmarks.py --sizes 100000
+
+The app is driven in-process through httpx's ASGI transport, so the numbers
+measure the application and database, not the network stack.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./bench.db"))
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated catalog sizes")
+    parser.add_argument("--webhook-requests", type=int, default=2000)
+    parser.add_argument("--webhook-concurrency", type=int, default=50)
+    parser.add_argument("--webhook-skus", type=int, default=100, help="Distinct SKUs the webhook burst targets")
+    parser.add_argument("--read-requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    return parser.parse_args()
+
+ARGS = parse_args()
+# The app reads its configuration at import time
+os.environ["DATABASE_URL"] = ARGS.database_url
+os.environ.setdefault("SHOPIFY_WEBHOOK_SECRET", "benchmark-secret")
+
+import httpx
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from app import crud, migrations, models, schemas, serialization
+from app.cache import product_cache
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from app.main import app
+from app.sync_jobs import MockShopifySync
+from app.webhook_queue import webhook_batcher
+
+class QueryCounter:
+    """Counts statements sent through the async engine"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+    def reset(self) -> int:
+        count, self.count = self.count, 0
+        return count
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def pick(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def synthetic_catalog(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": str(840_000_000_000 + i),
+            "title": f"Benchmark Product {i}",
+            "inventory_quantity": rng.randint(0, 200),
+            "price": round(rng.uniform(5, 300), 2),
+        }
+        for i in range(size)
+    ]
+
+def reset_database() -> None:
+    models.Base.metadata.drop_all(bind=engine)
+    migrations.upgrade(engine)
+
+def seed(catalog: List[Dict[str, Any]]) -> float:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        rows = [
+            {
+                "shopify_id": product["id"],
+                "title": product["title"],
+                "inventory": product["inventory_quantity"],
+                "price": product["price"],
+            }
+            for product in catalog
+        ]
+        for start in range(0, len(rows), 1000):
+            crud.bulk_upsert_products(db, rows[start:start + 1000])
+        db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+async def bench_sync(catalog: List[Dict[str, Any]], counter: QueryCounter) -> Dict[str, Any]:
+    client = MockShopifySync()
+    client.mock_products = catalog
+    results = {}
+    # fetch_products randomizes every inventory level, so the first run rewrites
+    # the catalog; the second replays the snapshot the first one wrote and
+    # measures a no-op delta sync
+    for label in ("changed", "unchanged"):
+        if label == "unchanged":
+            written = client.mock_products
+
+            async def fetch_same():
+                return written
+            client.fetch_products = fetch_same
+        counter.reset()
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            result = await client.sync_products(db)
+        if label == "unchanged" and result.get("products_unchanged") != len(catalog):
+            raise RuntimeError(f"Replayed sync was not a no-op: {result}")
+        results[label] = {
+            "wall_s": round(time.perf_counter() - started, 4),
+            "queries": counter.reset(),
+            "result": {key: value for key, value in result.items() if key != "timestamp"},
+        }
+    return results
+
+def sign(body: bytes) -> str:
+    secret = os.environ["SHOPIFY_WEBHOOK_SECRET"].encode()
+    return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+async def bench_webhooks(
+    http: httpx.AsyncClient,
+    catalog: List[Dict[str, Any]],
+    counter: QueryCounter,
+    rng: random.Random
+) -> Dict[str, Any]:
+    skus = [product["id"] for product in catalog[:ARGS.webhook_skus]]
+    bodies = [
+        json.dumps({"id": rng.choice(skus), "inventory_quantity": rng.randint(0, 200)}).encode()
+        for _ in range(ARGS.webhook_requests)
+    ]
+    semaphore = asyncio.Semaphore(ARGS.webhook_concurrency)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    async def deliver(body: bytes) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await http.post(
+                "/webhook/inventory-update",
+                content=body,
+                headers={"X-Shopify-Hmac-Sha256": sign(body), "Content-Type": "application/json"}
+            )
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    counter.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(deliver(body) for body in bodies))
+    accepted_s = time.perf_counter() - started
+    # Include the time for the batcher to apply everything that was acknowledged
+    while webhook_batcher.depth() or webhook_batcher.stats()["flushing"]:
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(webhook_batcher.flush_interval * 2)
+    applied_s = time.perf_counter() - started
+
+    return {
+        "requests": len(bodies),
+        "concurrency": ARGS.webhook_concurrency,
+        "statuses": statuses,
+        "accepted_per_s": round(len(bodies) / accepted_s, 1),
+        "applied_per_s": round(len(bodies) / applied_s, 1),
+        "queries": counter.reset(),
+        "latency": percentiles(latencies),
+    }
+
+async def bench_reads(http: httpx.AsyncClient, counter: QueryCounter) -> Dict[str, Any]:
+    endpoints = ["/products/?limit=100", "/products/low-stock?limit=100", "/metrics/inventory", "/health"]
+    results = {}
+    for path in endpoints:
+        for mode in ("cold", "warm"):
+            latencies = []
+            counter.reset()
+            for _ in range(ARGS.read_requests):
+                if mode == "cold":
+                    product_cache.invalidate()
+                started = time.perf_counter()
+                response = await http.get(path)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+            results[f"{path} [{mode}]"] = {
+                **percentiles(latencies),
+                "queries_per_request": round(counter.reset() / ARGS.read_requests, 2),
+            }
+    return results
+
+def bench_serialization(page_size: int = 1000, repeats: int = 20) -> Dict[str, Any]:
+    """Per-row cost of building a product list response: ORM + Pydantic vs column tuples + orjson"""
+    adapter = TypeAdapter(List[schemas.Product])
+
+    def orm_pydantic(db) -> bytes:
+        products = crud.get_products_after(db, limit=page_size)
+        return adapter.dump_json(adapter.validate_python(products, from_attributes=True))
+
+    def column_tuples(db) -> bytes:
+        rows = crud.get_product_rows(db, serialization.PRODUCT_COLUMNS, limit=page_size)
+        return serialization.encode_product_rows(rows)
+
+    results = {}
+    db = SessionLocal()
+    try:
+        for label, build in (("orm_pydantic", orm_pydantic), ("column_tuples", column_tuples)):
+            timings = []
+            for _ in range(repeats):
+                db.expunge_all()
+                started = time.perf_counter()
+                body = build(db)
+                timings.append(time.perf_counter() - started)
+            rows = body.count(b'"shopify_id"')
+            results[label] = {
+                "rows": rows,
+                "page_ms": round(statistics.median(timings) * 1000, 3),
+                "us_per_row": round(statistics.median(timings) / max(rows, 1) * 1e6, 3),
+            }
+    finally:
+        db.close()
+    results["speedup"] = round(
+        results["orm_pydantic"]["page_ms"] / max(results["column_tuples"]["page_ms"], 1e-9), 2
+    )
+    return results
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def main() -> Dict[str, Any]:
+    rng = random.Random(ARGS.seed)
+    counter = QueryCounter()
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "sizes": {},
+    }
+
+    await webhook_batcher.start()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for size in (int(value) for value in ARGS.sizes.split(",")):
+                reset_database()
+                catalog = synthetic_catalog(size, rng)
+                seed_s = seed(catalog)
+                report["sizes"][str(size)] = {
+                    "seed_s": round(seed_s, 4),
+                    "sync": await bench_sync(catalog, counter),
+                    "webhooks": await bench_webhooks(http, catalog, counter, rng),
+                    "reads": await bench_reads(http, counter),
+                    "serialization": bench_serialization(),
+                }
+    finally:
+        await webhook_batcher.stop()
+    return report
+
+if __name__ == "__main__":
+    report = asyncio.run(main())
+    output = json.dumps(report, indent=2)
+    if ARGS.output:
+        with open(ARGS.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,84 @@
+import hashlib
+import hmac
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+# The app reads its configuration at import time
+_DB_DIR = tempfile.mkdtemp(prefix="inventory-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ.setdefault("SHOPIFY_WEBHOOK_SECRET", "test-secret")
+os.environ.setdefault("ADMIN_API_TOKEN", "test-admin-token")
+os.environ.setdefault("SYNC_INTERVAL_SECONDS", "0")
+os.environ.setdefault("ALERT_SINKS", "log")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from app import crud, models
+from app.cache import product_cache
+from app.database import SessionLocal
+from app.main import app
+from app.webhook_queue import RecentIds, webhook_batcher
+
+WEBHOOK_SECRET = os.environ["SHOPIFY_WEBHOOK_SECRET"].encode()
+
+@pytest.fixture(scope="session")
+def client():
+    # One app lifespan for the whole run: the webhook batcher's queues bind to its event loop
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    db = SessionLocal()
+    try:
+        for model in (
+            models.InventoryEvent, models.Product, models.InventorySummary,
+            models.ProcessedWebhook, models.SyncRunRecord
+        ):
+            db.execute(delete(model))
+        db.commit()
+    finally:
+        db.close()
+    product_cache.invalidate()
+    webhook_batcher.recent_ids = RecentIds()
+    yield
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+def product_rows(count: int, start: int = 0, inventory: Callable[[int], int] = lambda i: i % 30) -> List[Dict[str, Any]]:
+    return [
+        {"shopify_id": str(1000 + i), "title": f"Product {i}", "inventory": inventory(i), "price": 10.0 + i}
+        for i in range(start, start + count)
+    ]
+
+def seed_products(count: int, **kwargs: Any) -> None:
+    db = SessionLocal()
+    try:
+        crud.bulk_upsert_products(db, product_rows(count, **kwargs))
+        db.commit()
+    finally:
+        db.close()
+
+def sign(body: bytes) -> str:
+    return hmac.new(WEBHOOK_SECRET, body, hashlib.sha256).hexdigest()
+
+def wait_until(predicate: Callable[[], Any], timeout: float = 5.0) -> Any:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.02)
+    raise AssertionError("condition not met before timeout")
@@ -0,0 +1,24 @@
+import asyncio
+import httpx
+from app.alerts import AlertEngine, WebhookSink
+from app.crud import InventoryChange
+from app.mock_shopify_server import create_app
+
+def test_webhook_sink_reuses_one_client_and_closes_it_with_the_engine():
+    mock = create_app(catalog_size=1, latency_ms=0)
+    sink = WebhookSink(url="http://mock-shop/_mock/alerts", transport=httpx.ASGITransport(app=mock))
+
+    async def scenario():
+        engine = AlertEngine(sinks=[sink], debounce_ms=0)
+        await engine.start()
+        engine.submit([InventoryChange("1", 50, 2)])
+        await asyncio.sleep(0.05)
+        client = sink._client
+        engine.submit([InventoryChange("2", 50, 0)])
+        await asyncio.sleep(0.05)
+        assert sink._client is client is not None
+        await engine.stop()
+
+    asyncio.run(scenario())
+    assert [alert["shopify_id"] for alert in mock.state.alerts] == ["1", "2"]
+    assert sink._client is None
@@ -0,0 +1,57 @@
+import asyncio
+import json
+from collections import namedtuple
+from app import crud
+from app.broadcast import DROPPED_FRAME, InventoryBroadcaster, inventory_broadcaster
+from app.database import SessionLocal
+from conftest import product_rows, seed_products
+
+Change = namedtuple("Change", ["shopify_id", "new_inventory", "old_inventory", "product_id", "low_stock_threshold", "shop"])
+
+def _event(frame: bytes):
+    lines = frame.decode().strip().split("\n")
+    return lines[0][len("event: "):], json.loads(lines[1][len("data: "):])
+
+def _commit_inventory(levels):
+    db = SessionLocal()
+    try:
+        crud.bulk_upsert_products(db, product_rows(len(levels), inventory=lambda i: levels[i]))
+        db.commit()
+    finally:
+        db.close()
+
+def test_committed_change_reaches_a_filtered_subscriber():
+    seed_products(2)
+
+    async def scenario():
+        subscriber = inventory_broadcaster.subscribe(["1001"])
+        frames = inventory_broadcaster.stream(subscriber, heartbeat=5)
+        try:
+            assert await frames.__anext__() == b"retry: 3000\n\n"
+            # Committed on a worker thread, as bulk imports are
+            await asyncio.to_thread(_commit_inventory, [4, 9])
+            frame = await asyncio.wait_for(frames.__anext__(), timeout=5)
+            return frame, subscriber.queue.qsize()
+        finally:
+            await frames.aclose()
+
+    frame, left = asyncio.run(scenario())
+    event, data = _event(frame)
+    assert event == "inventory"
+    assert (data["shopify_id"], data["previous_inventory"], data["inventory"], data["delta"]) == ("1001", 1, 9, 8)
+    # The change to 1000 was filtered out
+    assert left == 0
+
+def test_slow_subscriber_is_dropped_with_a_notice():
+    broadcaster = InventoryBroadcaster(buffer_size=2)
+
+    async def scenario():
+        slow = broadcaster.subscribe()
+        fast = broadcaster.subscribe(["b"])
+        broadcaster.publish([Change(sku, 1, 0, 1, None, "default") for sku in ("a", "b", "c")])
+        return slow, fast
+
+    slow, fast = asyncio.run(scenario())
+    assert slow.closed and slow.queue.get_nowait() == DROPPED_FRAME
+    assert not fast.closed and _event(fast.queue.get_nowait())[1]["shopify_id"] == "b"
+    assert broadcaster.stats()["dropped_subscribers"] == 1
@@ -0,0 +1,85 @@
+import io
+import json
+from app import bulk_io, crud
+
+def test_invalid_records_are_counted_and_skipped(db):
+    lines = [
+        json.dumps({"shopify_id": "1", "title": "Good", "inventory": 5, "price": 9.5}) + "\n",
+        json.dumps({"shopify_id": "2", "title": "No price", "inventory": 5}) + "\n",
+        json.dumps({"shopify_id": "3", "title": "Bad stock", "inventory": "lots", "price": 1}) + "\n",
+        json.dumps({"shopify_id": "", "title": "No id", "inventory": 1, "price": 1}) + "\n",
+        json.dumps({"shopify_id": "4", "title": "Also good", "inventory": 0, "price": 3}) + "\n",
+    ]
+    result = bulk_io.import_products(db, lines, "ndjson")
+    db.commit()
+
+    assert result["read"] == 5
+    assert result["staged"] == 2
+    assert result["rejected"] == 3
+    assert result["created"] == 2
+    assert [error["record"] for error in result["errors"]] == [2, 3, 4]
+    assert crud.get_product_by_shopify_id(db, "2") is None
+    assert crud.get_product_by_shopify_id(db, "4").inventory == 0
+
+def test_malformed_ndjson_line_is_rejected_not_fatal(db):
+    lines = [
+        json.dumps({"shopify_id": "1", "title": "Good", "inventory": 5, "price": 9.5}) + "\n",
+        '{"shopify_id": "2", "title": \n',
+        "[1, 2]\n",
+        json.dumps({"shopify_id": "3", "title": "After", "inventory": 1, "price": 2}) + "\n",
+    ]
+    result = bulk_io.import_products(db, lines, "ndjson")
+    db.commit()
+
+    assert (result["read"], result["staged"], result["rejected"]) == (4, 2, 2)
+    assert [error["record"] for error in result["errors"]] == [2, 3]
+    assert crud.get_product_by_shopify_id(db, "3").title == "After"
+
+def test_csv_import_rejects_bad_rows(db):
+    lines = io.StringIO(
+        "shopify_id,title,inventory,price\n"
+        "10,Mug,4,12.0\n"
+        "11,Lamp,,30.0\n"
+    )
+    result = bulk_io.import_products(db, lines, "csv")
+    db.commit()
+
+    assert (result["staged"], result["rejected"]) == (1, 1)
+    assert crud.get_product_by_shopify_id(db, "10").title == "Mug"
+
+def test_last_occurrence_wins_and_reimport_is_unchanged(db):
+    lines = [
+        json.dumps({"shopify_id": "1", "title": "First", "inventory": 1, "price": 1}) + "\n",
+        json.dumps({"shopify_id": "1", "title": "Second", "inventory": 2, "price": 1}) + "\n",
+    ]
+    bulk_io.import_products(db, lines, "ndjson")
+    db.commit()
+    again = bulk_io.import_products(db, lines[1:], "ndjson")
+    db.commit()
+
+    assert crud.get_product_by_shopify_id(db, "1").title == "Second"
+    assert again["unchanged"] == 1
+    assert crud.verify_inventory_summary(db)["in_sync"]
+
+def test_export_round_trips(db):
+    bulk_io.import_products(db, [
+        json.dumps({"shopify_id": str(i), "title": f"P{i}", "inventory": i, "price": 2}) + "\n" for i in range(3)
+    ], "ndjson")
+    db.commit()
+    out = io.BytesIO()
+
+    assert bulk_io.export_products(db, out, "ndjson", chunk_size=2) == 3
+    exported = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [record["shopify_id"] for record in exported] == ["0", "1", "2"]
+
+def test_import_endpoint_requires_the_admin_token(client):
+    body = json.dumps({"shopify_id": "1", "title": "Good", "inventory": 5, "price": 9.5}) + "\n"
+
+    assert client.post("/products/import", content=body).status_code == 401
+    wrong = client.post("/products/import", content=body, headers={"Authorization": "Bearer nope"})
+    assert wrong.status_code == 401
+    assert client.post("/sync/reconcile").status_code == 401
+
+    response = client.post("/products/import", content=body, headers={"Authorization": "Bearer test-admin-token"})
+    assert response.status_code == 200
+    assert response.json()["created"] == 1
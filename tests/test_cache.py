@@ -0,0 +1,27 @@
+import asyncio
+import threading
+from app.cache import ReadThroughCache
+
+def test_invalidation_from_a_worker_thread_runs_on_the_loop():
+    cache = ReadThroughCache()
+
+    async def load():
+        return "value"
+
+    async def scenario():
+        await cache.get_or_load("key", load)
+        worker = threading.Thread(target=cache.invalidate)
+        worker.start()
+        worker.join()
+        # Handed to the loop, not applied on the worker
+        assert cache.stats()["entries"] == 1
+        await asyncio.sleep(0)
+        assert cache.stats()["entries"] == 0
+        assert cache.version == 1
+
+    asyncio.run(scenario())
+
+def test_invalidation_without_a_loop_applies_at_once():
+    cache = ReadThroughCache()
+    cache.invalidate()
+    assert cache.version == 1
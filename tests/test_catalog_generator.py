@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from app import crud, models
+from app.catalog_generator import BLOCK_SIZE, SyntheticCatalog
+from app.populate_db import populate_db
+
+START = datetime(2024, 5, 1)
+
+def test_same_seed_gives_the_same_catalog_in_any_access_order():
+    first = SyntheticCatalog(3 * BLOCK_SIZE, seed=11)
+    second = SyntheticCatalog(3 * BLOCK_SIZE, seed=11)
+
+    # Random access into a later block must not depend on what was generated before
+    assert second[2 * BLOCK_SIZE + 5] == first[2 * BLOCK_SIZE + 5]
+    assert [row for batch in first.iter_rows(500) for row in batch] == [row for batch in second.iter_rows() for row in batch]
+    assert SyntheticCatalog(3 * BLOCK_SIZE, seed=12)[:50] != first[:50]
+
+def test_events_replay_identically_and_never_oversell():
+    catalog = SyntheticCatalog(500, seed=5)
+
+    def run():
+        levels = catalog.inventory_levels()
+        events = [event for batch in catalog.iter_events(2000, levels, START, START + timedelta(days=1), batch_size=300) for event in batch]
+        return events, levels
+
+    events, levels = run()
+    assert run() == (events, levels)
+    assert len(events) == 2000
+    assert all(event.inventory >= 0 for event in events)
+    assert [event.recorded_at for event in events] == sorted(event.recorded_at for event in events)
+    assert min(levels) >= 0
+
+def test_generations_churn_a_share_of_products():
+    base = SyntheticCatalog(2000, seed=3)
+    next_generation = base.advance()
+
+    changed = sum(base.spec(i) != next_generation.spec(i) for i in range(base.size))
+    assert 0 < changed < 0.1 * base.size
+    assert all(base.spec(i).title == next_generation.spec(i).title for i in range(base.size))
+    assert next_generation.advance(-1).inventory_levels() == base.inventory_levels()
+
+def _catalog_rows(db):
+    return db.execute(
+        select(models.Product.shopify_id, models.Product.title, models.Product.inventory, models.Product.price)
+        .order_by(models.Product.shopify_id)
+    ).all()
+
+def test_populate_db_is_reproducible_for_a_seed(db):
+    populate_db(products=300, events=1000, seed=42, batch_size=128)
+    first = _catalog_rows(db)
+    events = db.scalar(select(func.count()).select_from(models.InventoryEvent))
+    db.rollback()
+
+    populate_db(products=300, events=1000, seed=42, batch_size=128)
+
+    assert len(first) == 300
+    assert events == 1000
+    assert _catalog_rows(db) == first
+    assert crud.verify_inventory_summary(db)["in_sync"]
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import crud, models
+
+START = datetime(2024, 5, 1, 10, 0)
+
+def record(db, product_id: int, minutes: int, delta: int, inventory: int) -> None:
+    db.execute(insert(models.InventoryEvent).values(
+        product_id=product_id, recorded_at=START + timedelta(minutes=minutes), delta=delta, inventory=inventory
+    ))
+
+def test_history_buckets_one_product_in_time_order(db):
+    # Inserted out of order, with one event per side of the window and one for another product
+    record(db, 1, 70, -2, 5)
+    record(db, 1, 5, -3, 7)
+    record(db, 1, 20, 1, 8)
+    record(db, 1, -1, 4, 10)
+    record(db, 1, 180, 9, 14)
+    record(db, 2, 10, 6, 6)
+    db.commit()
+
+    points = crud.get_inventory_history(db, START, START + timedelta(hours=2), bucket="hour", product_id=1)
+
+    assert [point["bucket"] for point in points] == ["2024-05-01T10:00:00", "2024-05-01T11:00:00"]
+    assert [(p["events"], p["net_change"], p["min_inventory"], p["max_inventory"]) for p in points] == [
+        (2, -2, 7, 8),
+        (1, -2, 5, 5),
+    ]
+
+def test_catalog_history_counts_distinct_products(db):
+    for product_id, minutes in ((1, 1), (1, 2), (2, 3), (3, 61)):
+        record(db, product_id, minutes, 1, 1)
+    db.commit()
+
+    points = crud.get_inventory_history(db, START, START + timedelta(days=1), bucket="day")
+
+    assert [(point["bucket"], point["events"], point["products"]) for point in points] == [
+        ("2024-05-01T00:00:00", 4, 3)
+    ]
+
+def test_synced_movements_are_recorded_and_pruned_by_age(db):
+    crud.bulk_upsert_products(db, [{"shopify_id": "1", "title": "A", "inventory": 5, "price": 1.0}])
+    db.commit()
+    crud.bulk_upsert_products(db, [{"shopify_id": "1", "title": "A", "inventory": 2, "price": 1.0}])
+    db.commit()
+
+    now = datetime.utcnow()
+    points = crud.get_inventory_history(db, now - timedelta(hours=1), now + timedelta(minutes=1), bucket="minute")
+    # Creation counts as a movement from zero
+    assert sum(point["events"] for point in points) == 2
+    assert sum(point["net_change"] for point in points) == 2
+
+    assert crud.prune_inventory_events(db, now + timedelta(minutes=1), batch_size=1) == 2
+    assert crud.get_inventory_history(db, now - timedelta(hours=1), now + timedelta(minutes=1)) == []
+
+def test_history_window_is_validated(client):
+    assert client.get("/products/1/history", params={"start": "2024-05-02T00:00:00", "end": "2024-05-01T00:00:00"}).status_code == 400
+    assert client.get("/products/1/history", params={"start": "2020-01-01T00:00:00", "bucket": "minute"}).status_code == 400
+    assert client.get("/products/1/history", params={"bucket": "week"}).status_code == 422
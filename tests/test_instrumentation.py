@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, TimeoutError
+from sqlalchemy.pool import QueuePool
+from app import instrumentation
+
+def test_failed_statement_does_not_leak_start_times(monkeypatch):
+    monkeypatch.setattr(instrumentation, "registered_pools", {})
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=2, max_overflow=0)
+    instrumentation.instrument_engine(engine, "test")
+
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing_table"))
+        assert connection.info["query_started"] == []
+        assert connection.scalar(text("SELECT 1")) == 1
+
+    output = instrumentation.registry.render()
+    assert 'db_pool_checked_out{engine="test"} 0' in output
+    assert 'db_pool_overflow{engine="test"} 0' in output
+    assert 'db_pool_checkout_wait_seconds_count{engine="test"} 1' in output
+    assert 'db_pool_connection_hold_seconds_count{engine="test"} 1' in output
+
+def test_checkout_wait_covers_time_blocked_on_a_full_pool(monkeypatch):
+    monkeypatch.setattr(instrumentation, "registered_pools", {})
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2)
+    instrumentation.instrument_engine(engine, "full")
+
+    with engine.connect():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+
+    series = instrumentation.pool_wait._series[("full",)]
+    assert series[-1] >= 0.2
@@ -0,0 +1,77 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+from app import crud, migrations, models
+
+def baseline_engine(tmp_path):
+    """A database as the first release left it: shopify_id unique on its own, no shop column"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    metadata = MetaData()
+    Table(
+        "products", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("shopify_id", String, unique=True, index=True),
+        Column("title", String),
+        Column("inventory", Integer),
+        Column("previous_inventory", Integer),
+        Column("inventory_change", Integer),
+        Column("price", Float),
+        Column("last_synced", DateTime),
+    )
+    # The sync ledger as it was before multi-store sync
+    Table(
+        "sync_runs", metadata,
+        Column("id", String(32), primary_key=True),
+        *[Column(name, String(16), nullable=False) for name in ("trigger", "status")],
+        Column("started_at", DateTime, nullable=False),
+        Column("finished_at", DateTime),
+        *[Column(name, Integer, nullable=False) for name in ("fetched", "created", "updated", "unchanged")],
+        Column("error", String),
+        *[Column(name, Float, nullable=False) for name in ("fetch_seconds", "diff_seconds", "write_seconds")],
+    )
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO products (shopify_id, title, inventory, previous_inventory, inventory_change, price, last_synced) "
+            "VALUES ('1000', 'Old', 4, 4, 0, 9.5, :now)"
+        ), {"now": datetime.utcnow()})
+        connection.execute(text(
+            "INSERT INTO sync_runs (id, trigger, status, started_at, fetched, created, updated, unchanged, "
+            "fetch_seconds, diff_seconds, write_seconds) VALUES ('run', 'manual', 'success', :now, 1, 1, 0, 0, 0, 0, 0)"
+        ), {"now": datetime.utcnow()})
+    return engine
+
+def test_upgrade_brings_baseline_schema_up_to_date(tmp_path):
+    engine = baseline_engine(tmp_path)
+
+    assert migrations.upgrade(engine) == len(migrations.STEPS)
+
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("products")}
+    assert {"shop", "fingerprint", "upstream_updated_at", "low_stock_threshold"} <= columns
+    unique = [tuple(index["column_names"]) for index in inspector.get_indexes("products") if index["unique"]]
+    assert ("shopify_id",) not in unique
+    assert ("shop", "shopify_id") in unique
+    names = {index["name"] for index in inspector.get_indexes("products")}
+    assert {"ix_products_low_inventory", "ix_products_last_synced", "ix_products_shop_low_inventory"} <= names
+    assert {"shops", "failed_shops"} <= {column["name"] for column in inspector.get_columns("sync_runs")}
+
+    with Session(engine) as db:
+        assert db.scalar(select(models.Product.shop).where(models.Product.shopify_id == "1000")) == models.DEFAULT_SHOP
+        assert db.scalar(select(models.SyncRunRecord.shops)) == 0
+        # The (shop, shopify_id) conflict target works and the same id may exist in another shop
+        crud.bulk_upsert_products(db, [{"shopify_id": "1000", "title": "Old", "inventory": 6, "price": 9.5}])
+        crud.bulk_upsert_products(db, [{"shopify_id": "1000", "title": "Other", "inventory": 1, "price": 2.0}], shop="eu")
+        db.commit()
+        assert db.scalar(select(models.Product.inventory).where(models.Product.shop == models.DEFAULT_SHOP)) == 6
+        assert crud.count_products(db) == 2
+
+def test_upgrade_is_a_no_op_once_applied(tmp_path):
+    engine = baseline_engine(tmp_path)
+    migrations.upgrade(engine)
+    indexes = sorted(index["name"] for index in inspect(engine).get_indexes("products"))
+
+    assert migrations.upgrade(engine) == len(migrations.STEPS)
+    assert sorted(index["name"] for index in inspect(engine).get_indexes("products")) == indexes
+    with engine.connect() as connection:
+        assert connection.scalar(select(models.SchemaVersion.version)) == len(migrations.STEPS)
@@ -0,0 +1,143 @@
+import json
+from datetime import datetime
+from sqlalchemy import text, update
+from app import crud, database, models, schemas, serialization
+from app.cache import product_cache
+from app.database import engine, reads_from_primary
+from conftest import seed_products
+
+def _walk(client, path: str, limit: int):
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": limit}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get(path, params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return pages
+
+def test_keyset_pages_cover_catalog_once(client):
+    seed_products(25)
+    pages = _walk(client, "/products/", limit=10)
+
+    ids = [product["id"] for page in pages for product in page]
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 25
+
+def test_keyset_page_ends_on_exact_multiple(client):
+    seed_products(20)
+    pages = _walk(client, "/products/", limit=10)
+
+    # A full last page still advertises a cursor; the page after it is empty
+    assert [len(page) for page in pages] == [10, 10, 0]
+
+def test_low_stock_pages_follow_inventory_then_id(client):
+    seed_products(40, inventory=lambda i: i % 8)
+    pages = _walk(client, "/products/low-stock", limit=7)
+
+    rows = [(product["inventory"], product["id"]) for page in pages for product in page]
+    assert rows == sorted(rows)
+    assert len(rows) == 40
+    assert all(inventory <= 10 for inventory, _ in rows)
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/products/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/products/low-stock", params={"cursor": "e30"}).status_code == 400
+
+def test_offset_paging_still_supported(client):
+    seed_products(5)
+    first = client.get("/products/", params={"limit": 2}).json()
+    skipped = client.get("/products/", params={"skip": 2, "limit": 2}).json()
+
+    assert [product["shopify_id"] for product in first] == ["1000", "1001"]
+    assert [product["shopify_id"] for product in skipped] == ["1002", "1003"]
+
+def test_etag_revalidates_against_current_data(client, monkeypatch):
+    # Entries expire at once, as they do everywhere after the TTL
+    monkeypatch.setattr(product_cache, "ttl_seconds", 0)
+    seed_products(3)
+    etag = client.get("/products/").headers["etag"]
+
+    assert client.get("/products/", headers={"If-None-Match": etag}).status_code == 304
+
+    # A write by another process: no session hooks, so this process's cache isn't invalidated
+    with engine.begin() as connection:
+        connection.execute(update(models.Product).where(models.Product.shopify_id == "1000").values(inventory=99))
+
+    response = client.get("/products/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()[0]["inventory"] == 99
+
+def test_only_the_writing_request_is_told_to_read_from_the_primary(client):
+    seed_products(1)
+    product_id = client.get("/products/").json()[0]["id"]
+
+    write = client.put(f"/products/{product_id}/low-stock-threshold", json={"low_stock_threshold": 3})
+    assert write.status_code == 200
+    until = write.headers["x-read-your-writes"]
+    assert reads_from_primary(until)
+
+    # Reads that committed nothing, e.g. while webhook flushes commit in the background, stay on the replica
+    assert "x-read-your-writes" not in client.get("/products/").headers
+
+def test_page_size_is_bounded(client):
+    assert client.get("/products/", params={"limit": 1001}).status_code == 422
+    assert client.get("/products/", params={"limit": 0}).status_code == 422
+    assert client.get("/products/", params={"limit": 1000}).status_code == 200
+
+def test_reads_pinned_to_the_primary_skip_the_shared_cache(client, monkeypatch):
+    # Any non-None value counts as a configured replica
+    monkeypatch.setattr(database, "async_replica_engine", object())
+    seed_products(1)
+    assert client.get("/products/").json()[0]["inventory"] == 0
+
+    # Stands in for an entry a lagging replica refilled after the write's invalidation
+    with engine.begin() as connection:
+        connection.execute(update(models.Product).where(models.Product.shopify_id == "1000").values(inventory=7))
+
+    assert client.get("/products/").json()[0]["inventory"] == 0
+    pinned = client.get("/products/", headers={"X-Read-Your-Writes": "1"})
+    assert pinned.json()[0]["inventory"] == 7
+
+def test_read_your_writes_header_values():
+    assert not reads_from_primary(None)
+    assert reads_from_primary("1")
+    assert not reads_from_primary("until=1.0")
+
+def _uses_index(plan, index: str) -> bool:
+    return any(index in line and ("USING" in line or "Index" in line) for line in plan)
+
+def test_read_queries_use_their_indexes(db):
+    seed_products(50)
+    if db.get_bind().dialect.name == "postgresql":
+        # A small table would be scanned anyway; check the index can serve the query
+        db.execute(text("SET LOCAL enable_seqscan = off"))
+
+    low_stock = crud.explain(db, crud.low_inventory_query(threshold=10, limit=100))
+    next_page = crud.explain(db, crud.low_inventory_query(threshold=10, limit=100, after=(0, 0)))
+    stale = crud.explain(db, crud.stale_products_query(datetime.utcnow()))
+
+    assert _uses_index(low_stock, "ix_products_low_inventory"), low_stock
+    assert _uses_index(next_page, "ix_products_low_inventory"), next_page
+    assert _uses_index(stale, "ix_products_last_synced"), stale
+
+def test_fast_serialization_matches_the_response_schema(db):
+    seed_products(3)
+    with engine.begin() as connection:
+        connection.execute(
+            update(models.Product).where(models.Product.shopify_id == "1001")
+            .values(price=None, inventory=None, title=None, previous_inventory=None, inventory_change=None)
+        )
+
+    rows = crud.get_product_rows(db, serialization.PRODUCT_COLUMNS, limit=10)
+    products = crud.get_products_after(db, limit=10)
+
+    assert json.loads(serialization.encode_product_rows(rows)) == [
+        schemas.Product.model_validate(product).model_dump(mode="json") for product in products
+    ]
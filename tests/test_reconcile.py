@@ -0,0 +1,101 @@
+import asyncio
+from collections import namedtuple
+from app import crud, reconcile, schemas
+from app.catalog_generator import SyntheticCatalog
+from app.database import AsyncSessionLocal, SessionLocal
+from app.sync_jobs import MockShopifySync
+
+Row = namedtuple("Row", ["id", "shopify_id", "title", "inventory", "price"])
+
+def _row(shopify_id: str, inventory: int = 1, title: str = "T", price: float = 1.0, id: int = 0) -> Row:
+    return Row(id, shopify_id, title, inventory, price)
+
+def test_merge_diff_classifies_every_key():
+    upstream = [_row("a"), _row("b", inventory=5), _row("d")]
+    existing = [_row("b", inventory=4, id=2), _row("c", id=3), _row("d", id=4)]
+
+    actions = [(action, (db or up).shopify_id) for action, db, up in reconcile.merge_diff(iter(upstream), iter(existing))]
+
+    assert actions == [("added", "a"), ("changed", "b"), ("removed", "c"), ("unchanged", "d")]
+
+def test_merge_diff_handles_empty_sides():
+    assert [a for a, _, _ in reconcile.merge_diff(iter([]), iter([_row("x")]))] == ["removed"]
+    assert [a for a, _, _ in reconcile.merge_diff(iter([_row("x")]), iter([]))] == ["added"]
+    assert list(reconcile.merge_diff(iter([]), iter([]))) == []
+
+def test_last_staged_occurrence_wins():
+    rows = [_row("a", inventory=1), _row("a", inventory=2), _row("b", inventory=3)]
+    assert [row.inventory for row in reconcile._last_per_id(iter(rows))] == [2, 3]
+
+def test_field_changes_reports_from_and_to():
+    changes = reconcile.field_changes(_row("a", inventory=1, price=2.0), _row("a", inventory=3, price=2.0))
+    assert changes == {"inventory": {"from": 1, "to": 3}}
+
+async def _reconcile(client: MockShopifySync, **options):
+    async with AsyncSessionLocal() as db:
+        return await client.reconcile(db, **options)
+
+async def _sync(client: MockShopifySync):
+    async with AsyncSessionLocal() as db:
+        return await client.sync_products(db)
+
+def test_dry_run_predicts_next_sync_and_writes_nothing():
+    client = MockShopifySync(catalog=SyntheticCatalog(500, seed=7), chunk_size=100)
+    assert asyncio.run(_sync(client))["products_created"] == 500
+
+    db = SessionLocal()
+    try:
+        removed = crud.get_product_by_shopify_id(db, client.catalog.shopify_id(3))
+        crud.delete_product(db, removed.id)
+        crud.create_product(db, schemas.ProductCreate(shopify_id="extra", title="Extra", inventory=1, price=1.0))
+    finally:
+        db.close()
+
+    preview = asyncio.run(_reconcile(client, sample_size=5))
+    assert preview["status"] == "success"
+    assert preview["dry_run"] is True
+    assert (preview["added"], preview["removed"]) == (1, 1)
+    assert len(preview["sample"]) == 5
+    # A dry run leaves the catalog untouched
+    assert asyncio.run(_reconcile(client))["changed"] == preview["changed"]
+
+    result = asyncio.run(_sync(client))
+    assert result["products_created"] == preview["added"]
+    assert result["products_updated"] == preview["changed"]
+
+def test_apply_limited_to_selected_ids():
+    client = MockShopifySync(catalog=SyntheticCatalog(50, seed=2))
+    records = []
+    preview = asyncio.run(_reconcile(client, on_record=records.append))
+    assert preview["added"] == 50
+
+    chosen = {record["shopify_id"] for record in records[:3]}
+    applied = asyncio.run(_reconcile(client, apply={"added"}, ids=chosen))
+
+    assert applied["applied"] == {"created": 3, "updated": 0, "deleted": 0}
+    db = SessionLocal()
+    try:
+        assert crud.count_products(db) == 3
+        assert crud.verify_inventory_summary(db)["in_sync"]
+    finally:
+        db.close()
+    assert asyncio.run(_reconcile(client))["added"] == 47
+
+def test_dry_run_of_the_random_mock_shows_what_the_next_sync_writes():
+    client = MockShopifySync(chunk_size=7)
+    asyncio.run(_sync(client))
+    records = []
+    asyncio.run(_reconcile(client, on_record=records.append))
+    expected = {
+        record["shopify_id"]: record["changes"]["inventory"]["to"]
+        for record in records if "inventory" in record.get("changes", {})
+    }
+    assert expected
+
+    asyncio.run(_sync(client))
+    db = SessionLocal()
+    try:
+        stored = {product.shopify_id: product.inventory for product in crud.get_products(db)}
+    finally:
+        db.close()
+    assert {shopify_id: stored[shopify_id] for shopify_id in expected} == expected
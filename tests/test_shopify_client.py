@@ -0,0 +1,39 @@
+import asyncio
+from datetime import datetime
+import httpx
+from app.mock_shopify_server import create_app
+from app.shopify_client import ShopifyFetcher, TokenBucket, created_at_partitions
+
+def test_partitions_are_open_ended_and_contiguous():
+    partitions = created_at_partitions(datetime(2024, 1, 1), datetime(2024, 1, 5), 4)
+
+    assert partitions[0] == {"created_at_max": "2024-01-02T00:00:00"}
+    assert partitions[1] == {"created_at_min": "2024-01-02T00:00:00", "created_at_max": "2024-01-03T00:00:00"}
+    assert partitions[-1] == {"created_at_min": "2024-01-04T00:00:00"}
+
+async def _fetch(partition_count: int):
+    fetcher = ShopifyFetcher(
+        shop_url="http://mock-shop",
+        page_size=50,
+        partition_count=partition_count,
+        bucket=TokenBucket(rate=1000, capacity=1000),
+        transport=httpx.ASGITransport(app=create_app(catalog_size=300, latency_ms=0, bucket_size=1000))
+    )
+    try:
+        ids = [product["id"] async for page in fetcher.iter_pages() for product in page]
+    finally:
+        await fetcher.aclose()
+    return ids, fetcher.stats
+
+def test_default_fetch_walks_created_at_partitions():
+    ids, stats = asyncio.run(_fetch(4))
+
+    assert len(ids) == len(set(ids)) == 300
+    # One lookup of the oldest product, then at least one page per window
+    assert stats["requests"] >= 5
+
+def test_single_partition_is_one_walk():
+    ids, stats = asyncio.run(_fetch(1))
+
+    assert len(set(ids)) == 300
+    assert stats["requests"] == 6
@@ -0,0 +1,93 @@
+from sqlalchemy import func, select
+from app import crud, models, schemas
+from conftest import product_rows, seed_products, wait_until
+from test_webhooks import deliver, stored_inventory
+
+def assert_in_sync(db):
+    report = crud.verify_inventory_summary(db)
+    assert report["in_sync"], report["drift"]
+    return report
+
+def test_bulk_upserts_keep_summary_in_sync(db):
+    crud.bulk_upsert_products(db, product_rows(30))
+    db.commit()
+    report = assert_in_sync(db)
+    assert report["stored"]["product_count"] == 30
+
+    # Re-sync with some levels changed, some unchanged and some new products
+    crud.bulk_upsert_products(db, product_rows(40, inventory=lambda i: (i * 7) % 25))
+    db.commit()
+    assert_in_sync(db)
+
+def test_single_row_writes_keep_summary_in_sync(db):
+    seed_products(5)
+    product = crud.create_product(db, schemas.ProductCreate(shopify_id="x", title="X", inventory=0, price=1.0))
+    crud.update_product(db, product.id, {"inventory": 12})
+    crud.delete_product(db, crud.get_product_by_shopify_id(db, "1001").id)
+
+    report = assert_in_sync(db)
+    assert report["stored"]["product_count"] == 5
+
+def test_deletes_keep_summary_in_sync(db):
+    seed_products(10)
+    assert crud.delete_products(db, ["1002", "1003", "missing"]) == 2
+    db.commit()
+
+    assert assert_in_sync(db)["stored"]["product_count"] == 8
+
+def test_webhook_updates_keep_summary_in_sync(client, db):
+    seed_products(3)
+    for i, inventory in enumerate((0, 50, 3)):
+        assert deliver(client, {"id": str(1000 + i), "inventory_quantity": inventory}).status_code == 202
+    assert deliver(client, {"id": "new", "inventory_quantity": 4}).status_code == 202
+    wait_until(lambda: [stored_inventory(shopify_id) for shopify_id in ("1000", "1001", "1002", "new")] == [0, 50, 3, 4])
+
+    assert_in_sync(db)
+
+def test_verify_reports_drift_and_rebuild_fixes_it(db):
+    seed_products(4)
+    summary = crud.get_inventory_summary(db)
+    summary.total_inventory += 5
+    db.commit()
+
+    report = crud.verify_inventory_summary(db)
+    assert not report["in_sync"]
+    assert report["drift"]["total_inventory"] == 5
+
+    crud.rebuild_inventory_summary(db)
+    db.commit()
+    assert_in_sync(db)
+
+def test_history_covers_every_product_created_in_one_transaction(db):
+    for start in range(0, 3000, 1000):
+        crud.bulk_upsert_products(db, product_rows(1000, start=start))
+    db.commit()
+
+    moved = sum(1 for i in range(3000) if i % 30)
+    assert db.scalar(select(func.count()).select_from(models.InventoryEvent)) == moved
+    assert_in_sync(db)
+
+def test_product_id_lookup_is_chunked(db, monkeypatch):
+    monkeypatch.setattr(crud, "RESOLVE_CHUNK_SIZE", 7)
+    seed_products(20)
+
+    resolved = crud._resolve_product_ids(db, [crud.InventoryChange(str(1000 + i), None, 1) for i in range(20)])
+
+    ids = {product.shopify_id: product.id for product in crud.get_products(db)}
+    assert [change.product_id for change in resolved] == [ids[str(1000 + i)] for i in range(20)]
+
+def test_history_is_written_per_chunk_and_publication_is_bounded(db, monkeypatch):
+    monkeypatch.setattr(crud, "INVENTORY_PUBLISH_LIMIT", 50)
+    seed_products(200, inventory=lambda i: 50)
+
+    # The first 20 cross into low stock; the rest only move within in-stock
+    crud.bulk_upsert_products(db, product_rows(200, inventory=lambda i: 5 if i < 20 else 60))
+
+    assert db.scalar(select(func.count()).select_from(models.InventoryEvent)) == 400
+    held = db.info["moved_changes"]
+    assert len(held) <= 70
+    assert db.info["unpublished_changes"] == 200 - 50
+    assert {str(1000 + i) for i in range(20)} <= {change.shopify_id for change in held}
+    db.commit()
+    assert "moved_changes" not in db.info
+    assert_in_sync(db)
@@ -0,0 +1,49 @@
+import asyncio
+from app import crud
+from app.catalog_generator import SyntheticCatalog
+from app.database import AsyncSessionLocal
+from app.sync_jobs import MockShopifySync, SyncService
+from conftest import seed_products
+
+def test_triggered_runs_are_held_until_they_finish():
+    async def scenario():
+        service = SyncService(MockShopifySync(catalog=SyntheticCatalog(50, seed=1)), interval=0)
+        run = service.trigger()
+        assert service.trigger() is run
+        assert len(service._tasks) == 1
+
+        await service.stop()
+        return service, run
+
+    service, run = asyncio.run(scenario())
+    assert run.done.is_set()
+    assert run.result["status"] == "success"
+    assert not service._tasks
+
+async def _sync(client: MockShopifySync):
+    async with AsyncSessionLocal() as db:
+        return await client.sync_products(db)
+
+def test_bulk_sync_writes_every_page(db):
+    client = MockShopifySync(catalog=SyntheticCatalog(120, seed=3), chunk_size=50)
+    result = asyncio.run(_sync(client))
+
+    assert result["status"] == "success"
+    assert (result["products_fetched"], result["products_created"]) == (120, 120)
+    assert crud.count_products(db) == 120
+    assert crud.verify_inventory_summary(db)["in_sync"]
+
+def test_per_row_sync_is_chosen_up_front_without_upsert_support(db, monkeypatch):
+    seed_products(1)
+    monkeypatch.setattr(crud, "UPSERT_INSERTS", {})
+
+    def no_bulk(*args):
+        raise AssertionError("bulk path used")
+
+    client = MockShopifySync(catalog=SyntheticCatalog(20, seed=4), chunk_size=8)
+    monkeypatch.setattr(client, "_bulk_sync", no_bulk)
+    result = asyncio.run(_sync(client))
+
+    assert result["status"] == "success", result
+    assert result["products_created"] == 20
+    assert crud.count_products(db) == 21
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+from app import crud
+from app.catalog_generator import SyntheticCatalog
+from app.database import SessionLocal
+from app.sync_jobs import MockShopifySync, SyncService
+
+class FailingSync(MockShopifySync):
+    async def iter_product_pages(self):
+        raise RuntimeError("upstream unavailable")
+        yield
+
+def _run(client: MockShopifySync):
+    async def scenario():
+        service = SyncService(client, interval=0)
+        run = service.trigger("manual")
+        await service.stop()
+        return run
+
+    run = asyncio.run(scenario())
+    db = SessionLocal()
+    try:
+        return run, crud.get_sync_run(db, run.id)
+    finally:
+        db.close()
+
+def test_finished_run_is_written_to_the_ledger():
+    run, record = _run(MockShopifySync(catalog=SyntheticCatalog(40, seed=1), chunk_size=16))
+
+    assert (record.trigger, record.status) == ("manual", "success")
+    assert (record.fetched, record.created, record.updated) == (40, 40, 0)
+    assert record.started_at == run.started_at
+    assert record.finished_at >= record.started_at
+    assert record.write_seconds > 0
+    assert record.error is None
+
+def test_failed_run_records_its_error():
+    _, record = _run(FailingSync(catalog=SyntheticCatalog(10, seed=1)))
+
+    assert record.status == "error"
+    assert "upstream unavailable" in record.error
+    assert record.finished_at is not None
+
+def test_runs_page_newest_first_without_gaps(client, db):
+    start = datetime(2024, 5, 1)
+    # Two runs share a start time, so the page boundary has to break the tie on id
+    for run_id, minutes in (("a", 0), ("b", 1), ("c", 2), ("d", 2), ("e", 3)):
+        crud.start_sync_run(db, run_id, "schedule", start + timedelta(minutes=minutes))
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/sync/runs", params=params)
+        assert response.status_code == 200
+        seen.extend(run["run_id"] for run in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+
+    assert seen == ["e", "d", "c", "b", "a"]
+    assert client.get("/sync/runs", params={"cursor": "nope"}).status_code == 400
+
+def test_ledger_backs_run_lookup_and_health(client, db):
+    started = datetime.utcnow() - timedelta(minutes=5)
+    crud.start_sync_run(db, "old-ok", "schedule", started)
+    crud.update_sync_run(db, "old-ok", {"status": "success", "finished_at": started + timedelta(seconds=30)})
+    crud.start_sync_run(db, "new-bad", "schedule", started + timedelta(minutes=1))
+    crud.update_sync_run(db, "new-bad", {"status": "error", "finished_at": started + timedelta(minutes=2), "error": "boom"})
+
+    # Runs from before a restart are only in the ledger
+    assert client.get("/sync/runs/old-ok").json()["status"] == "success"
+    assert client.get("/sync/runs/missing").status_code == 404
+
+    health = client.get("/health").json()
+    assert health["last_sync"] == (started + timedelta(seconds=30)).isoformat()
+    assert health["last_run"]["run_id"] == "new-bad"
+    assert health["status"] == "warning"
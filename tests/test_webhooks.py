@@ -0,0 +1,161 @@
+import json
+from app import crud, schemas, webhook_queue
+from app.database import SessionLocal
+from app.webhook_queue import RecentIds, webhook_batcher
+from conftest import seed_products, sign, wait_until
+
+def deliver(client, payload, webhook_id=None, body=None, signature=None):
+    body = body if body is not None else json.dumps(payload).encode()
+    headers = {"X-Shopify-Hmac-Sha256": signature or sign(body), "Content-Type": "application/json"}
+    if webhook_id is not None:
+        headers["X-Shopify-Webhook-Id"] = webhook_id
+    return client.post("/webhook/inventory-update", content=body, headers=headers)
+
+def queue_stats(client):
+    return client.get("/webhook/queue").json()
+
+def stored_inventory(shopify_id: str):
+    db = SessionLocal()
+    try:
+        product = crud.get_product_by_shopify_id(db, shopify_id)
+        return product.inventory if product else None
+    finally:
+        db.close()
+
+def test_update_is_accepted_then_applied(client):
+    seed_products(1)
+    response = deliver(client, {"id": "1000", "inventory_quantity": 42}, webhook_id="wh-1")
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "accepted"
+    wait_until(lambda: stored_inventory("1000") == 42)
+
+def test_unknown_product_is_created(client):
+    assert deliver(client, {"id": "555", "inventory_quantity": 3, "title": "New"}).status_code == 202
+    wait_until(lambda: stored_inventory("555") == 3)
+
+def test_duplicate_delivery_is_acknowledged_without_work(client):
+    seed_products(1)
+    assert deliver(client, {"id": "1000", "inventory_quantity": 7}, webhook_id="wh-dup").status_code == 202
+    wait_until(lambda: stored_inventory("1000") == 7)
+
+    applied = queue_stats(client)["applied"]
+    response = deliver(client, {"id": "1000", "inventory_quantity": 99}, webhook_id="wh-dup")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "duplicate"
+    assert stored_inventory("1000") == 7
+    assert queue_stats(client)["applied"] == applied
+
+def test_duplicate_is_caught_by_the_table_after_memory_is_lost(client):
+    seed_products(1)
+    assert deliver(client, {"id": "1000", "inventory_quantity": 8}, webhook_id="wh-restart").status_code == 202
+    wait_until(lambda: stored_inventory("1000") == 8)
+
+    # As after a restart: the in-memory id set is empty but processed_webhooks remembers
+    webhook_batcher.recent_ids = RecentIds()
+    duplicates = queue_stats(client)["duplicates"]
+    assert deliver(client, {"id": "1000", "inventory_quantity": 1}, webhook_id="wh-restart").status_code == 202
+    wait_until(lambda: queue_stats(client)["duplicates"] > duplicates)
+    assert stored_inventory("1000") == 8
+
+def test_invalid_json_is_rejected(client):
+    assert deliver(client, None, body=b"{not json").status_code == 400
+
+def test_non_object_payload_is_rejected(client):
+    assert deliver(client, None, body=b"[1, 2, 3]").status_code == 400
+
+def test_invalid_field_is_rejected(client):
+    assert deliver(client, {"id": "1000", "inventory_quantity": "many"}).status_code == 400
+
+def test_invalid_updated_at_is_rejected(client):
+    assert deliver(client, {"id": "1000", "inventory_quantity": 1, "updated_at": "yesterday"}).status_code == 400
+
+def test_bad_signature_is_rejected(client):
+    response = deliver(client, {"id": "1000", "inventory_quantity": 1}, signature="0" * 64)
+    assert response.status_code == 401
+
+def test_older_version_does_not_overwrite_newer(client):
+    seed_products(1)
+    newer = {"id": "1000", "inventory_quantity": 20, "updated_at": "2024-05-01T12:00:00Z"}
+    older = {"id": "1000", "inventory_quantity": 5, "updated_at": "2024-05-01T11:00:00Z"}
+    assert deliver(client, newer, webhook_id="wh-new").status_code == 202
+    wait_until(lambda: stored_inventory("1000") == 20)
+
+    stale = queue_stats(client)["stale"]
+    assert deliver(client, older, webhook_id="wh-old").status_code == 202
+    wait_until(lambda: queue_stats(client)["stale"] > stale)
+    assert stored_inventory("1000") == 20
+
+def test_update_records_the_replaced_level(client):
+    seed_products(1, inventory=lambda i: 9)
+    assert deliver(client, {"id": "1000", "inventory_quantity": 4}).status_code == 202
+    wait_until(lambda: stored_inventory("1000") == 4)
+
+    db = SessionLocal()
+    try:
+        product = crud.get_product_by_shopify_id(db, "1000")
+        assert (product.previous_inventory, product.inventory_change) == (9, -5)
+    finally:
+        db.close()
+
+def test_failed_flush_is_retried_not_dropped(client, monkeypatch):
+    seed_products(1)
+    apply_updates = crud.apply_inventory_updates
+    calls = []
+
+    def flaky(db, updates):
+        calls.append(len(updates))
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return apply_updates(db, updates)
+
+    monkeypatch.setattr(crud, "apply_inventory_updates", flaky)
+    monkeypatch.setattr(webhook_queue, "WEBHOOK_FAILURE_BACKOFF_S", 0.05)
+    # Restored on teardown so later deliveries aren't shed for the failure
+    monkeypatch.setattr(webhook_batcher, "_failed_at", None)
+    before = queue_stats(client)
+
+    assert deliver(client, {"id": "1000", "inventory_quantity": 42}, webhook_id="wh-retry").status_code == 202
+    wait_until(lambda: stored_inventory("1000") == 42)
+
+    after = queue_stats(client)
+    assert after["failed_batches"] == before["failed_batches"] + 1
+    assert after["retried_batches"] == before["retried_batches"] + 1
+    assert after["dropped_updates"] == before["dropped_updates"]
+
+def test_replayed_delivery_does_not_displace_a_fresh_update_in_its_batch(db):
+    seed_products(1)
+    crud.record_processed_webhooks(db, ["wh-applied"])
+    db.commit()
+    batch = [
+        schemas.WebhookInventoryUpdate(product_id="1000", inventory=11, webhook_id="wh-fresh"),
+        schemas.WebhookInventoryUpdate(product_id="1000", inventory=3, webhook_id="wh-applied"),
+        schemas.WebhookInventoryUpdate(product_id="1000", inventory=4, webhook_id="wh-fresh"),
+    ]
+
+    result = webhook_batcher._apply(db, batch)
+    db.commit()
+
+    assert (result["updated"], result["duplicates"]) == (1, 2)
+    assert stored_inventory("1000") == 11
+
+def test_ids_are_remembered_only_once_their_batch_commits(client, monkeypatch):
+    seed_products(1)
+
+    def failing(db, updates):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(crud, "apply_inventory_updates", failing)
+    monkeypatch.setattr(webhook_queue, "WEBHOOK_FLUSH_ATTEMPTS", 1)
+    monkeypatch.setattr(webhook_batcher, "_failed_at", None)
+    dropped = queue_stats(client)["dropped_updates"]
+
+    assert deliver(client, {"id": "1000", "inventory_quantity": 5}, webhook_id="wh-lost").status_code == 202
+    wait_until(lambda: queue_stats(client)["dropped_updates"] > dropped)
+    monkeypatch.undo()
+    monkeypatch.setattr(webhook_batcher, "_failed_at", None)
+
+    # Shopify's retry of the dropped delivery is applied, not acknowledged as a duplicate
+    assert deliver(client, {"id": "1000", "inventory_quantity": 5}, webhook_id="wh-lost").status_code == 202
+    wait_until(lambda: stored_inventory("1000") == 5)